@@ -0,0 +1,183 @@
+# emp_planning_system/adaptive_grid.py
+
+import math
+import dataclasses
+
+import numpy as np
+
+import calculations
+import grid_geometry
+
+# Ngưỡng mặc định (V/m): cảnh báo và nguy hiểm
+DEFAULT_LEVELS = (10, 50)
+# Bước lưới thô ban đầu, tính theo số ô của lưới mịn (lũy thừa của 2)
+DEFAULT_BASE_STEP = 16
+# Giá trị thay cho inf (tại tâm EMP) khi nội suy
+_INTERP_CAP = 1e12
+
+
+class AdaptiveFieldResult:
+    """
+    Kết quả tính toán thích nghi.
+    - grid: lưới mịn (height, width); các nút được tính chính xác giữ nguyên giá trị,
+      phần còn lại được nội suy song tuyến tính từ 4 góc của ô lá chứa nó
+    - evaluated: mảng bool đánh dấu các nút được tính chính xác
+    - evaluations: số nút phải tính (so với height * width của lưới đều)
+    - leaf_count: số ô lá của cây tứ phân
+    """
+    def __init__(self, grid, evaluated, leaf_count):
+        self.grid = grid
+        self.evaluated = evaluated
+        self.evaluations = int(evaluated.sum())
+        self.leaf_count = leaf_count
+
+    def to_grid(self, shape=None):
+        """Trả về lưới đều để dùng với các hàm vẽ hiện có; shape=(height, width) để lấy mẫu lại."""
+        if shape is None or tuple(shape) == self.grid.shape:
+            return self.grid
+        height, width = shape
+        src_h, src_w = self.grid.shape
+        rows = np.linspace(0, src_h - 1, height)
+        cols = np.linspace(0, src_w - 1, width)
+        r0 = np.minimum(rows.astype(int), src_h - 2) if src_h > 1 else np.zeros(height, dtype=int)
+        c0 = np.minimum(cols.astype(int), src_w - 2) if src_w > 1 else np.zeros(width, dtype=int)
+        fr = (rows - r0)[:, None]
+        fc = (cols - c0)[None, :]
+        r1 = np.minimum(r0 + 1, src_h - 1)
+        c1 = np.minimum(c0 + 1, src_w - 1)
+        g = np.minimum(self.grid, _INTERP_CAP)
+        top = g[np.ix_(r0, c0)] * (1 - fc) + g[np.ix_(r0, c1)] * fc
+        bottom = g[np.ix_(r1, c0)] * (1 - fc) + g[np.ix_(r1, c1)] * fc
+        return top * (1 - fr) + bottom * fr
+
+
+def _padded_grid(grid, height, width):
+    """Mở rộng lưới mịn sang phải/lên trên để số ô chia hết cho bước lưới thô."""
+    def extend(v, n):
+        if n <= len(v):
+            return v
+        step = v[-1] - v[-2] if len(v) > 1 else 0.0
+        return np.concatenate([v, v[-1] + step * np.arange(1, n - len(v) + 1)])
+    return dataclasses.replace(grid, xs=extend(grid.xs, width), ys=extend(grid.ys, height), height=height, width=width)
+
+
+def _crossing_cells(emps, grid, user_altitude, j0, i0, size, levels):
+    """
+    Đánh dấu các ô mà đường tròn ngưỡng giải tích (khi không bị che) của một EMP đi qua.
+    Bắt được trường hợp cả 4 góc cùng lớp nhưng vùng ngưỡng nằm gọn bên trong ô.
+    """
+    x0, x1 = grid.xs[i0], grid.xs[i0 + size]
+    y0, y1 = grid.ys[j0], grid.ys[j0 + size]
+    crossing = np.zeros(len(j0), dtype=bool)
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+        near_x = np.maximum(np.maximum(x0 - emp_x, emp_x - x1), 0)
+        near_y = np.maximum(np.maximum(y0 - emp_y, emp_y - y1), 0)
+        far_x = np.maximum(np.abs(emp_x - x0), np.abs(emp_x - x1))
+        far_y = np.maximum(np.abs(emp_y - y0), np.abs(emp_y - y1))
+        near_sq = near_x ** 2 + near_y ** 2
+        far_sq = far_x ** 2 + far_y ** 2
+        dz_sq = (emp.height - user_altitude) ** 2
+        for level in levels:
+            # E = level  <=>  d^2 = 30P / level^2; trừ phần theo phương đứng
+            radius_sq = 30 * emp.power / level ** 2 - dz_sq
+            if radius_sq > 0:
+                crossing |= (near_sq <= radius_sq) & (radius_sq <= far_sq)
+    return crossing
+
+
+def calculate_emp_field_adaptive(emps, obstacles, user_altitude, bounds, grid_size=(1600, 1600),
+                                 base_step=DEFAULT_BASE_STEP, levels=DEFAULT_LEVELS, progress=None):
+    """
+    Tính trường trên lưới mịn grid_size nhưng chỉ tính chính xác ở nơi cần thiết.
+    Bắt đầu từ lưới thô (bước base_step ô), rồi chia đôi đệ quy các ô mà:
+    - giá trị ở 4 góc rơi vào các lớp khác nhau so với các ngưỡng levels, hoặc
+    - trạng thái che khuất ở 4 góc khác nhau, hoặc
+    - đường tròn ngưỡng giải tích của một EMP cắt qua ô.
+    Các ô còn lại được nội suy từ 4 góc. Trả về AdaptiveFieldResult.
+    - progress: callback tùy chọn progress(done, total), gọi sau lưới thô và sau mỗi mức chia nhỏ
+    """
+    levels = sorted(levels)
+    height, width = grid_size
+    base_step = max(1, 1 << int(math.log2(max(1, base_step))))
+    padded_h = math.ceil((height - 1) / base_step) * base_step + 1
+    padded_w = math.ceil((width - 1) / base_step) * base_step + 1
+
+    grid = _padded_grid(grid_geometry.get_grid_geometry(bounds, grid_size), padded_h, padded_w)
+    index = calculations._build_obstacle_index(obstacles, grid, emps, user_altitude)
+
+    field = np.zeros((padded_h, padded_w))
+    occluded = np.zeros((padded_h, padded_w), dtype=int)
+    evaluated = np.zeros((padded_h, padded_w), dtype=bool)
+
+    def evaluate(jj, ii):
+        todo = ~evaluated[jj, ii]
+        jj, ii = jj[todo], ii[todo]
+        if jj.size == 0:
+            return
+        # Bỏ các nút trùng lặp trước khi tính
+        flat = np.unique(jj * padded_w + ii)
+        jj, ii = flat // padded_w, flat % padded_w
+        values, counts = calculations._evaluate_points(emps, grid, index, jj, ii, user_altitude)
+        field[jj, ii] = values
+        occluded[jj, ii] = counts
+        evaluated[jj, ii] = True
+
+    # 1. Lưới thô
+    coarse_j, coarse_i = np.meshgrid(np.arange(0, padded_h, base_step), np.arange(0, padded_w, base_step), indexing='ij')
+    evaluate(coarse_j.ravel(), coarse_i.ravel())
+    n_steps = int(math.log2(base_step)) + 1
+    if progress is not None:
+        progress(1, n_steps)
+    cell_j, cell_i = np.meshgrid(np.arange(0, padded_h - 1, base_step), np.arange(0, padded_w - 1, base_step), indexing='ij')
+    cell_j, cell_i = cell_j.ravel(), cell_i.ravel()
+
+    # 2. Chia nhỏ dần các ô cần thiết, ghi lại các ô lá theo từng kích thước
+    leaves = []
+    size = base_step
+    while size > 1 and cell_j.size:
+        corners_j = [cell_j, cell_j, cell_j + size, cell_j + size]
+        corners_i = [cell_i, cell_i + size, cell_i, cell_i + size]
+        classes = np.stack([np.digitize(field[cj, ci], levels) for cj, ci in zip(corners_j, corners_i)])
+        occ = np.stack([occluded[cj, ci] for cj, ci in zip(corners_j, corners_i)])
+        refine = ((classes.min(axis=0) != classes.max(axis=0))
+                  | (occ.min(axis=0) != occ.max(axis=0))
+                  | _crossing_cells(emps, grid, user_altitude, cell_j, cell_i, size, levels))
+
+        leaves.append((cell_j[~refine], cell_i[~refine], size))
+        cell_j, cell_i = cell_j[refine], cell_i[refine]
+        half = size // 2
+        mid_j = [cell_j + half, cell_j, cell_j + half, cell_j + size, cell_j + half]
+        mid_i = [cell_i, cell_i + half, cell_i + half, cell_i + half, cell_i + size]
+        evaluate(np.concatenate(mid_j), np.concatenate(mid_i))
+
+        cell_j = np.concatenate([cell_j, cell_j, cell_j + half, cell_j + half])
+        cell_i = np.concatenate([cell_i, cell_i + half, cell_i, cell_i + half])
+        size = half
+        if progress is not None:
+            progress(n_steps - int(math.log2(size)), n_steps)
+
+    # 3. Nội suy song tuyến tính bên trong các ô lá chưa được tính chính xác
+    leaf_count = cell_j.size
+    capped = np.minimum(field, _INTERP_CAP)
+    for leaf_j, leaf_i, leaf_size in leaves:
+        leaf_count += leaf_j.size
+        if leaf_j.size == 0:
+            continue
+        t = np.arange(leaf_size + 1) / leaf_size
+        v = t[None, :, None]
+        u = t[None, None, :]
+        c00 = capped[leaf_j, leaf_i][:, None, None]
+        c01 = capped[leaf_j, leaf_i + leaf_size][:, None, None]
+        c10 = capped[leaf_j + leaf_size, leaf_i][:, None, None]
+        c11 = capped[leaf_j + leaf_size, leaf_i + leaf_size][:, None, None]
+        interp = (c00 * (1 - v) * (1 - u) + c01 * (1 - v) * u + c10 * v * (1 - u) + c11 * v * u)
+        rows = leaf_j[:, None, None] + np.arange(leaf_size + 1)[None, :, None]
+        cols = leaf_i[:, None, None] + np.arange(leaf_size + 1)[None, None, :]
+        rows, cols = np.broadcast_to(rows, interp.shape), np.broadcast_to(cols, interp.shape)
+        fill = ~evaluated[rows, cols]
+        field[rows[fill], cols[fill]] = interp[fill]
+
+    return AdaptiveFieldResult(field[:height, :width], evaluated[:height, :width], leaf_count)
@@ -0,0 +1,137 @@
+# emp_planning_system/backend_harness.py
+
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+import calculations
+from data_models import EMP, Obstacle
+
+# Vùng bản đồ mặc định của các cảnh ngẫu nhiên (~1 km x 1 km)
+DEFAULT_BOUNDS = {'lat_min': 21.020, 'lat_max': 21.030, 'lon_min': 105.850, 'lon_max': 105.860}
+EMP_POWERS = [1000, 5000, 20000, 200000]
+
+
+def random_scene(rnd, n_emps, n_obstacles, bounds=DEFAULT_BOUNDS):
+    """Sinh một cảnh ngẫu nhiên (emps, obstacles) trong vùng bounds từ bộ sinh số rnd."""
+    lat_span = bounds['lat_max'] - bounds['lat_min']
+    lon_span = bounds['lon_max'] - bounds['lon_min']
+    emps = [
+        EMP(name=f"EMP {k + 1}",
+            lat=bounds['lat_min'] + rnd.uniform(0.1, 0.9) * lat_span,
+            lon=bounds['lon_min'] + rnd.uniform(0.1, 0.9) * lon_span,
+            power=rnd.choice(EMP_POWERS), frequency=300, height=rnd.uniform(1, 30))
+        for k in range(n_emps)
+    ]
+    obstacles = [
+        Obstacle(name=f"Vật cản {k + 1}",
+                 lat=rnd.uniform(bounds['lat_min'], bounds['lat_max']),
+                 lon=rnd.uniform(bounds['lon_min'], bounds['lon_max']),
+                 length=rnd.uniform(5, 60), width=rnd.uniform(5, 60), height=rnd.uniform(3, 40))
+        for k in range(n_obstacles)
+    ]
+    return emps, obstacles
+
+
+def field_errors(result, expected):
+    """
+    Sai số giữa hai lưới kết quả: (max sai số tuyệt đối, max sai số tương đối, số ô lệch trạng thái che khuất).
+    Ô cùng là inf (tâm EMP) được coi là khớp; sai số tương đối chia cho max(|a|, |b|).
+    """
+    both_inf = np.isinf(result) & np.isinf(expected) & (result == expected)
+    with np.errstate(invalid='ignore'):
+        abs_err = np.where(both_inf, 0.0, np.abs(result - expected))
+    scale = np.maximum(np.abs(result), np.abs(expected))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rel_err = np.where(scale > 0, abs_err / scale, 0.0)
+    rel_err = np.where(both_inf, 0.0, rel_err)
+    occlusion_mismatch = int(np.count_nonzero((result > 0) != (expected > 0)))
+    return float(abs_err.max(initial=0.0)), float(np.nan_to_num(rel_err, nan=1.0).max(initial=0.0)), occlusion_mismatch
+
+
+def compare_backends(backends=None, n_scenes=5, grid_size=(80, 80), seed=0, altitudes=(0, 2, 20),
+                     max_emps=6, max_obstacles=60, bounds=DEFAULT_BOUNDS):
+    """
+    Chạy các cảnh ngẫu nhiên qua từng backend và so với backend "reference".
+    Trả về danh sách dict, mỗi dict ứng với một (backend, cảnh, độ cao):
+    backend, scene, altitude, max_abs_error, max_rel_error, occlusion_mismatch, time, reference_time.
+    """
+    if backends is None:
+        backends = [name for name in calculations.available_backends() if name != "reference"]
+    rnd = random.Random(seed)
+    rows = []
+    for scene in range(n_scenes):
+        emps, obstacles = random_scene(rnd, rnd.randint(1, max_emps), rnd.randint(0, max_obstacles), bounds)
+        for altitude in altitudes:
+            start = time.perf_counter()
+            expected = calculations.calculate_emp_field(emps, obstacles, altitude, bounds, grid_size, backend="reference")
+            reference_time = time.perf_counter() - start
+
+            for backend in backends:
+                start = time.perf_counter()
+                result = calculations.calculate_emp_field(emps, obstacles, altitude, bounds, grid_size, backend=backend)
+                elapsed = time.perf_counter() - start
+                abs_err, rel_err, mismatch = field_errors(result, expected)
+                rows.append({
+                    'backend': backend, 'scene': scene, 'altitude': altitude,
+                    'n_emps': len(emps), 'n_obstacles': len(obstacles),
+                    'max_abs_error': abs_err, 'max_rel_error': rel_err, 'occlusion_mismatch': mismatch,
+                    'time': elapsed, 'reference_time': reference_time,
+                })
+    return rows
+
+
+def summarize(rows, rel_tolerance=1e-9):
+    """Gộp kết quả theo backend: sai số lớn nhất, tổng thời gian, tốc độ so với reference, đạt/không đạt."""
+    summary = {}
+    for row in rows:
+        s = summary.setdefault(row['backend'], {
+            'max_abs_error': 0.0, 'max_rel_error': 0.0, 'occlusion_mismatch': 0,
+            'time': 0.0, 'reference_time': 0.0, 'runs': 0,
+        })
+        s['max_abs_error'] = max(s['max_abs_error'], row['max_abs_error'])
+        s['max_rel_error'] = max(s['max_rel_error'], row['max_rel_error'])
+        s['occlusion_mismatch'] += row['occlusion_mismatch']
+        s['time'] += row['time']
+        s['reference_time'] += row['reference_time']
+        s['runs'] += 1
+    for name, s in summary.items():
+        s['speedup'] = s['reference_time'] / s['time'] if s['time'] > 0 else float('inf')
+        s['exact'] = calculations.backend_info(name)['exact']
+        s['passed'] = s['max_rel_error'] <= rel_tolerance and s['occlusion_mismatch'] == 0
+    return summary
+
+
+def format_report(summary):
+    """Bảng báo cáo dạng văn bản."""
+    lines = [f"{'Backend':<12} {'Chính xác':<10} {'Max abs':>11} {'Max rel':>11} {'Ô lệch':>8} "
+             f"{'Thời gian':>10} {'Tăng tốc':>9}  Kết quả"]
+    for name in sorted(summary):
+        s = summary[name]
+        lines.append(f"{name:<12} {'có' if s['exact'] else 'gần đúng':<10} {s['max_abs_error']:>11.3g} "
+                     f"{s['max_rel_error']:>11.3g} {s['occlusion_mismatch']:>8d} {s['time']:>9.3f}s "
+                     f"{s['speedup']:>8.1f}x  {'ĐẠT' if s['passed'] else 'KHÔNG ĐẠT'}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh các backend tính toán với backend reference trên cảnh ngẫu nhiên.")
+    parser.add_argument("--backends", nargs="*", help="Tên các backend cần so sánh (mặc định: tất cả)")
+    parser.add_argument("--scenes", type=int, default=5, help="Số cảnh ngẫu nhiên")
+    parser.add_argument("--grid", type=int, nargs=2, default=[80, 80], metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=1e-9, help="Sai số tương đối tối đa cho phép")
+    args = parser.parse_args(argv)
+
+    rows = compare_backends(args.backends, n_scenes=args.scenes, grid_size=tuple(args.grid), seed=args.seed)
+    summary = summarize(rows, rel_tolerance=args.tolerance)
+    print(format_report(summary))
+    # Mã thoát khác 0 nếu một backend chính xác không đạt
+    return 0 if all(s['passed'] for s in summary.values() if s['exact']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# emp_planning_system/benchmark.py
+
+# Bộ đo hiệu năng của calculate_emp_field, chạy không cần giao diện (không import PyQt5).
+# Ví dụ:
+#   python benchmark.py --suite quick --output baseline.json
+#   python benchmark.py --suite quick --compare baseline.json
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import calculations
+from data_models import EMP, Obstacle
+
+# Tâm các cảnh tổng hợp và số mét trên một độ vĩ
+CENTER_LAT, CENTER_LON = 21.025, 105.855
+METERS_PER_DEG_LAT = calculations.R_EARTH * np.pi / 180
+
+# Các mức zoom: tên -> cạnh vùng bản đồ (mét)
+ZOOM_SPANS = {'street': 300, 'district': 1500, 'city': 8000}
+
+# Các kịch bản: (tên, số EMP, số vật cản, grid_size, zoom)
+SUITES = {
+    'quick': [
+        ('small', 1, 0, (100, 100), 'street'),
+        ('block', 5, 500, (200, 200), 'district'),
+        ('dense', 20, 5000, (400, 400), 'district'),
+    ],
+    'full': [
+        ('small', 1, 0, (100, 100), 'street'),
+        ('street', 10, 200, (200, 200), 'street'),
+        ('block', 5, 500, (200, 200), 'district'),
+        ('dense', 20, 5000, (400, 400), 'district'),
+        ('district-hd', 50, 10000, (1000, 1000), 'district'),
+        ('city', 200, 20000, (1000, 1000), 'city'),
+        ('city-hd', 500, 50000, (2000, 2000), 'city'),
+    ],
+}
+
+# Không chạy một backend khi khối lượng việc ước lượng (calculations.estimate_work) vượt ngưỡng này
+MAX_WORK = {'reference': 1e6}
+# Mức chậm đi (tỉ lệ) bị coi là suy giảm hiệu năng khi so với baseline
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+
+
+def scene_bounds(span_m, center_lat=CENTER_LAT, center_lon=CENTER_LON):
+    """Vùng bản đồ hình vuông cạnh span_m mét quanh tâm."""
+    half_lat = span_m / 2 / METERS_PER_DEG_LAT
+    half_lon = half_lat / np.cos(np.radians(center_lat))
+    return {'lat_min': center_lat - half_lat, 'lat_max': center_lat + half_lat,
+            'lon_min': center_lon - half_lon, 'lon_max': center_lon + half_lon}
+
+
+def city_scene(n_emps, n_obstacles, bounds, seed=0):
+    """
+    Cảnh tổng hợp tất định kiểu đô thị: vật cản là các tòa nhà xếp trong các ô phố
+    ngăn cách bởi đường; EMP đặt ngẫu nhiên (cùng seed thì cùng cảnh).
+    """
+    rnd = random.Random(seed)
+    lat_span = bounds['lat_max'] - bounds['lat_min']
+    lon_span = bounds['lon_max'] - bounds['lon_min']
+    span_m = lat_span * METERS_PER_DEG_LAT
+    emps = [
+        EMP(name=f"EMP {k + 1}", lat=bounds['lat_min'] + rnd.uniform(0.05, 0.95) * lat_span,
+            lon=bounds['lon_min'] + rnd.uniform(0.05, 0.95) * lon_span,
+            power=rnd.choice([1000, 5000, 20000, 200000]), frequency=300, height=rnd.uniform(2, 40))
+        for k in range(n_emps)
+    ]
+    if n_obstacles == 0:
+        return emps, []
+
+    # Lưới ô phố vuông, mỗi ô có 3x3 chỗ đặt nhà; đường rộng 20% ô phố
+    blocks_per_side = max(1, int(np.ceil(np.sqrt(n_obstacles / 9))))
+    block_m = span_m / blocks_per_side
+    lot_m = block_m * 0.8 / 3
+    lots = [(bi, bj, li, lj) for bi in range(blocks_per_side) for bj in range(blocks_per_side)
+            for li in range(3) for lj in range(3)]
+    rnd.shuffle(lots)
+    obstacles = []
+    for k, (bi, bj, li, lj) in enumerate(lots[:n_obstacles]):
+        x = bi * block_m + block_m * 0.1 + (li + 0.5) * lot_m
+        y = bj * block_m + block_m * 0.1 + (lj + 0.5) * lot_m
+        obstacles.append(Obstacle(
+            name=f"Nhà {k + 1}",
+            lat=bounds['lat_min'] + y / span_m * lat_span,
+            lon=bounds['lon_min'] + x / span_m * lon_span,
+            length=lot_m * rnd.uniform(0.5, 0.95), width=lot_m * rnd.uniform(0.5, 0.95),
+            height=rnd.choice([6, 9, 12, 15, 20, 30, 45]) * rnd.uniform(0.8, 1.2)))
+    return emps, obstacles
+
+
+def time_backend(backend, emps, obstacles, altitude, bounds, grid_size, warmup=1, repeats=3):
+    """Đo thời gian (giây) của repeats lần chạy sau warmup lần chạy khởi động, và bộ nhớ đỉnh (byte)."""
+    for _ in range(warmup):
+        calculations.calculate_emp_field(emps, obstacles, altitude, bounds, grid_size, backend=backend)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        calculations.calculate_emp_field(emps, obstacles, altitude, bounds, grid_size, backend=backend)
+        times.append(time.perf_counter() - start)
+
+    # Đo bộ nhớ ở một lần chạy riêng vì tracemalloc làm chậm phép đo thời gian
+    tracemalloc.start()
+    try:
+        calculations.calculate_emp_field(emps, obstacles, altitude, bounds, grid_size, backend=backend)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_suite(suite='quick', backends=None, warmup=1, repeats=3, altitude=2.0, seed=0, log=print):
+    """Chạy mọi kịch bản của suite với từng backend, trả về dict kết quả có thể ghi ra JSON."""
+    if backends is None:
+        backends = calculations.available_backends()
+    results = []
+    for name, n_emps, n_obstacles, grid_size, zoom in SUITES[suite]:
+        bounds = scene_bounds(ZOOM_SPANS[zoom])
+        emps, obstacles = city_scene(n_emps, n_obstacles, bounds, seed=seed)
+        work = calculations.estimate_work(emps, obstacles, bounds, grid_size)
+        for backend in backends:
+            entry = {'scenario': name, 'backend': backend, 'n_emps': n_emps, 'n_obstacles': n_obstacles,
+                     'grid_size': list(grid_size), 'zoom': zoom, 'span_m': ZOOM_SPANS[zoom], 'work': work}
+            if work > MAX_WORK.get(backend, float('inf')):
+                entry['skipped'] = 'khối lượng việc quá lớn cho backend này'
+                log(f"{name:<12} {backend:<12} bỏ qua")
+                results.append(entry)
+                continue
+            times, peak = time_backend(backend, emps, obstacles, altitude, bounds, grid_size, warmup, repeats)
+            entry.update(times=times, best=min(times), median=float(np.median(times)), peak_memory_bytes=peak)
+            log(f"{name:<12} {backend:<12} {entry['median']:>9.4f}s  {peak / 2 ** 20:>8.1f} MB")
+            results.append(entry)
+
+    return {
+        'meta': {
+            'suite': suite, 'warmup': warmup, 'repeats': repeats, 'altitude': altitude, 'seed': seed,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    So sánh kết quả với baseline theo thời gian trung vị của từng (kịch bản, backend).
+    Trả về danh sách dict (scenario, backend, baseline, current, ratio, regression).
+    """
+    previous = {(r['scenario'], r['backend']): r for r in baseline['results'] if 'median' in r}
+    rows = []
+    for r in current['results']:
+        old = previous.get((r['scenario'], r['backend']))
+        if old is None or 'median' not in r:
+            continue
+        ratio = r['median'] / old['median'] if old['median'] > 0 else float('inf')
+        rows.append({'scenario': r['scenario'], 'backend': r['backend'], 'baseline': old['median'],
+                     'current': r['median'], 'ratio': ratio, 'regression': ratio > 1 + threshold})
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'Kịch bản':<12} {'Backend':<12} {'Baseline':>10} {'Hiện tại':>10} {'Tỉ lệ':>7}"]
+    for row in rows:
+        flag = "  <-- CHẬM ĐI" if row['regression'] else ""
+        lines.append(f"{row['scenario']:<12} {row['backend']:<12} {row['baseline']:>9.4f}s "
+                     f"{row['current']:>9.4f}s {row['ratio']:>6.2f}x{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng calculate_emp_field trên các cảnh tổng hợp.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--backends", nargs="*", help="Tên các backend cần đo (mặc định: tất cả)")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="So sánh với file JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Mức chậm đi tối đa cho phép so với baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.suite, args.backends, args.warmup, args.repeats, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print(format_comparison(rows))
+        if any(row['regression'] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
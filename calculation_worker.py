@@ -0,0 +1,162 @@
+# emp_planning_system/calculation_worker.py
+
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+import calculations
+
+
+class CalculationTask(QThread):
+    """
+    Một lần tính toán chạy trong luồng nền.
+    - job(task): hàm thực hiện tính toán và trả về kết quả. Nó truyền task.report làm callback
+      progress cho các hàm tính toán (hoặc tự gọi task.report / task.check_canceled giữa các ô, các EMP)
+      và có thể gửi từng phần kết quả bằng task.emit_tile(window, data) hoặc task.emit_partial(result).
+    Mọi tín hiệu mang theo request_id để CalculationRunner bỏ qua tín hiệu của yêu cầu đã cũ.
+    """
+    progressChanged = pyqtSignal(int, int)          # (request_id, phần trăm)
+    tileReady = pyqtSignal(int, object, object)     # (request_id, window, data)
+    partialResult = pyqtSignal(int, object)         # (request_id, kết quả tạm, ví dụ bản xem trước)
+    succeeded = pyqtSignal(int, object)             # (request_id, kết quả của job)
+    failed = pyqtSignal(int, str)                   # (request_id, thông báo lỗi)
+    canceled = pyqtSignal(int)                      # (request_id)
+
+    def __init__(self, request_id, job, lock, parent=None):
+        super().__init__(parent)
+        self.request_id = request_id
+        self.job = job
+        self._lock = lock
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Yêu cầu dừng; luồng nền dừng ở lần kiểm tra kế tiếp (giữa hai ô hoặc hai EMP)."""
+        self._cancel.set()
+
+    def is_canceled(self):
+        return self._cancel.is_set()
+
+    def check_canceled(self):
+        if self._cancel.is_set():
+            raise calculations.CalculationCanceled()
+
+    def report(self, done, total):
+        """Callback progress(done, total) cho các hàm tính toán: phát phần trăm, dừng nếu đã bị hủy."""
+        self.check_canceled()
+        self.progressChanged.emit(self.request_id, int(100 * done / total) if total else 100)
+
+    def emit_tile(self, window, data):
+        self.tileReady.emit(self.request_id, window, data)
+
+    def emit_partial(self, result):
+        self.partialResult.emit(self.request_id, result)
+
+    def run(self):
+        try:
+            # Các lần tính dùng chung trạng thái (bộ tính toán lớp, cache) nên chạy lần lượt:
+            # yêu cầu mới chờ yêu cầu cũ dừng ở điểm kiểm tra kế tiếp
+            with self._lock:
+                self.check_canceled()
+                result = self.job(self)
+                self.check_canceled()
+        except calculations.CalculationCanceled:
+            self.canceled.emit(self.request_id)
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(self.request_id, str(e))
+        else:
+            self.succeeded.emit(self.request_id, result)
+
+
+class CalculationRunner(QObject):
+    """
+    Chạy các lần tính toán trong luồng nền để giao diện (và bản đồ) không bị treo.
+    Mỗi lúc chỉ một yêu cầu còn hiệu lực: yêu cầu mới thay thế yêu cầu đang chạy thay vì xếp hàng sau nó.
+    Yêu cầu cũ được hủy và mọi tín hiệu của nó bị bỏ qua; các tín hiệu của runner luôn thuộc yêu cầu hiện tại.
+    """
+    progressChanged = pyqtSignal(int)           # phần trăm
+    tileReady = pyqtSignal(object, object)      # (window, data)
+    partialResult = pyqtSignal(object)
+    succeeded = pyqtSignal(object)              # kết quả của job
+    failed = pyqtSignal(str)
+    canceled = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._current = None
+        # Giữ tham chiếu tới các luồng (kể cả luồng đã bị thay thế) cho tới khi chúng kết thúc
+        self._tasks = set()
+
+    def is_running(self):
+        return self._current is not None
+
+    def submit(self, job):
+        """Chạy job(task) trong luồng nền, hủy yêu cầu đang chạy (nếu có). Trả về request_id."""
+        if self._current is not None:
+            self._current.cancel()
+        self._next_id += 1
+        task = CalculationTask(self._next_id, job, self._lock)
+        task.progressChanged.connect(self._on_progress)
+        task.tileReady.connect(self._on_tile)
+        task.partialResult.connect(self._on_partial)
+        task.succeeded.connect(self._on_succeeded)
+        task.failed.connect(self._on_failed)
+        task.canceled.connect(self._on_canceled)
+        task.finished.connect(lambda: self._on_finished(task))
+        self._tasks.add(task)
+        self._current = task
+        task.start()
+        return task.request_id
+
+    def cancel(self):
+        """Hủy yêu cầu hiện tại; tín hiệu canceled được phát khi luồng nền thực sự dừng."""
+        if self._current is not None:
+            self._current.cancel()
+
+    def wait_all(self):
+        """
+        Hủy mọi yêu cầu và chờ các luồng nền dừng (gọi khi đóng cửa sổ).
+        Không đặt thời hạn: việc hủy là hợp tác nên luồng dừng ở điểm kiểm tra kế tiếp, còn hủy QThread
+        khi luồng còn chạy sẽ làm chương trình bị dừng đột ngột.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        for task in list(self._tasks):
+            task.wait()
+
+    def _is_current(self, request_id):
+        return self._current is not None and self._current.request_id == request_id
+
+    def _on_progress(self, request_id, percent):
+        if self._is_current(request_id):
+            self.progressChanged.emit(percent)
+
+    def _on_tile(self, request_id, window, data):
+        if self._is_current(request_id):
+            self.tileReady.emit(window, data)
+
+    def _on_partial(self, request_id, result):
+        if self._is_current(request_id):
+            self.partialResult.emit(result)
+
+    def _on_succeeded(self, request_id, result):
+        if self._is_current(request_id):
+            self._current = None
+            self.succeeded.emit(result)
+
+    def _on_failed(self, request_id, message):
+        if self._is_current(request_id):
+            self._current = None
+            self.failed.emit(message)
+
+    def _on_canceled(self, request_id):
+        if self._is_current(request_id):
+            self._current = None
+            self.canceled.emit()
+
+    def _on_finished(self, task):
+        self._tasks.discard(task)
+        task.deleteLater()
@@ -3,9 +3,24 @@
 import numpy as np
 import math
 
+import spatial_index
+import shadow_occlusion
+import heightmap_occlusion
+import profiling
+import grid_geometry
+import sparse_field
+
 # Hằng số vật lý
 R_EARTH = 6371000  # Bán kính Trái Đất (mét)
 
+
+class CalculationCanceled(Exception):
+    """
+    Được ném ra từ callback progress(done, total) để dừng một lần tính toán giữa chừng.
+    Các hàm nhận tham số progress gọi nó sau mỗi đơn vị việc (EMP, ô, mức chia lưới).
+    """
+
+
 def lonlat_to_xy(origin_lon, origin_lat, lon, lat):
     """
     Chuyển đổi tọa độ (lon, lat) sang (x, y) tính bằng mét,
@@ -16,6 +31,19 @@ def lonlat_to_xy(origin_lon, origin_lat, lon, lat):
     dy = (lat - origin_lat) * math.pi / 180 * R_EARTH
     return dx, dy
 
+def lonlat_to_xy_array(origin_lon, origin_lat, lon, lat):
+    """
+    Dạng mảng của lonlat_to_xy: lon, lat là số, list hoặc mảng (broadcast được với nhau).
+    cos(origin_lat) chỉ tính một lần cho cả mảng; kết quả trùng với gọi lonlat_to_xy từng điểm.
+    """
+    return lonlat_to_xy(origin_lon, origin_lat, np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+
+def xy_to_lonlat(origin_lon, origin_lat, x, y):
+    """Phép chiếu ngược của lonlat_to_xy: (x, y) mét (số hoặc mảng) -> (lon, lat)."""
+    lon = origin_lon + np.asarray(x, dtype=float) / (R_EARTH * math.cos(origin_lat * math.pi / 180)) * 180 / math.pi
+    lat = origin_lat + np.asarray(y, dtype=float) / R_EARTH * 180 / math.pi
+    return lon, lat
+
 def check_line_box_intersection(p1, p2, box_min, box_max):
     """
     Kiểm tra xem đoạn thẳng P1-P2 có cắt hình hộp chữ nhật (AABB) không.
@@ -43,9 +71,69 @@ def check_line_box_intersection(p1, p2, box_min, box_max):
     return t0 < t1 and t0 < 1 and t1 > 0
 
 
-def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200, 200)):
+
+# Số phần tử tối đa của một mảng tạm (điểm x hộp x 3) trong kernel che khuất theo lô.
+# 2^21 phần tử float64 ~ 16 MB cho mỗi mảng tạm.
+KERNEL_MAX_ELEMENTS = 1 << 21
+# Số hộp xử lý trong một lượt của kernel theo lô
+KERNEL_BOX_CHUNK = 64
+
+
+def check_segments_boxes_intersection(p1, points, boxes, max_elements=KERNEL_MAX_ELEMENTS, stats=None, emp=None):
     """
-    Hàm tính toán chính.
+    Phiên bản theo lô của check_line_box_intersection (thuật toán Slab).
+    - p1: [x, y, z] điểm đầu chung của mọi đoạn thẳng (vị trí EMP)
+    - points: mảng (N, 3) các điểm cuối (điểm thu)
+    - boxes: mảng (M, 2, 3) các hộp AABB, boxes[k, 0] là góc nhỏ nhất, boxes[k, 1] là góc lớn nhất
+    - max_elements: giới hạn kích thước mảng tạm để bộ nhớ không phụ thuộc vào N x M
+    - stats, emp: FieldStats tùy chọn để đếm số phép thử hộp và số tia dừng sớm (của EMP emp)
+    Trả về mảng bool (N,): True nếu đoạn p1 -> points[n] cắt ít nhất một hộp.
+    Điểm đã bị che sẽ không được kiểm tra với các lô hộp tiếp theo.
+    """
+    p1 = np.asarray(p1, dtype=float)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 2, 3)
+    n_points, n_boxes = len(points), len(boxes)
+
+    occluded = np.zeros(n_points, dtype=bool)
+    if n_points == 0 or n_boxes == 0:
+        return occluded
+
+    direction = points - p1
+    # Tránh lỗi chia cho 0
+    direction[direction == 0] = 1e-9
+    rel_min = boxes[:, 0, :] - p1
+    rel_max = boxes[:, 1, :] - p1
+
+    box_chunk = min(n_boxes, KERNEL_BOX_CHUNK)
+    point_chunk = max(1, max_elements // (3 * box_chunk))
+
+    for start in range(0, n_points, point_chunk):
+        active = np.arange(start, min(start + point_chunk, n_points))
+        for b_start in range(0, n_boxes, box_chunk):
+            b_end = b_start + box_chunk
+            d = direction[active][:, None, :]
+            t_near = rel_min[None, b_start:b_end] / d
+            t_far = rel_max[None, b_start:b_end] / d
+            t0 = np.minimum(t_near, t_far).max(axis=2)
+            t1 = np.maximum(t_near, t_far).min(axis=2)
+            hit = ((t0 < t1) & (t0 < 1) & (t1 > 0)).any(axis=1)
+
+            occluded[active[hit]] = True
+            if stats is not None:
+                stats.count('box_tests', active.size * min(box_chunk, n_boxes - b_start), emp)
+                if b_end < n_boxes:
+                    # Tia bị che trước lô hộp cuối cùng không phải kiểm tra các lô còn lại
+                    stats.count('early_outs', np.count_nonzero(hit), emp)
+            active = active[~hit]
+            if active.size == 0:
+                break
+
+    return occluded
+
+def _calculate_emp_field_reference(emps, obstacles, user_altitude, bounds, grid_size=(200, 200)):
+    """
+    Backend "reference": vòng lặp gốc duyệt từng ô lưới.
     - emps: danh sách các đối tượng EMP
     - obstacles: danh sách các đối tượng Obstacle
     - user_altitude: độ cao người dùng xét (mét)
@@ -53,11 +141,10 @@ def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200,
     - grid_size: độ phân giải của lưới tính toán (width, height)
     """
     # 1. Thiết lập lưới tính toán và hệ tọa độ XY
-    origin_lon = (bounds['lon_min'] + bounds['lon_max']) / 2
-    origin_lat = (bounds['lat_min'] + bounds['lat_max']) / 2
+    # Tọa độ XY của các hàng/cột được chiếu sẵn một lần và dùng chung giữa các lần gọi
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    origin_lon, origin_lat = grid.origin_lon, grid.origin_lat
     grid_height, grid_width = grid_size
-    lat_range = np.linspace(bounds['lat_min'], bounds['lat_max'], grid_size[1])
-    lon_range = np.linspace(bounds['lon_min'], bounds['lon_max'], grid_size[0])
     
     # Lưới kết quả, lưu giá trị E_max tại mỗi điểm
     result_grid = np.zeros(grid_size)
@@ -75,15 +162,11 @@ def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200,
         box_max = np.array([center_x + half_len, center_y + half_wid, obs.height])
         obstacles_xy.append({'min': box_min, 'max': box_max})
     
-    map_min_x, map_min_y = lonlat_to_xy(origin_lon, origin_lat, bounds['lon_min'], bounds['lat_min'])
-    map_max_x, map_max_y = lonlat_to_xy(origin_lon, origin_lat, bounds['lon_max'], bounds['lat_max'])
-    
-    map_width_m = map_max_x - map_min_x
-    map_height_m = map_max_y - map_min_y
-    
+    map_min_x, map_min_y = grid.map_min_x, grid.map_min_y
+
     # Kích thước vật lý (mét) của một ô lưới
-    cell_width_m = map_width_m / grid_width if grid_width > 0 else 0
-    cell_height_m = map_height_m / grid_height if grid_height > 0 else 0
+    cell_width_m = grid.cell_width_m
+    cell_height_m = grid.cell_height_m
     # 2. Lặp qua từng nguồn EMP (thuật toán tối ưu)
     for emp in emps:
         emp_x, emp_y = lonlat_to_xy(origin_lon, origin_lat, emp.lon, emp.lat)
@@ -110,11 +193,8 @@ def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200,
         # 3. Lặp qua các điểm trong vùng ảnh hưởng đã được tối ưu
         for j in range(j_min, j_max):
             for i in range(i_min, i_max):
-                # Lấy tọa độ lon/lat từ chỉ số lưới
-                lat = lat_range[j]
-                lon = lon_range[i]
-                
-                grid_x, grid_y = lonlat_to_xy(origin_lon, origin_lat, lon, lat)
+                # Lấy tọa độ XY đã chiếu sẵn từ chỉ số lưới
+                grid_x, grid_y = grid.xs[i], grid.ys[j]
                 grid_pos = np.array([grid_x, grid_y, user_altitude])
                 
                 # 4. Kiểm tra che khuất
@@ -160,4 +240,620 @@ def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200,
     #             # 6. Cập nhật giá trị E lớn nhất vào lưới kết quả
                 result_grid[j, i] = max(result_grid[j, i], e_field)
 
-    return result_grid
\ No newline at end of file
+    return result_grid
+
+def _obstacle_boxes(obstacles, grid):
+    """Chuyển danh sách vật cản sang mảng hộp AABB dạng (M, 2, 3) trong hệ XY của lưới."""
+    boxes = np.empty((len(obstacles), 2, 3))
+    for k, obs in enumerate(obstacles):
+        center_x, center_y = grid.lonlat_to_xy(obs.lon, obs.lat)
+        half_len = obs.length / 2
+        half_wid = obs.width / 2
+        boxes[k, 0] = [center_x - half_len, center_y - half_wid, 0]
+        boxes[k, 1] = [center_x + half_len, center_y + half_wid, obs.height]
+    return boxes
+
+
+def _emp_window(emp_x, emp_y, d_max, grid):
+    """
+    Xác định vùng lưới (j_min, j_max, i_min, i_max) mà một EMP có thể ảnh hưởng.
+    Giữ nguyên cách làm tròn của backend reference để kết quả trùng khớp.
+    """
+    grid_height, grid_width = grid.height, grid.width
+    cell_width_m, cell_height_m = grid.cell_width_m, grid.cell_height_m
+
+    radius_in_cells_x = (d_max / cell_width_m) if cell_width_m > 0 else grid_width
+    radius_in_cells_y = (d_max / cell_height_m) if cell_height_m > 0 else grid_height
+
+    emp_i = (emp_x - grid.map_min_x) / cell_width_m if cell_width_m > 0 else 0
+    emp_j = (emp_y - grid.map_min_y) / cell_height_m if cell_height_m > 0 else 0
+
+    i_min = max(0, int(emp_i - radius_in_cells_x))
+    i_max = min(grid_width, int(emp_i + radius_in_cells_x) + 1)
+    j_min = max(0, int(emp_j - radius_in_cells_y))
+    j_max = min(grid_height, int(emp_j + radius_in_cells_y) + 1)
+    return j_min, j_max, i_min, i_max
+
+
+def _emp_footprint_window(emp, grid):
+    """Vùng lưới (j_min, j_max, i_min, i_max) chịu ảnh hưởng của một EMP có công suất dương."""
+    emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+    # Bán kính mà tại đó E giảm xuống dưới ngưỡng 10 V/m, cộng thêm hệ số an toàn
+    d_max = math.sqrt(0.3 * emp.power) * 1.1
+    return _emp_window(emp_x, emp_y, d_max, grid)
+
+
+def _emp_field_values(emp, horizontal_sq, user_altitude):
+    """
+    Cường độ E = sqrt(30P/d^2) của một EMP (chưa xét che khuất) tại các điểm có bình phương
+    khoảng cách ngang horizontal_sq, ở độ cao xét user_altitude; vô hạn tại tâm.
+    Dùng chung cho mọi đường tính dạng mảng (vùng ảnh hưởng, tập điểm, bản xem trước).
+    """
+    dz = emp.height - user_altitude
+    distance_sq = horizontal_sq + dz * dz
+    with np.errstate(divide='ignore'):
+        field = np.sqrt(30 * emp.power / distance_sq)
+    field[distance_sq < 1e-6] = np.inf  # Cường độ vô hạn tại tâm
+    return field
+
+
+def _emp_field_block(emp, grid, index, user_altitude, clip=None, occlusion="rays", heightmap=None, stats=None):
+    """
+    Tính cường độ điện trường của một EMP trên toàn bộ vùng ảnh hưởng của nó.
+    - index: ObstacleGridIndex dựng sẵn trên các vật cản của lần tính toán
+    - clip: (j_min, j_max, i_min, i_max) tùy chọn, chỉ tính phần vùng ảnh hưởng nằm trong đó
+    - occlusion: cách kiểm tra che khuất, một trong OCCLUSION_MODES
+    - heightmap: HeightmapRaster của lần tính toán, bắt buộc khi occlusion="heightmap"
+    - stats: FieldStats tùy chọn để đo thời gian từng pha và đếm số ô, tia, phép thử hộp
+    Trả về (window, block) với window = (j_min, j_max, i_min, i_max),
+    hoặc None nếu EMP không có công suất hoặc nằm ngoài lưới.
+    """
+    footprint = _emp_field_blocks(emp, grid, index, [user_altitude], clip=clip,
+                                  occlusion=occlusion, heightmap=heightmap, stats=stats)
+    if footprint is None:
+        return None
+    window, blocks = footprint
+    return window, blocks[0]
+
+
+def _emp_field_blocks(emp, grid, index, altitudes, clip=None, occlusion="rays", heightmap=None, stats=None):
+    """
+    Như _emp_field_block nhưng cho nhiều độ cao xét cùng lúc.
+    Vùng ảnh hưởng, khoảng cách theo phương ngang, các hộp ứng viên và việc phân nhóm tia
+    chỉ tính một lần; mỗi độ cao chỉ còn phần khoảng cách theo phương đứng và kiểm tra che khuất.
+    Trả về (window, [block cho từng độ cao]) hoặc None.
+    """
+    if emp.power <= 0:
+        return None
+
+    emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+    emp_pos = np.array([emp_x, emp_y, emp.height])
+    j_min, j_max, i_min, i_max = _emp_footprint_window(emp, grid)
+    if clip is not None:
+        j_min, j_max = max(j_min, clip[0]), min(j_max, clip[1])
+        i_min, i_max = max(i_min, clip[2]), min(i_max, clip[3])
+    if j_min >= j_max or i_min >= i_max:
+        return None
+
+    # Lưới con (h, w) của vùng ảnh hưởng
+    with profiling.phase(stats, 'projection'):
+        sub_xs = grid.xs[i_min:i_max]
+        sub_ys = grid.ys[j_min:j_max]
+        gx, gy = np.meshgrid(sub_xs, sub_ys)
+        dx = emp_x - gx
+        dy = emp_y - gy
+        horizontal_sq = dx * dx + dy * dy
+
+    sectors = None
+    candidates = np.empty(0, dtype=int)
+    if occlusion == "heightmap":
+        # Bản đồ độ cao không cần danh sách hộp ứng viên
+        rows, cols = np.mgrid[j_min:j_max, i_min:i_max]
+    else:
+        # Chỉ những hộp nằm trong hình chữ nhật bao EMP và vùng ảnh hưởng mới có thể che tia
+        with profiling.phase(stats, 'culling'):
+            candidates = index.query_rect(
+                min(emp_x, sub_xs.min()), min(emp_y, sub_ys.min()),
+                max(emp_x, sub_xs.max()), max(emp_y, sub_ys.max()),
+                z_lo=min(emp.height, min(altitudes)), z_hi=max(emp.height, max(altitudes))
+            )
+            if candidates.size and occlusion == "rays":
+                sectors = spatial_index.RaySectors(emp_pos, gx, gy, index.boxes[candidates])
+    if stats is not None:
+        stats.count('cells', horizontal_sq.size * len(altitudes), emp)
+        stats.count('candidate_boxes', candidates.size, emp)
+
+    blocks = []
+    for user_altitude in altitudes:
+        with profiling.phase(stats, 'field'):
+            block = _emp_field_values(emp, horizontal_sq, user_altitude)
+
+        occluded = None
+        with profiling.phase(stats, 'occlusion'):
+            if sectors is not None:
+                occluded = sectors.occluded(user_altitude, stats=stats, emp=emp).reshape(block.shape)
+            elif candidates.size and occlusion == "shadow":
+                occluded = shadow_occlusion.shadow_mask(emp_pos, sub_xs, sub_ys, index.boxes[candidates], user_altitude)
+            elif occlusion == "heightmap":
+                occluded = heightmap.occluded(emp_pos, rows, cols, user_altitude).reshape(block.shape)
+        if occluded is not None:
+            block[occluded] = 0
+            if stats is not None:
+                stats.count('occluded', np.count_nonzero(occluded), emp)
+        blocks.append(block)
+
+    return (j_min, j_max, i_min, i_max), blocks
+
+
+def _evaluate_points(emps, grid, index, jj, ii, user_altitude):
+    """
+    Tính trường tại một tập nút lưới bất kỳ (jj[n], ii[n]) thay vì cả vùng ảnh hưởng.
+    Giá trị tại mỗi nút trùng với ô tương ứng của backend "vectorized".
+    Trả về (values, occluded_count): occluded_count là số EMP có tia tới nút bị che.
+    """
+    jj = np.asarray(jj, dtype=int)
+    ii = np.asarray(ii, dtype=int)
+    values = np.zeros(jj.shape)
+    occluded_count = np.zeros(jj.shape, dtype=int)
+
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        j_min, j_max, i_min, i_max = _emp_footprint_window(emp, grid)
+        inside = (jj >= j_min) & (jj < j_max) & (ii >= i_min) & (ii < i_max)
+        if not inside.any():
+            continue
+
+        emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+        px = grid.xs[ii[inside]]
+        py = grid.ys[jj[inside]]
+        dx = emp_x - px
+        dy = emp_y - py
+        field = _emp_field_values(emp, dx * dx + dy * dy, user_altitude)
+
+        candidates = index.query_rect(
+            min(emp_x, px.min()), min(emp_y, py.min()), max(emp_x, px.max()), max(emp_y, py.max()),
+            z_lo=min(emp.height, user_altitude), z_hi=max(emp.height, user_altitude)
+        )
+        if candidates.size:
+            sectors = spatial_index.RaySectors([emp_x, emp_y, emp.height], px, py, index.boxes[candidates])
+            occluded = sectors.occluded(user_altitude)
+            field[occluded] = 0
+            occluded_count[inside] += occluded
+
+        values[inside] = np.maximum(values[inside], field)
+
+    return values, occluded_count
+
+
+def _build_obstacle_index(obstacles, grid, emps, user_altitude):
+    """
+    Dựng chỉ mục không gian cho vật cản, một lần cho mỗi lần tính toán.
+    Vật cản thấp hơn cả độ cao xét và EMP thấp nhất không thể che tia nào nên bị loại ngay;
+    việc lọc theo từng EMP được làm tiếp trong ObstacleGridIndex.query_rect.
+    """
+    boxes = _obstacle_boxes(obstacles, grid)
+    return spatial_index.ObstacleGridIndex(boxes, min_top=_index_min_top(emps, user_altitude))
+
+
+def _index_min_top(emps, user_altitude):
+    """Độ cao đỉnh mà vật cản không vượt quá thì chắc chắn không che được EMP nào."""
+    emp_heights = [emp.height for emp in emps]
+    return min(user_altitude, min(emp_heights)) if emp_heights else None
+
+
+# Các cách kiểm tra che khuất của backend vector hóa:
+# - "rays": thử slab từng tia với các hộp (kết quả trùng backend reference)
+# - "shadow": tô đa giác bóng che của từng hộp (xem shadow_occlusion.py)
+# - "heightmap": đi theo tia trên bản đồ độ cao 2.5D (xem heightmap_occlusion.py),
+#   gần đúng theo độ phân giải lưới, hợp với khu đô thị có rất nhiều công trình nhỏ
+OCCLUSION_MODES = ("rays", "shadow", "heightmap")
+
+
+def _check_occlusion_mode(occlusion):
+    if occlusion not in OCCLUSION_MODES:
+        raise ValueError(f"Không có cách kiểm tra che khuất '{occlusion}'. Các lựa chọn: {', '.join(OCCLUSION_MODES)}")
+
+
+def _calculate_emp_field_vectorized(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), occlusion="rays",
+                                    stats=None):
+    """
+    Backend "vectorized": tính toàn bộ vùng ảnh hưởng của mỗi EMP bằng phép toán mảng
+    (khoảng cách, E = sqrt(30P/d^2), kiểm tra che khuất, lấy max) thay cho vòng lặp từng ô.
+    Kết quả trùng với backend reference trong sai số dấu phẩy động.
+    - occlusion: một trong OCCLUSION_MODES
+    - stats: FieldStats tùy chọn, xem calculate_emp_field(..., return_stats=True)
+    """
+    _check_occlusion_mode(occlusion)
+    with profiling.phase(stats, 'setup'):
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        result_grid = np.zeros((grid.height, grid.width))
+    with profiling.phase(stats, 'index'):
+        index = _build_obstacle_index(obstacles, grid, emps, user_altitude)
+        heightmap = heightmap_occlusion.get_heightmap(obstacles, bounds, grid_size, grid) if occlusion == "heightmap" else None
+
+    for emp in emps:
+        footprint = _emp_field_block(emp, grid, index, user_altitude, occlusion=occlusion, heightmap=heightmap,
+                                     stats=stats)
+        if footprint is None:
+            continue
+        with profiling.phase(stats, 'merge'):
+            (j_min, j_max, i_min, i_max), block = footprint
+            window = result_grid[j_min:j_max, i_min:i_max]
+            np.maximum(window, block, out=window)
+
+    return result_grid
+
+
+def calculate_emp_field_volume(emps, obstacles, altitudes, bounds, grid_size=(200, 200), occlusion="rays",
+                               progress=None):
+    """
+    Tính trường cho nhiều độ cao xét trong một lượt.
+    - altitudes: danh sách độ cao (mét)
+    - progress: callback tùy chọn progress(done, total), gọi sau mỗi EMP
+    Trả về mảng (n_alt, height, width); lát thứ k trùng với
+    calculate_emp_field(..., altitudes[k], ..., backend="vectorized").
+    Phần việc chung (chiếu tọa độ, chỉ mục vật cản, vùng ảnh hưởng, phân nhóm tia)
+    chỉ làm một lần, chỉ phần kiểm tra che khuất thay đổi theo độ cao.
+    """
+    _check_occlusion_mode(occlusion)
+    altitudes = [float(a) for a in altitudes]
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    volume = np.zeros((len(altitudes), grid.height, grid.width))
+    if not altitudes:
+        return volume
+    index = _build_obstacle_index(obstacles, grid, emps, min(altitudes))
+    heightmap = heightmap_occlusion.get_heightmap(obstacles, bounds, grid_size, grid) if occlusion == "heightmap" else None
+
+    for n, emp in enumerate(emps):
+        footprint = _emp_field_blocks(emp, grid, index, altitudes, occlusion=occlusion, heightmap=heightmap)
+        if footprint is not None:
+            (j_min, j_max, i_min, i_max), blocks = footprint
+            for k, block in enumerate(blocks):
+                window = volume[k, j_min:j_max, i_min:i_max]
+                np.maximum(window, block, out=window)
+        if progress is not None:
+            progress(n + 1, len(emps))
+
+    return volume
+
+
+def calculate_emp_field_sparse(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), occlusion="rays",
+                               block_size=sparse_field.DEFAULT_BLOCK_SIZE, stats=None):
+    """
+    Như backend "vectorized" nhưng trả về SparseField (xem sparse_field.py) thay cho lưới dày:
+    chỉ các khối nằm trong vùng ảnh hưởng của EMP mới được cấp phát, nên có thể tính
+    vùng bản đồ rất rộng ở độ phân giải cao. Dùng to_dense() khi cần vẽ.
+    """
+    _check_occlusion_mode(occlusion)
+    with profiling.phase(stats, 'setup'):
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        field = sparse_field.SparseField((grid.height, grid.width), block_size)
+    with profiling.phase(stats, 'index'):
+        index = _build_obstacle_index(obstacles, grid, emps, user_altitude)
+        heightmap = heightmap_occlusion.get_heightmap(obstacles, bounds, grid_size, grid) if occlusion == "heightmap" else None
+
+    for emp in emps:
+        footprint = _emp_field_block(emp, grid, index, user_altitude, occlusion=occlusion, heightmap=heightmap,
+                                     stats=stats)
+        if footprint is None:
+            continue
+        with profiling.phase(stats, 'merge'):
+            (j_min, j_max, i_min, i_max), block = footprint
+            field.merge_block(j_min, i_min, block)
+
+    return field
+
+
+# Cạnh (số ô) của một ô vuông khi tính và vẽ theo từng phần
+DEFAULT_TILE_SIZE = 64
+
+
+def _footprint_windows(emps, grid):
+    """Danh sách (emp, vùng ảnh hưởng) của các EMP có công suất dương và nằm trong lưới."""
+    windows = []
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        window = _emp_footprint_window(emp, grid)
+        if window[0] < window[1] and window[2] < window[3]:
+            windows.append((emp, window))
+    return windows
+
+
+def _windows_overlap(a, b):
+    return a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]
+
+
+def plan_field_tiles(emps, bounds, grid_size=(200, 200), tile_size=DEFAULT_TILE_SIZE):
+    """
+    Chia lưới thành các ô vuông tile_size x tile_size và trả về danh sách (j_min, j_max, i_min, i_max)
+    của các ô chạm vùng ảnh hưởng của ít nhất một EMP (các ô còn lại luôn bằng 0).
+    Ô gần tâm khung nhìn hoặc gần một EMP đứng trước, để phần người dùng đang nhìn hiện ra sớm nhất.
+    """
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    windows = [window for _, window in _footprint_windows(emps, grid)]
+    # Các điểm ưu tiên theo chỉ số lưới (j, i): tâm khung nhìn và vị trí các EMP
+    focus = [((grid.height - 1) / 2, (grid.width - 1) / 2)]
+    for emp in emps:
+        if emp.power > 0:
+            emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+            focus.append((np.interp(emp_y, grid.ys, np.arange(grid.height)),
+                          np.interp(emp_x, grid.xs, np.arange(grid.width))))
+
+    tiles = []
+    for j_min in range(0, grid.height, tile_size):
+        for i_min in range(0, grid.width, tile_size):
+            tile = (j_min, min(j_min + tile_size, grid.height), i_min, min(i_min + tile_size, grid.width))
+            if not any(_windows_overlap(tile, window) for window in windows):
+                continue
+            center_j, center_i = (tile[0] + tile[1] - 1) / 2, (tile[2] + tile[3] - 1) / 2
+            priority = min((center_j - j) ** 2 + (center_i - i) ** 2 for j, i in focus)
+            tiles.append((priority, tile))
+    tiles.sort(key=lambda item: item[0])
+    return [tile for _, tile in tiles]
+
+
+def iter_emp_field_tiles(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), tile_size=DEFAULT_TILE_SIZE,
+                         occlusion="rays", tiles=None, stats=None):
+    """
+    Tính lưới kết quả theo từng ô vuông và trả về dần (generator) từng ô đã xong:
+    mỗi phần tử là ((j_min, j_max, i_min, i_max), data) với data là lưới con đã gộp mọi EMP,
+    trùng với result_grid[j_min:j_max, i_min:i_max] của backend "vectorized".
+    - tiles: danh sách ô cần tính, mặc định là plan_field_tiles(...) (thứ tự ưu tiên);
+      ô không có trong danh sách luôn bằng 0
+    """
+    _check_occlusion_mode(occlusion)
+    if tiles is None:
+        tiles = plan_field_tiles(emps, bounds, grid_size, tile_size)
+    with profiling.phase(stats, 'setup'):
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        windows = _footprint_windows(emps, grid)
+    with profiling.phase(stats, 'index'):
+        index = _build_obstacle_index(obstacles, grid, emps, user_altitude)
+        heightmap = heightmap_occlusion.get_heightmap(obstacles, bounds, grid_size, grid) if occlusion == "heightmap" else None
+
+    for tile in tiles:
+        j0, j1, i0, i1 = tile
+        data = np.zeros((j1 - j0, i1 - i0))
+        for emp, window in windows:
+            if not _windows_overlap(tile, window):
+                continue
+            footprint = _emp_field_block(emp, grid, index, user_altitude, clip=tile, occlusion=occlusion,
+                                         heightmap=heightmap, stats=stats)
+            if footprint is None:
+                continue
+            with profiling.phase(stats, 'merge'):
+                (j_min, j_max, i_min, i_max), block = footprint
+                part = data[j_min - j0:j_max - j0, i_min - i0:i_max - i0]
+                np.maximum(part, block, out=part)
+        if stats is not None:
+            stats.count('tiles')
+        yield tile, data
+
+
+# Các ngưỡng (V/m) chia lớp hiển thị: lớp 0 dưới 10, lớp 1 từ 10 đến 50, lớp 2 từ 50 trở lên
+CLASS_LEVELS = (10, 50)
+
+
+def classify_field(field, levels=CLASS_LEVELS):
+    """Chuyển lưới cường độ trường (float) sang lưới lớp uint8 theo các ngưỡng levels."""
+    return np.digitize(field, sorted(levels)).astype(np.uint8)
+
+
+def calculate_emp_classes(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), levels=CLASS_LEVELS,
+                          occlusion="rays", stats=None):
+    """
+    Chế độ phân lớp: trả về trực tiếp lưới lớp uint8 (height, width), trùng với
+    classify_field(calculate_emp_field(..., backend="vectorized"), levels) nhưng không tính trường float.
+    Với mỗi EMP, E >= L khi và chỉ khi khoảng cách ngang d thỏa d^2 <= 30P/L^2 - dz^2,
+    nên lớp khi không bị che chỉ cần so d^2 với các bán kính giải tích, không cần sqrt.
+    Chỉ kiểm tra che khuất ở những ô mà EMP này có thể nâng lớp so với các EMP đã xét;
+    EMP mạnh được xét trước để các EMP sau bỏ qua được nhiều ô hơn.
+    - levels: các ngưỡng (V/m) tăng dần, tối đa 255 ngưỡng
+    - occlusion: một trong OCCLUSION_MODES
+    - stats: FieldStats tùy chọn, thêm bộ đếm classified (ô có lớp > 0) và skipped (ô không cần kiểm tra che khuất)
+    """
+    _check_occlusion_mode(occlusion)
+    levels = sorted(float(level) for level in levels)
+    if not levels or levels[0] <= 0 or len(levels) > 255:
+        raise ValueError("Các ngưỡng phân lớp phải là từ 1 đến 255 số dương.")
+    with profiling.phase(stats, 'setup'):
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        classes = np.zeros((grid.height, grid.width), dtype=np.uint8)
+    with profiling.phase(stats, 'index'):
+        index = _build_obstacle_index(obstacles, grid, emps, user_altitude)
+        heightmap = heightmap_occlusion.get_heightmap(obstacles, bounds, grid_size, grid) if occlusion == "heightmap" else None
+
+    for emp in sorted(emps, key=lambda e: -e.power):
+        if emp.power <= 0:
+            continue
+        emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+        emp_pos = np.array([emp_x, emp_y, emp.height])
+        dz = emp.height - user_altitude
+        # Bình phương bán kính ngang tại đó E bằng từng ngưỡng
+        radii_sq = [30 * emp.power / (level * level) - dz * dz for level in levels]
+        if radii_sq[0] < 0:
+            continue
+        # Vùng ảnh hưởng theo ngưỡng thấp nhất, cùng cách làm tròn và hệ số an toàn như _emp_footprint_window
+        j_min, j_max, i_min, i_max = _emp_window(emp_x, emp_y, math.sqrt(30 * emp.power) / levels[0] * 1.1, grid)
+        if j_min >= j_max or i_min >= i_max:
+            continue
+
+        with profiling.phase(stats, 'projection'):
+            sub_xs = grid.xs[i_min:i_max]
+            sub_ys = grid.ys[j_min:j_max]
+            dx = emp_x - sub_xs
+            dy = emp_y - sub_ys
+            horizontal_sq = dy[:, None] * dy[:, None] + dx[None, :] * dx[None, :]
+
+        with profiling.phase(stats, 'field'):
+            potential = np.zeros(horizontal_sq.shape, dtype=np.uint8)
+            for radius_sq in radii_sq:
+                potential += horizontal_sq <= radius_sq
+            window = classes[j_min:j_max, i_min:i_max]
+            # Chỉ những ô mà EMP này có thể nâng lớp mới cần kiểm tra che khuất
+            need = potential > window
+        rows, cols = np.nonzero(need)
+        if stats is not None:
+            stats.count('cells', horizontal_sq.size, emp)
+            stats.count('skipped', horizontal_sq.size - rows.size, emp)
+        if rows.size == 0:
+            continue
+
+        occluded = None
+        with profiling.phase(stats, 'occlusion'):
+            if occlusion == "heightmap":
+                occluded = heightmap.occluded(emp_pos, rows + j_min, cols + i_min, user_altitude)
+            else:
+                px = sub_xs[cols]
+                py = sub_ys[rows]
+                candidates = index.query_rect(
+                    min(emp_x, px.min()), min(emp_y, py.min()), max(emp_x, px.max()), max(emp_y, py.max()),
+                    z_lo=min(emp.height, user_altitude), z_hi=max(emp.height, user_altitude)
+                )
+                if stats is not None:
+                    stats.count('candidate_boxes', candidates.size, emp)
+                if candidates.size and occlusion == "rays":
+                    sectors = spatial_index.RaySectors(emp_pos, px, py, index.boxes[candidates])
+                    occluded = sectors.occluded(user_altitude, stats=stats, emp=emp)
+                elif candidates.size and occlusion == "shadow":
+                    occluded = shadow_occlusion.shadow_mask(emp_pos, sub_xs, sub_ys, index.boxes[candidates],
+                                                            user_altitude)[rows, cols]
+
+        with profiling.phase(stats, 'merge'):
+            if occluded is not None:
+                visible = ~occluded
+                rows, cols = rows[visible], cols[visible]
+                if stats is not None:
+                    stats.count('occluded', np.count_nonzero(occluded), emp)
+            window[rows, cols] = potential[rows, cols]
+
+    if stats is not None:
+        stats.count('classified', np.count_nonzero(classes))
+    return classes
+
+
+def _calculate_emp_field_jit(emps, obstacles, user_altitude, bounds, grid_size=(200, 200)):
+    """Backend "jit" (xem jit_kernels.py); module chỉ được nạp khi backend này được dùng."""
+    import jit_kernels
+    return jit_kernels.calculate_emp_field_jit(emps, obstacles, user_altitude, bounds, grid_size)
+
+
+def _calculate_emp_field_parallel(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), **options):
+    """Backend "parallel" (xem parallel_engine.py); module chỉ được nạp khi backend này được dùng."""
+    import parallel_engine
+    return parallel_engine.calculate_emp_field_parallel(emps, obstacles, user_altitude, bounds, grid_size, **options)
+
+
+def _calculate_emp_field_shadow(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), stats=None):
+    """Backend "shadow": backend vectorized với che khuất bằng đa giác bóng che."""
+    return _calculate_emp_field_vectorized(emps, obstacles, user_altitude, bounds, grid_size,
+                                           occlusion="shadow", stats=stats)
+
+
+def _calculate_emp_field_heightmap(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), stats=None):
+    """Backend "heightmap": backend vectorized với che khuất trên bản đồ độ cao."""
+    return _calculate_emp_field_vectorized(emps, obstacles, user_altitude, bounds, grid_size,
+                                           occlusion="heightmap", stats=stats)
+
+
+# Các backend tính toán đã đăng ký: tên -> {'func', 'exact', 'description', 'supports_stats'}
+_BACKENDS = {}
+
+
+def register_backend(name, func, exact=True, description="", supports_stats=False):
+    """
+    Đăng ký một backend tính toán; func có cùng chữ ký với calculate_emp_field.
+    - exact: True nếu kết quả trùng backend reference trong sai số dấu phẩy động;
+      backend gần đúng (exact=False) chỉ được dùng khi gọi đích danh, không bao giờ được chọn tự động
+    - description: mô tả ngắn, dùng trong báo cáo so sánh
+    - supports_stats: func nhận tham số stats (FieldStats) để đo chi tiết từng pha và từng EMP
+    """
+    _BACKENDS[name] = {'func': func, 'exact': exact, 'description': description, 'supports_stats': supports_stats}
+
+
+def available_backends(exact_only=False):
+    """Danh sách tên các backend đã đăng ký."""
+    return sorted(name for name, info in _BACKENDS.items() if info['exact'] or not exact_only)
+
+
+def backend_info(name):
+    """Thông tin đăng ký (func, exact, description) của một backend."""
+    if name not in _BACKENDS:
+        raise ValueError(f"Không có backend tính toán '{name}'. Các backend hiện có: {', '.join(available_backends())}")
+    return _BACKENDS[name]
+
+
+register_backend("reference", _calculate_emp_field_reference, description="Vòng lặp gốc duyệt từng ô")
+register_backend("vectorized", _calculate_emp_field_vectorized, description="NumPy theo vùng ảnh hưởng của từng EMP",
+                 supports_stats=True)
+register_backend("parallel", _calculate_emp_field_parallel, description="Process pool + shared memory")
+register_backend("jit", _calculate_emp_field_jit, description="Kernel numba song song theo hàng")
+register_backend("shadow", _calculate_emp_field_shadow, exact=False,
+                 description="Tô đa giác bóng che (lệch được ở ô nằm đúng trên biên bóng)", supports_stats=True)
+register_backend("heightmap", _calculate_emp_field_heightmap, exact=False,
+                 description="Đi theo tia trên bản đồ độ cao, gần đúng theo độ phân giải lưới", supports_stats=True)
+
+# Ngưỡng chọn backend tự động theo khối lượng việc ước lượng
+# (tổng số ô trong vùng ảnh hưởng của các EMP x (số vật cản + 1))
+AUTO_SMALL_WORK = 2e5      # Dưới ngưỡng này chi phí khởi tạo lớn hơn lợi ích, dùng "vectorized"
+AUTO_PARALLEL_WORK = 5e7   # Từ ngưỡng này mới đáng chia việc cho process pool
+
+
+def estimate_work(emps, obstacles, bounds, grid_size):
+    """Ước lượng khối lượng việc của một lần tính toán (đơn vị: số cặp ô x vật cản)."""
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    cells = 0
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        j_min, j_max, i_min, i_max = _emp_footprint_window(emp, grid)
+        cells += max(0, j_max - j_min) * max(0, i_max - i_min)
+    return cells * (len(obstacles) + 1)
+
+
+def select_backend(emps, obstacles, bounds, grid_size):
+    """
+    Chọn backend chính xác phù hợp với kích thước cảnh:
+    cảnh nhỏ dùng "vectorized"; cảnh lớn dùng "jit" nếu có numba,
+    nếu không thì "parallel" khi máy có nhiều nhân và cảnh đủ lớn.
+    """
+    work = estimate_work(emps, obstacles, bounds, grid_size)
+    if work < AUTO_SMALL_WORK:
+        return "vectorized"
+    import jit_kernels
+    if jit_kernels.is_available():
+        return "jit"
+    import parallel_engine
+    if parallel_engine.DEFAULT_WORKERS > 1 and work >= AUTO_PARALLEL_WORK:
+        return "parallel"
+    return "vectorized"
+
+
+def calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size=(200, 200), backend="reference",
+                        return_stats=False, **options):
+    """
+    Hàm tính toán chính.
+    - emps: danh sách các đối tượng EMP
+    - obstacles: danh sách các đối tượng Obstacle
+    - user_altitude: độ cao người dùng xét (mét)
+    - bounds: {'lat_max', 'lat_min', 'lon_max', 'lon_min'} của bản đồ
+    - grid_size: độ phân giải của lưới tính toán (height, width)
+    - backend: tên backend đã đăng ký (xem available_backends()), hoặc "auto" để chọn theo kích thước cảnh
+    - return_stats: True để trả về (grid, FieldStats) gồm thời gian từng pha và các bộ đếm;
+      backend không hỗ trợ đo chi tiết chỉ có thời gian tổng
+    - options: tham số riêng của backend được chọn
+    """
+    if backend == "auto":
+        backend = select_backend(emps, obstacles, bounds, grid_size)
+    info = backend_info(backend)
+    if not return_stats:
+        return info['func'](emps, obstacles, user_altitude, bounds, grid_size, **options)
+
+    stats = profiling.FieldStats(backend)
+    if info['supports_stats']:
+        options['stats'] = stats
+    with stats.phase('total'):
+        result_grid = info['func'](emps, obstacles, user_altitude, bounds, grid_size, **options)
+    return result_grid, stats
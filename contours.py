@@ -0,0 +1,251 @@
+# emp_planning_system/contours.py
+
+import numpy as np
+
+import calculations
+import grid_geometry
+
+# Sai số cho phép (đơn vị: ô lưới) khi đơn giản hóa đường bao bằng Douglas-Peucker
+DEFAULT_TOLERANCE = 0.5
+# Bỏ các vòng có diện tích nhỏ hơn ngưỡng này (đơn vị: ô lưới vuông)
+DEFAULT_MIN_AREA = 1.0
+
+# Giá trị thay cho vô cực (tại tâm EMP) khi nội suy vị trí đường bao trên cạnh ô
+_FIELD_CAP = 1e6
+
+# Cạnh của ô (j, i): 0 dưới (j, i)-(j, i+1), 1 phải (j, i+1)-(j+1, i+1), 2 trên (j+1, i+1)-(j+1, i), 3 trái (j+1, i)-(j, i)
+# Góc theo bit của mã ô: 1 = (j, i), 2 = (j, i+1), 4 = (j+1, i+1), 8 = (j+1, i)
+_EDGE_MIDPOINTS = np.array([(0.5, 0), (1, 0.5), (0.5, 1), (0, 0.5)])
+_CORNERS = np.array([(0, 0), (1, 0), (1, 1), (0, 1)])
+
+
+def _segment_table():
+    """
+    Bảng marching squares: mã ô (0..15) -> danh sách đoạn (cạnh đầu, cạnh cuối), và với hai ô yên ngựa (5, 10)
+    thêm bảng thứ hai dùng khi tâm ô nằm trên ngưỡng. Mỗi đoạn được định hướng để vùng trên ngưỡng
+    nằm bên trái, nên vòng ngoài ngược chiều kim đồng hồ và lỗ thuận chiều (như GeoJSON).
+    """
+    def oriented(code, e1, e2):
+        # Cạnh e nối góc e với góc e + 1. Góc kiểm tra: góc chung nếu hai cạnh kề nhau,
+        # góc đầu của cạnh e1 nếu hai cạnh đối diện
+        corner = e2 if (e1 + 1) % 4 == e2 else e1
+        p1, p2, c = _EDGE_MIDPOINTS[e1], _EDGE_MIDPOINTS[e2], _CORNERS[corner]
+        cross = (p2[0] - p1[0]) * (c[1] - p1[1]) - (p2[1] - p1[1]) * (c[0] - p1[0])
+        inside = bool(code & (1 << corner))
+        return (e1, e2) if (cross > 0) == inside else (e2, e1)
+
+    table, saddle_inside = {}, {}
+    for code in range(16):
+        crossed = [e for e in range(4) if bool(code & (1 << e)) != bool(code & (1 << ((e + 1) % 4)))]
+        if len(crossed) == 2:
+            table[code] = [oriented(code, *crossed)]
+        elif len(crossed) == 4:
+            # Tâm dưới ngưỡng: tách rời các góc trên ngưỡng; tâm trên ngưỡng: tách rời các góc dưới ngưỡng
+            inside_corners = [k for k in range(4) if code & (1 << k)]
+            outside_corners = [k for k in range(4) if not code & (1 << k)]
+            table[code] = [oriented(code, (k - 1) % 4, k) for k in inside_corners]
+            saddle_inside[code] = [oriented(code, (k - 1) % 4, k) for k in outside_corners]
+    return table, saddle_inside
+
+
+_SEGMENTS, _SADDLE_SEGMENTS = _segment_table()
+
+
+def trace_iso_rings(grid_data, level):
+    """
+    Các vòng khép kín của đường đồng mức level trên lưới (marching squares), trong tọa độ chỉ số
+    (x = cột i, y = hàng j, có thể lẻ). Lưới được bao thêm một viền dưới ngưỡng nên mọi vòng đều khép kín.
+    Vòng ngoài của vùng >= level ngược chiều kim đồng hồ, lỗ thuận chiều kim đồng hồ.
+    Trả về danh sách mảng (n, 2), điểm đầu lặp lại ở cuối.
+    """
+    h, w = np.shape(grid_data)
+    values = np.full((h + 2, w + 2), level - 1.0)
+    np.minimum(grid_data, _FIELD_CAP, out=values[1:-1, 1:-1])
+    above = (values >= level).view(np.uint8)
+    code = above[:-1, :-1] | (above[:-1, 1:] << 1) | (above[1:, 1:] << 2) | (above[1:, :-1] << 3)
+
+    ph, pw = values.shape
+    n_h = ph * pw  # Khóa cạnh ngang (j, i)-(j, i+1): j * pw + i; cạnh dọc (j, i)-(j+1, i): n_h + j * pw + i
+
+    def edge_keys(jj, ii, edge):
+        if edge == 0:
+            return jj * pw + ii
+        if edge == 1:
+            return n_h + jj * pw + ii + 1
+        if edge == 2:
+            return (jj + 1) * pw + ii
+        return n_h + jj * pw + ii
+
+    # Chỉ các ô có góc ở hai phía ngưỡng mới có đoạn đường bao
+    cells = np.flatnonzero((code != 0) & (code != 15))
+    cell_codes = code.ravel()[cells]
+    cell_j, cell_i = np.divmod(cells, code.shape[1])
+    starts, ends = [], []
+    for case, segments in _SEGMENTS.items():
+        selected = cell_codes == case
+        jj, ii = cell_j[selected], cell_i[selected]
+        if not jj.size:
+            continue
+        if case in _SADDLE_SEGMENTS:
+            center = (values[jj, ii] + values[jj, ii + 1] + values[jj + 1, ii + 1] + values[jj + 1, ii]) / 4
+            joined = center >= level
+            for e1, e2 in _SADDLE_SEGMENTS[case]:
+                starts.append(edge_keys(jj[joined], ii[joined], e1))
+                ends.append(edge_keys(jj[joined], ii[joined], e2))
+            jj, ii = jj[~joined], ii[~joined]
+        for e1, e2 in segments:
+            starts.append(edge_keys(jj, ii, e1))
+            ends.append(edge_keys(jj, ii, e2))
+    if not starts:
+        return []
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+
+    # Vị trí điểm cắt trên từng cạnh (nội suy tuyến tính giữa hai nút), trừ đi viền 1 ô
+    def edge_points(keys):
+        vertical = keys >= n_h
+        local = np.where(vertical, keys - n_h, keys)
+        j, i = np.divmod(local, pw)
+        j2 = np.where(vertical, j + 1, j)
+        i2 = np.where(vertical, i, i + 1)
+        v1, v2 = values[j, i], values[j2, i2]
+        t = np.clip((level - v1) / (v2 - v1), 0, 1)
+        return np.column_stack([i + (i2 - i) * t - 1, j + (j2 - j) * t - 1])
+
+    points = edge_points(starts)
+    row = {key: n for n, key in enumerate(starts.tolist())}
+    following = dict(zip(starts.tolist(), ends.tolist()))
+
+    # Nối các đoạn: mỗi điểm cắt là điểm cuối của đúng một đoạn và điểm đầu của đúng một đoạn
+    rings = []
+    while following:
+        first, key = following.popitem()
+        ring = [row[first]]
+        while key != first:
+            ring.append(row[key])
+            key = following.pop(key)
+        ring.append(row[first])
+        rings.append(points[ring])
+    return rings
+
+
+def ring_area(ring):
+    """Diện tích có dấu của vòng (công thức shoelace): dương nếu ngược chiều kim đồng hồ."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def simplify_ring(ring, tolerance=DEFAULT_TOLERANCE):
+    """Đơn giản hóa vòng khép kín bằng Douglas-Peucker, giữ điểm đầu/cuối và điểm xa nó nhất."""
+    n = len(ring)
+    if n <= 4 or tolerance <= 0:
+        return ring
+    # Chia vòng tại điểm xa điểm đầu nhất để hai nửa đều là đường hở
+    far = int(np.argmax(np.sum((ring - ring[0]) ** 2, axis=1)))
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, far, n - 1]] = True
+    stack = [(0, far), (far, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        segment = ring[b] - ring[a]
+        length = np.hypot(segment[0], segment[1])
+        offsets = ring[a + 1:b] - ring[a]
+        if length > 0:
+            distance = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        else:
+            distance = np.hypot(offsets[:, 0], offsets[:, 1])
+        k = int(np.argmax(distance))
+        if distance[k] > tolerance:
+            keep[a + 1 + k] = True
+            stack += [(a, a + 1 + k), (a + 1 + k, b)]
+    return ring[keep]
+
+
+def _contains(ring, point):
+    """Điểm point có nằm trong vòng ring không (tia ngang, chẵn-lẻ)."""
+    x, y = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    crosses = (y > point[1]) != (y2 > point[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x + (point[1] - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(crosses & (point[0] < x_cross)) % 2)
+
+
+def iso_polygons(grid_data, level, tolerance=DEFAULT_TOLERANCE, min_area=DEFAULT_MIN_AREA):
+    """
+    Vùng có cường độ >= level dưới dạng danh sách đa giác [vòng ngoài, lỗ 1, lỗ 2, ...] trong tọa độ chỉ số.
+    Các vòng được đơn giản hóa (tolerance ô lưới); vòng có diện tích < min_area ô bị bỏ.
+    """
+    outers, holes = [], []
+    for ring in trace_iso_rings(grid_data, level):
+        ring = simplify_ring(ring, tolerance)
+        area = ring_area(ring)
+        if abs(area) < min_area or len(ring) < 4:
+            continue
+        (outers if area > 0 else holes).append((abs(area), ring))
+
+    # Mỗi lỗ thuộc vòng ngoài nhỏ nhất chứa nó
+    outers.sort(key=lambda item: item[0])
+    polygons = [[ring] for _, ring in outers]
+    for _, hole in holes:
+        for k, (_, outer) in enumerate(outers):
+            if _contains(outer, hole[0]):
+                polygons[k].append(hole)
+                break
+    return polygons
+
+
+def polygon_area(polygon):
+    """Diện tích của đa giác [vòng ngoài, lỗ...] (cùng đơn vị bình phương với tọa độ)."""
+    return abs(ring_area(polygon[0])) - sum(abs(ring_area(hole)) for hole in polygon[1:])
+
+
+def index_to_lonlat(grid, points):
+    """Tọa độ chỉ số (x = i, y = j, có thể lẻ) của grid (GridGeometry) -> mảng (n, 2) (lon, lat)."""
+    x = np.interp(points[:, 0], np.arange(grid.width), grid.xs)
+    y = np.interp(points[:, 1], np.arange(grid.height), grid.ys)
+    lon, lat = grid.xy_to_lonlat(x, y)
+    return np.column_stack([lon, lat])
+
+
+def field_contours(grid_data, bounds, levels=calculations.CLASS_LEVELS, tolerance=DEFAULT_TOLERANCE,
+                   min_area=DEFAULT_MIN_AREA):
+    """
+    Đường bao các vùng >= từng ngưỡng trong levels của lưới kết quả trên vùng bounds.
+    Trả về GeoJSON FeatureCollection (dict): mỗi ngưỡng một Feature MultiPolygon (lon, lat)
+    với properties level (V/m) và area_m2 (diện tích vùng, m²).
+    """
+    grid = grid_geometry.get_grid_geometry(bounds, grid_data.shape)
+    # Kích thước một ô lưới (m) giữa hai nút kề nhau, để quy diện tích từ ô lưới sang m²
+    cell_x = (grid.xs[-1] - grid.xs[0]) / (grid.width - 1) if grid.width > 1 else 0.0
+    cell_y = (grid.ys[-1] - grid.ys[0]) / (grid.height - 1) if grid.height > 1 else 0.0
+    features = []
+    for level in sorted(levels):
+        polygons = iso_polygons(grid_data, level, tolerance, min_area)
+        coordinates = [[np.round(index_to_lonlat(grid, ring), 7).tolist() for ring in polygon]
+                       for polygon in polygons]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'MultiPolygon', 'coordinates': coordinates},
+            'properties': {
+                'level': level,
+                'area_m2': float(sum(polygon_area(polygon) for polygon in polygons) * cell_x * cell_y),
+            },
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def zone_areas(contours):
+    """
+    Diện tích (m²) từng vùng từ kết quả field_contours: danh sách (ngưỡng dưới, ngưỡng trên hoặc None, diện tích),
+    trong đó vùng [L_k, L_k+1) = diện tích >= L_k trừ diện tích >= L_k+1.
+    """
+    features = sorted(contours['features'], key=lambda f: f['properties']['level'])
+    zones = []
+    for k, feature in enumerate(features):
+        upper = features[k + 1] if k + 1 < len(features) else None
+        area = feature['properties']['area_m2'] - (upper['properties']['area_m2'] if upper else 0.0)
+        zones.append((feature['properties']['level'], upper['properties']['level'] if upper else None, max(area, 0.0)))
+    return zones
@@ -0,0 +1,129 @@
+# emp_planning_system/field_tiles.py
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import calculations
+import grid_geometry
+from heatmap_renderer import HeatmapRenderer
+from result_cache import scene_key
+
+# Cạnh (pixel) của một tile, như các tile nền trong web/tiles
+TILE_SIZE = 256
+DEFAULT_MEMORY_BUDGET = 128 * 1024 * 1024   # bytes
+# Số cảnh gần nhất được giữ lại để tile của chúng còn phục vụ được (ví dụ khi hoàn tác một thay đổi)
+MAX_SCENES = 8
+
+
+def _tile_lat(z, row):
+    """Vĩ độ của hàng tile row (có thể lẻ) ở mức zoom z (phép chiếu ngược Web-Mercator)."""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / 2 ** z))))
+
+
+def tile_bounds(z, x, y):
+    """Biên (lat/lon) của tile Web-Mercator z/x/y theo quy ước XYZ (y = 0 ở phía bắc)."""
+    n = 2 ** z
+    return {'lat_min': _tile_lat(z, y + 1), 'lat_max': _tile_lat(z, y),
+            'lon_min': x / n * 360 - 180, 'lon_max': (x + 1) / n * 360 - 180}
+
+
+def tile_grid_bounds(z, x, y, tile_size=TILE_SIZE):
+    """
+    Biên dùng để tính lưới tile_size x tile_size cho tile z/x/y: các nút lưới nằm đúng tâm các pixel.
+    Lưới chia đều theo vĩ độ còn tile chia đều theo Mercator; ở các mức zoom của bản đồ (>= 11)
+    chênh lệch trong một tile nhỏ hơn nhiều so với một pixel.
+    """
+    edges = tile_bounds(z, x, y)
+    half = 0.5 / tile_size
+    d_lon = edges['lon_max'] - edges['lon_min']
+    return {
+        'lat_min': _tile_lat(z, y + 1 - half), 'lat_max': _tile_lat(z, y + half),
+        'lon_min': edges['lon_min'] + d_lon * half, 'lon_max': edges['lon_max'] - d_lon * half,
+    }
+
+
+class FieldTileService:
+    """
+    Tính và vẽ trường EMP theo từng tile Web-Mercator (z/x/y) khi được yêu cầu, để bản đồ hiển thị
+    như một lớp tile bình thường: kéo/zoom chỉ tính các tile mới hiện ra.
+    - set_scene(...) ghi nhận một cảnh (EMP, vật cản, độ cao, ngưỡng màu) và trả về băm của nó (result_cache.scene_key);
+      URL của tile chứa băm này nên cảnh mới có tile mới, cảnh cũ vẫn dùng lại được tile đã vẽ.
+    - tile(scene, z, x, y) trả về ảnh PNG (bytes) của tile, lấy từ cache LRU (giới hạn memory_budget bytes)
+      hoặc tính mới; None nếu cảnh không còn được giữ.
+    An toàn khi gọi từ nhiều luồng.
+    """
+    def __init__(self, renderer=None, tile_size=TILE_SIZE, memory_budget=DEFAULT_MEMORY_BUDGET, occlusion="rays"):
+        self.renderer = renderer if renderer is not None else HeatmapRenderer()
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        self.occlusion = occlusion
+        self._scenes = OrderedDict()   # băm cảnh -> (emps, obstacles, user_altitude, renderer)
+        self._tiles = OrderedDict()    # (băm cảnh, z, x, y) -> bytes PNG
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._empty = self.renderer.encode(np.zeros((tile_size, tile_size)))
+        self.hits = 0
+        self.computed = 0
+
+    def set_scene(self, emps, obstacles, user_altitude, levels=None):
+        """
+        Ghi nhận cảnh hiện tại (sao chép danh sách) và trả về băm của nó.
+        levels: ngưỡng giữa các dải màu (như HeatmapRenderer), None là ngưỡng của self.renderer.
+        """
+        emps, obstacles = list(emps), list(obstacles)
+        if levels is None:
+            renderer = self.renderer
+        else:
+            renderer = HeatmapRenderer(levels=levels, iso_levels=levels[1:])
+        key = scene_key(emps, obstacles, user_altitude, {}, (self.tile_size, self.tile_size),
+                        extra=('tiles', self.occlusion, renderer.levels.tolist()))
+        with self._lock:
+            self._scenes[key] = (emps, obstacles, user_altitude, renderer)
+            self._scenes.move_to_end(key)
+            while len(self._scenes) > MAX_SCENES:
+                self._scenes.popitem(last=False)
+        return key
+
+    def tile(self, scene, z, x, y):
+        """Ảnh PNG (bytes) của tile z/x/y trong cảnh có băm scene, hoặc None nếu cảnh không còn được giữ."""
+        key = (scene, z, x, y)
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return data
+            scene_data = self._scenes.get(scene)
+        if scene_data is None:
+            return None
+
+        # Tính ngoài khóa để nhiều tile được tính song song
+        data = self._render_tile(*scene_data, z, x, y)
+        with self._lock:
+            self.computed += 1
+            if key not in self._tiles:
+                self._tiles[key] = data
+                self._bytes += len(data)
+            while len(self._tiles) > 1 and self._bytes > self.memory_budget:
+                _, old = self._tiles.popitem(last=False)
+                self._bytes -= len(old)
+        return data
+
+    def _render_tile(self, emps, obstacles, user_altitude, renderer, z, x, y):
+        bounds = tile_grid_bounds(z, x, y, self.tile_size)
+        grid_size = (self.tile_size, self.tile_size)
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        # Tile nằm ngoài vùng ảnh hưởng của mọi EMP: ảnh trong suốt, không cần tính
+        if not calculations._footprint_windows(emps, grid):
+            return self._empty
+        field = calculations.calculate_emp_field(emps, obstacles, user_altitude, bounds, grid_size,
+                                                 backend="vectorized", occlusion=self.occlusion)
+        return renderer.encode(field)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
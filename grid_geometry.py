@@ -0,0 +1,101 @@
+# emp_planning_system/grid_geometry.py
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+# Import dạng module để tránh vòng lặp import với calculations.py
+import calculations
+
+# Số hình học lưới giữ lại trong cache (mỗi cặp vùng bản đồ + kích thước lưới một bản)
+GEOMETRY_CACHE_SIZE = 16
+
+_geometry_cache = OrderedDict()
+_geometry_lock = threading.Lock()  # Cache được dùng từ nhiều luồng (luồng tính toán, các luồng vẽ tile)
+
+
+@dataclass(frozen=True, eq=False)
+class GridGeometry:
+    """
+    Hình học của lưới tính toán cho một (bounds, grid_size): gốc tọa độ, vector tọa độ X (theo cột)
+    và Y (theo hàng) đã chiếu sang mét, cùng kích thước vật lý của một ô lưới.
+    Được dùng chung (chỉ đọc) giữa các EMP, các độ cao, các lần tính toán và các bộ vẽ.
+    """
+    bounds: dict
+    origin_lon: float
+    origin_lat: float
+    height: int
+    width: int
+    xs: np.ndarray
+    ys: np.ndarray
+    map_min_x: float
+    map_min_y: float
+    cell_width_m: float
+    cell_height_m: float
+
+    @classmethod
+    def from_bounds(cls, bounds, grid_size):
+        origin_lon = (bounds['lon_min'] + bounds['lon_max']) / 2
+        origin_lat = (bounds['lat_min'] + bounds['lat_max']) / 2
+        grid_height, grid_width = grid_size
+        lat_range = np.linspace(bounds['lat_min'], bounds['lat_max'], grid_height)
+        lon_range = np.linspace(bounds['lon_min'], bounds['lon_max'], grid_width)
+
+        # Phép chiếu là tách biến: x chỉ phụ thuộc lon, y chỉ phụ thuộc lat,
+        # nên chỉ cần chiếu 2 vector thay vì từng ô.
+        xs, _ = calculations.lonlat_to_xy_array(origin_lon, origin_lat, lon_range, origin_lat)
+        _, ys = calculations.lonlat_to_xy_array(origin_lon, origin_lat, origin_lon, lat_range)
+        xs.setflags(write=False)
+        ys.setflags(write=False)
+
+        map_min_x, map_min_y = calculations.lonlat_to_xy(origin_lon, origin_lat, bounds['lon_min'], bounds['lat_min'])
+        map_max_x, map_max_y = calculations.lonlat_to_xy(origin_lon, origin_lat, bounds['lon_max'], bounds['lat_max'])
+
+        return cls(
+            bounds=dict(bounds),
+            origin_lon=origin_lon,
+            origin_lat=origin_lat,
+            height=grid_height,
+            width=grid_width,
+            xs=xs,
+            ys=ys,
+            map_min_x=map_min_x,
+            map_min_y=map_min_y,
+            cell_width_m=(map_max_x - map_min_x) / grid_width if grid_width > 0 else 0,
+            cell_height_m=(map_max_y - map_min_y) / grid_height if grid_height > 0 else 0,
+        )
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def lonlat_to_xy(self, lon, lat):
+        """Chiếu (lon, lat) (số hoặc mảng) sang (x, y) mét trong hệ tọa độ của lưới."""
+        return calculations.lonlat_to_xy(self.origin_lon, self.origin_lat, lon, lat)
+
+    def xy_to_lonlat(self, x, y):
+        """Phép chiếu ngược: (x, y) mét (số hoặc mảng) -> (lon, lat)."""
+        return calculations.xy_to_lonlat(self.origin_lon, self.origin_lat, x, y)
+
+    def cell_lonlat(self, j, i):
+        """Tọa độ (lon, lat) của nút lưới (j, i) (số hoặc mảng chỉ số)."""
+        return self.xy_to_lonlat(self.xs[i], self.ys[j])
+
+
+def get_grid_geometry(bounds, grid_size):
+    """Trả về GridGeometry của (bounds, grid_size), dùng lại bản đã tính nếu có."""
+    key = (tuple(sorted(bounds.items())), tuple(grid_size))
+    with _geometry_lock:
+        geometry = _geometry_cache.get(key)
+        if geometry is not None:
+            _geometry_cache.move_to_end(key)
+            return geometry
+
+    geometry = GridGeometry.from_bounds(bounds, grid_size)
+    with _geometry_lock:
+        _geometry_cache[key] = geometry
+        while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+            _geometry_cache.popitem(last=False)
+    return geometry
@@ -0,0 +1,241 @@
+# emp_planning_system/heatmap_renderer.py
+
+import base64
+import io
+
+import numpy as np
+from PIL import Image, features
+
+# Ngưỡng (V/m) giữa các dải màu: không tô | an toàn nhưng có tín hiệu | cảnh báo | nguy hiểm
+DEFAULT_LEVELS = (1, 10, 50)
+# Màu RGBA của từng dải (số màu = số ngưỡng + 1)
+DEFAULT_COLORS = (
+    (0, 0, 0, 0),
+    (0, 255, 0, 100),
+    (255, 165, 0, 120),
+    (255, 0, 0, 150),
+)
+# Các ngưỡng được vẽ đường đồng mức và màu, độ dày (pixel) của đường
+DEFAULT_ISO_LEVELS = (10, 50)
+DEFAULT_LINE_COLOR = (0, 0, 0, 200)
+DEFAULT_LINE_WIDTH = 1.5
+
+# Khoảng log10(E) được lượng tử khi gửi lưới thô sang trang để tô màu phía trình duyệt (0.1 .. 1000 V/m)
+QUANT_LOG_MIN = -1.0
+QUANT_LOG_MAX = 3.0
+
+# Giá trị thay cho vô cực (tại tâm EMP) để nội suy và tính gradient
+_FIELD_CAP = 1e6
+
+
+def quantize_field(grid_data, log_min=QUANT_LOG_MIN, log_max=QUANT_LOG_MAX):
+    """
+    Lượng tử lưới cường độ sang uint8 theo thang log: 0 là không đáng kể (E <= 10**log_min),
+    1..255 phủ đều log10(E) trong [log_min, log_max] (mỗi bước khoảng 1.6% giá trị với khoảng mặc định),
+    giá trị lớn hơn (kể cả vô cực) là 255. Giải mã: log10(E) = log_min + (q - 1) / 254 * (log_max - log_min).
+    """
+    with np.errstate(divide='ignore'):
+        log_field = np.log10(np.asarray(grid_data, dtype=np.float32))
+    q = np.rint((log_field - log_min) * (254 / (log_max - log_min))) + 1
+    quantized = np.clip(q, 1, 255).astype(np.uint8)
+    quantized[~(log_field > log_min)] = 0
+    return quantized
+
+
+class HeatmapRenderer:
+    """
+    Vẽ lưới kết quả thành ảnh lớp phủ chỉ bằng NumPy và Pillow (không dùng matplotlib).
+    Mỗi ô được xếp vào một dải theo các ngưỡng levels rồi tra màu trong bảng LUT dựng sẵn;
+    đường đồng mức (tùy chọn) được làm mượt bằng độ phủ tính từ khoảng cách tới ngưỡng,
+    lượng tử thành ISO_STEPS mức để ảnh vẫn là ảnh palette 1 byte/pixel (mã hóa PNG rất nhanh).
+    Lưới vào theo quy ước của calculations: hàng 0 là phía nam (lat_min).
+    """
+    ISO_STEPS = 4
+
+    def __init__(self, levels=DEFAULT_LEVELS, colors=DEFAULT_COLORS, iso_levels=DEFAULT_ISO_LEVELS,
+                 line_color=DEFAULT_LINE_COLOR, line_width=DEFAULT_LINE_WIDTH):
+        if len(colors) != len(levels) + 1:
+            raise ValueError("Số màu phải bằng số ngưỡng + 1.")
+        if len(colors) * (self.ISO_STEPS + 1) > 256:
+            raise ValueError("Quá nhiều dải màu cho ảnh palette.")
+        self.levels = np.asarray(sorted(levels), dtype=np.float32)
+        self.iso_levels = np.asarray(sorted(iso_levels), dtype=np.float32)
+        self.line_width = float(line_width)
+        self.lut = self._build_lut(np.asarray(colors, dtype=np.float32).reshape(-1, 4),
+                                   np.asarray(line_color, dtype=np.float32))
+        # Bảng màu cho ảnh palette: RGB và độ trong suốt của từng chỉ số
+        self._palette = self.lut[:, :3].ravel().tolist()
+        self._transparency = bytes(self.lut[:, 3].tolist())
+
+    def _build_lut(self, colors, line_color):
+        """
+        Bảng LUT (n_colors * (ISO_STEPS + 1), 4) uint8: chỉ số class + n_colors * q là màu của dải class
+        phủ thêm đường đồng mức với độ phủ q / ISO_STEPS (trộn alpha "over").
+        """
+        lut = []
+        for q in range(self.ISO_STEPS + 1):
+            a = q / self.ISO_STEPS * line_color[3] / 255
+            for color in colors:
+                base_a = color[3] / 255
+                out_a = a + base_a * (1 - a)
+                rgb = (line_color[:3] * a + color[:3] * base_a * (1 - a)) / out_a if out_a > 0 else color[:3]
+                lut.append(list(rgb) + [out_a * 255])
+        return np.clip(np.rint(lut), 0, 255).astype(np.uint8)
+
+    def classify(self, grid_data):
+        """Chỉ số dải màu (uint8) của từng ô: số ngưỡng mà giá trị vượt qua."""
+        classes = np.zeros(grid_data.shape, dtype=np.uint8)
+        for level in self.levels:
+            classes += grid_data > level
+        return classes
+
+    @staticmethod
+    def _axis_weights(n, scale):
+        """
+        Với mỗi pixel mới dọc một trục (n * scale pixel): chỉ số ô cũ lo, hi = lo + 1 và trọng số t
+        để nội suy tuyến tính giữa tâm hai ô cũ (ở mép giữ nguyên giá trị, như ảnh phóng to thông thường).
+        """
+        u = (np.arange(n * scale, dtype=np.float32) + 0.5) / scale - 0.5
+        lo = np.clip(np.floor(u).astype(np.intp), 0, max(n - 2, 0))
+        hi = np.minimum(lo + 1, n - 1)
+        t = np.clip(u - lo, 0, 1).astype(np.float32)
+        return lo, hi, t
+
+    @staticmethod
+    def _edge_pixels(classes, candidates=None):
+        """
+        Chỉ số phẳng của các pixel có lân cận 4 hướng thuộc dải khác.
+        candidates: nếu có, chỉ xét các cặp lân cận có ít nhất một pixel trong danh sách này.
+        """
+        if candidates is None:
+            vertical = classes[1:] != classes[:-1]
+            horizontal = classes[:, 1:] != classes[:, :-1]
+            edge = np.zeros(classes.shape, dtype=bool)
+            edge[1:] |= vertical
+            edge[:-1] |= vertical
+            edge[:, 1:] |= horizontal
+            edge[:, :-1] |= horizontal
+            return np.flatnonzero(edge)
+        h, w = classes.shape
+        flat = classes.ravel()
+        jj, ii = np.divmod(candidates, w)
+        found = []
+        for valid, step in ((jj > 0, -w), (jj < h - 1, w), (ii > 0, -1), (ii < w - 1, 1)):
+            p = candidates[valid]
+            p = p[flat[p] != flat[p + step]]
+            found += [p, p + step]
+        edge = np.sort(np.concatenate(found))
+        return edge[np.concatenate(([True], edge[1:] != edge[:-1]))] if edge.size else edge
+
+    def _iso_steps(self, shape, flat_edge, sample):
+        """
+        Độ phủ của đường đồng mức tại các pixel flat_edge (chỉ số phẳng), lượng tử thành 0..ISO_STEPS.
+        Khoảng cách tới đường được ước lượng bằng |E - L| / |grad E| (tuyến tính hóa cục bộ);
+        sample(jj, ii, True) trả về giá trị trường và gradient (theo pixel) tại các pixel.
+        """
+        jj, ii = np.divmod(flat_edge, shape[1])
+        values, gx, gy = sample(jj, ii, True)
+        offset = np.min(np.abs(values[:, None] - self.iso_levels[None, :]), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distance = offset / np.sqrt(gx * gx + gy * gy)
+        distance = np.nan_to_num(distance, nan=0.0, posinf=np.inf)
+        cover = np.clip(self.line_width / 2 + 0.5 - distance, 0, 1)
+        return np.rint(cover * self.ISO_STEPS).astype(np.uint8)
+
+    def indices(self, grid_data, scale=1, iso_lines=False):
+        """
+        Chỉ số màu trong LUT (uint8) của từng pixel, kích thước (height * scale, width * scale).
+        Khi phóng to (scale > 1) trường được nội suy song tuyến tính, nhưng chỉ trong các ô cũ
+        có bốn góc khác dải: giá trị nội suy nằm giữa giá trị các góc nên ô cùng dải giữ nguyên dải đó.
+        """
+        grid = np.minimum(np.asarray(grid_data, dtype=np.float32), _FIELD_CAP)
+        coarse = self.classify(grid)
+        h, w = grid.shape
+        if scale == 1:
+            classes = coarse
+
+            def sample(jj, ii, gradient=False):
+                if not gradient:
+                    return grid[jj, ii]
+                # Sai phân trung tâm
+                gy = (grid[np.minimum(jj + 1, h - 1), ii] - grid[np.maximum(jj - 1, 0), ii]) / 2
+                gx = (grid[jj, np.minimum(ii + 1, w - 1)] - grid[jj, np.maximum(ii - 1, 0)]) / 2
+                return grid[jj, ii], gx, gy
+        else:
+            lo_j, hi_j, t_j = self._axis_weights(h, scale)
+            lo_i, hi_i, t_i = self._axis_weights(w, scale)
+
+            def sample(jj, ii, gradient=False):
+                tj, ti = t_j[jj], t_i[ii]
+                rows_lo, rows_hi, cols_lo, cols_hi = lo_j[jj], hi_j[jj], lo_i[ii], hi_i[ii]
+                g00, g01 = grid[rows_lo, cols_lo], grid[rows_lo, cols_hi]
+                g10, g11 = grid[rows_hi, cols_lo], grid[rows_hi, cols_hi]
+                top = g00 + (g01 - g00) * ti
+                bottom = g10 + (g11 - g10) * ti
+                values = top + (bottom - top) * tj
+                if not gradient:
+                    return values
+                # Đạo hàm của nội suy song tuyến tính, đổi sang đơn vị pixel mới
+                gx = ((g01 - g00) * (1 - tj) + (g11 - g10) * tj) / scale
+                gy = (bottom - top) / scale
+                return values, gx, gy
+
+            # Dải nhỏ nhất / lớn nhất trên bốn góc của từng ô cũ; mỗi pixel mới thuộc ô lo_j, lo_i
+            padded = np.pad(coarse, ((0, int(h < 2)), (0, int(w < 2))), mode='edge')
+            corners = (padded[:-1, :-1], padded[1:, :-1], padded[:-1, 1:], padded[1:, 1:])
+            cell_min = np.minimum.reduce(corners)
+            cell_code = cell_min | ((np.maximum.reduce(corners) != cell_min).astype(np.uint8) << 7)
+            rows = np.bincount(lo_j, minlength=cell_code.shape[0])
+            cols = np.bincount(lo_i, minlength=cell_code.shape[1])
+            classes = np.repeat(np.repeat(cell_code, rows, axis=0), cols, axis=1)
+            mixed = np.flatnonzero(classes >= 128)
+            classes &= 127
+            if mixed.size:
+                jj, ii = np.divmod(mixed, classes.shape[1])
+                classes.ravel()[mixed] = self.classify(sample(jj, ii))
+        if iso_lines and self.iso_levels.size and min(classes.shape) > 1:
+            # Khi phóng to, hai pixel kề nhau khác dải thì ít nhất một pixel nằm trong ô cũ khác dải
+            edge = self._edge_pixels(classes, None if scale == 1 else mixed)
+            if edge.size:
+                steps = self._iso_steps(classes.shape, edge, sample)
+                classes.ravel()[edge] += steps * np.uint8(len(self.levels) + 1)
+        return classes
+
+    def rgba(self, grid_data, scale=1, iso_lines=False):
+        """Mảng RGBA (height * scale, width * scale, 4) uint8, cùng hướng với lưới vào."""
+        return self.lut[self.indices(grid_data, scale, iso_lines)]
+
+    def image(self, grid_data, scale=1, iso_lines=False):
+        """Ảnh palette PIL (mode 'P', có độ trong suốt) hướng bắc lên trên."""
+        img = Image.fromarray(np.ascontiguousarray(np.flipud(self.indices(grid_data, scale, iso_lines))), 'P')
+        img.putpalette(self._palette)
+        img.info['transparency'] = self._transparency
+        return img
+
+    def encode(self, grid_data, fmt='PNG', scale=1, iso_lines=False):
+        """
+        Mã hóa ảnh lớp phủ thành bytes. fmt: 'PNG' hoặc 'WEBP' (lossless);
+        nếu Pillow không hỗ trợ WebP thì dùng PNG.
+        """
+        img = self.image(grid_data, scale, iso_lines)
+        buffer = io.BytesIO()
+        if fmt.upper() == 'WEBP' and features.check('webp'):
+            img.convert('RGBA').save(buffer, 'WEBP', lossless=True, method=0)
+        else:
+            # Mức nén thấp: ảnh lớp phủ chủ yếu là các vùng màu đồng nhất nên vẫn nhỏ mà nhanh hơn nhiều
+            img.save(buffer, 'PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def mime_type(self, fmt='PNG'):
+        """Kiểu MIME tương ứng với encode(..., fmt)."""
+        return 'image/webp' if fmt.upper() == 'WEBP' and features.check('webp') else 'image/png'
+
+    def data_url(self, grid_data, fmt='PNG', scale=1, iso_lines=False):
+        """Ảnh lớp phủ dưới dạng data URL (không ghi file)."""
+        data = self.encode(grid_data, fmt, scale, iso_lines)
+        return f"data:{self.mime_type(fmt)};base64," + base64.b64encode(data).decode('ascii')
+
+    def save(self, grid_data, path, fmt='PNG', scale=1, iso_lines=False):
+        """Ghi ảnh lớp phủ ra file."""
+        with open(path, 'wb') as f:
+            f.write(self.encode(grid_data, fmt, scale, iso_lines))
@@ -0,0 +1,154 @@
+# emp_planning_system/heightmap_occlusion.py
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Import dạng module để tránh vòng lặp import với calculations.py
+import calculations
+import grid_geometry
+
+# Số bản đồ độ cao giữ lại trong cache
+HEIGHTMAP_CACHE_SIZE = 8
+
+_heightmap_cache = OrderedDict()
+
+
+class HeightmapRaster:
+    """
+    Bản đồ độ cao 2.5D: mỗi ô lưới tính toán lưu độ cao lớn nhất của các vật cản phủ lên tâm ô.
+    Vật cản nhỏ hơn một ô vẫn được ghi vào ô gần tâm của nó nhất để không bị bỏ sót.
+    Kiểm tra che khuất bằng cách đi theo tia qua các ô (DDA, Amanatides-Woo) và so sánh
+    độ cao của tia với độ cao của ô, nên chi phí mỗi tia tỉ lệ với số ô nó đi qua
+    chứ không phụ thuộc số vật cản.
+    - boxes: mảng (M, 2, 3) các hộp AABB
+    - grid: GridGeometry của lưới tính toán
+    """
+    def __init__(self, boxes, grid):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 2, 3)
+        self.height = grid.height
+        self.width = grid.width
+        self.x0 = grid.xs[0]
+        self.y0 = grid.ys[0]
+        self.dx = (grid.xs[-1] - self.x0) / (self.width - 1) if self.width > 1 else 1.0
+        self.dy = (grid.ys[-1] - self.y0) / (self.height - 1) if self.height > 1 else 1.0
+        self.heights = np.zeros((self.height, self.width))
+        if len(boxes) == 0:
+            return
+
+        # Các ô có tâm nằm trong hình chiếu của hộp
+        c0 = np.ceil((boxes[:, 0, 0] - self.x0) / self.dx).astype(int)
+        c1 = np.floor((boxes[:, 1, 0] - self.x0) / self.dx).astype(int)
+        r0 = np.ceil((boxes[:, 0, 1] - self.y0) / self.dy).astype(int)
+        r1 = np.floor((boxes[:, 1, 1] - self.y0) / self.dy).astype(int)
+        # Hộp không chứa tâm ô nào: dùng ô gần tâm hộp nhất
+        cc = np.rint((boxes[:, :, 0].mean(axis=1) - self.x0) / self.dx).astype(int)
+        rc = np.rint((boxes[:, :, 1].mean(axis=1) - self.y0) / self.dy).astype(int)
+        c0, c1 = np.where(c0 > c1, cc, c0), np.where(c0 > c1, cc, c1)
+        r0, r1 = np.where(r0 > r1, rc, r0), np.where(r0 > r1, rc, r1)
+        c0, c1 = np.maximum(c0, 0), np.minimum(c1, self.width - 1)
+        r0, r1 = np.maximum(r0, 0), np.minimum(r1, self.height - 1)
+        keep = (c0 <= c1) & (r0 <= r1)
+        c0, c1, r0, r1, tops = c0[keep], c1[keep], r0[keep], r1[keep], boxes[keep, 1, 2]
+
+        span = c1 - c0 + 1
+        counts = span * (r1 - r0 + 1)
+        box_of_cell = np.repeat(np.arange(len(tops)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = c0[box_of_cell] + local % span[box_of_cell]
+        rows = r0[box_of_cell] + local // span[box_of_cell]
+        np.maximum.at(self.heights, (rows, cols), tops[box_of_cell])
+
+    def occluded(self, emp_pos, rows, cols, z):
+        """
+        Trả về mảng bool cho biết tia từ EMP tới tâm các ô (rows[n], cols[n]) ở độ cao z có bị che không.
+        Một ô che tia nếu độ cao của ô lớn hơn độ cao thấp nhất của tia trên đoạn đi qua ô đó.
+        """
+        rows = np.asarray(rows, dtype=int).ravel()
+        cols = np.asarray(cols, dtype=int).ravel()
+        occluded = np.zeros(rows.shape, dtype=bool)
+        if rows.size == 0:
+            return occluded
+        ez = float(emp_pos[2])
+        z = float(z)
+        # Ô thấp hơn cả EMP và điểm thu không thể che tia nào
+        if self.heights.max() <= min(ez, z):
+            return occluded
+
+        # Tọa độ theo đơn vị ô: tâm ô (r, c) nằm tại (r, c)
+        u0 = (emp_pos[0] - self.x0) / self.dx
+        v0 = (emp_pos[1] - self.y0) / self.dy
+        du = cols - u0
+        dv = rows - v0
+
+        # Nếu EMP nằm ngoài lưới, bắt đầu từ điểm tia đi vào lưới
+        t_start = np.zeros(rows.shape)
+        for start, direction, n in ((u0, du, self.width), (v0, dv, self.height)):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t_a = (-0.5 - start) / direction
+                t_b = (n - 0.5 - start) / direction
+            t_enter = np.where(direction != 0, np.minimum(t_a, t_b), 0.0)
+            t_start = np.maximum(t_start, t_enter)
+        cu = np.clip(np.floor(u0 + t_start * du + 0.5), 0, self.width - 1).astype(int)
+        cv = np.clip(np.floor(v0 + t_start * dv + 0.5), 0, self.height - 1).astype(int)
+
+        step_u = np.sign(du).astype(int)
+        step_v = np.sign(dv).astype(int)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_delta_u = np.where(du != 0, 1.0 / np.abs(du), np.inf)
+            t_delta_v = np.where(dv != 0, 1.0 / np.abs(dv), np.inf)
+            t_max_u = np.where(du != 0, (cu + 0.5 * step_u - u0) / du, np.inf)
+            t_max_v = np.where(dv != 0, (cv + 0.5 * step_v - v0) / dv, np.inf)
+        remaining = np.abs(cols - cu) + np.abs(rows - cv)
+
+        # Đi đồng thời theo mọi tia, loại dần các tia đã tới đích hoặc đã bị che
+        active = np.arange(rows.size)
+        t_enter = t_start
+        while active.size:
+            t_exit = np.minimum(np.minimum(t_max_u, t_max_v), 1.0)
+            ray_low = ez + np.minimum(t_enter, t_exit) * (z - ez)
+            ray_low = np.minimum(ray_low, ez + np.maximum(t_enter, t_exit) * (z - ez))
+            hit = (self.heights[cv, cu] > ray_low) & (t_exit > t_enter)
+            occluded[active[hit]] = True
+
+            go = ~hit & (remaining > 0)
+            step_along_u = t_max_u < t_max_v
+            t_enter = np.where(step_along_u, t_max_u, t_max_v)
+            cu = np.where(step_along_u, cu + step_u, cu)
+            cv = np.where(step_along_u, cv, cv + step_v)
+            t_max_u = np.where(step_along_u, t_max_u + t_delta_u, t_max_u)
+            t_max_v = np.where(step_along_u, t_max_v, t_max_v + t_delta_v)
+
+            active, t_enter, cu, cv = active[go], t_enter[go], cu[go], cv[go]
+            t_max_u, t_max_v, t_delta_u, t_delta_v = t_max_u[go], t_max_v[go], t_delta_u[go], t_delta_v[go]
+            step_u, step_v, remaining = step_u[go], step_v[go], remaining[go] - 1
+        return occluded
+
+
+def get_heightmap(obstacles, bounds, grid_size, grid=None):
+    """
+    Trả về HeightmapRaster của tập vật cản trên lưới (bounds, grid_size),
+    dùng lại bản đã dựng nếu tập vật cản, vùng bản đồ và độ phân giải không đổi.
+    """
+    key = (
+        tuple(sorted((obs.lat, obs.lon, obs.length, obs.width, obs.height) for obs in obstacles)),
+        tuple(sorted(bounds.items())),
+        tuple(grid_size),
+    )
+    raster = _heightmap_cache.get(key)
+    if raster is not None:
+        _heightmap_cache.move_to_end(key)
+        return raster
+
+    if grid is None:
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    raster = HeightmapRaster(calculations._obstacle_boxes(obstacles, grid), grid)
+    _heightmap_cache[key] = raster
+    while len(_heightmap_cache) > HEIGHTMAP_CACHE_SIZE:
+        _heightmap_cache.popitem(last=False)
+    return raster
+
+
+def clear_heightmap_cache():
+    """Xóa các bản đồ độ cao đã lưu."""
+    _heightmap_cache.clear()
@@ -0,0 +1,159 @@
+# emp_planning_system/incremental.py
+
+import numpy as np
+
+import calculations
+import grid_geometry
+import parallel_engine
+import profiling
+
+# Chỉ dùng process pool khi số lớp cần tính lại từ ngưỡng này trở lên
+PARALLEL_MIN_LAYERS = 4
+
+
+def _emp_fingerprint(emp):
+    """Các thuộc tính của EMP ảnh hưởng tới kết quả tính toán."""
+    return (emp.lat, emp.lon, emp.power, emp.height)
+
+
+def _obstacle_fingerprint(obs):
+    return (obs.lat, obs.lon, obs.length, obs.width, obs.height)
+
+
+def _view_key(bounds, user_altitude, grid_size):
+    return (tuple(sorted(bounds.items())), float(user_altitude), tuple(grid_size))
+
+
+def _rects_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class IncrementalFieldEngine:
+    """
+    Bộ tính toán giữ lại "lớp đóng góp" của từng EMP giữa các lần tính.
+    Mỗi lớp được định danh bằng uuid của EMP và chỉ còn hợp lệ khi cùng vùng bản đồ,
+    độ cao xét, kích thước lưới và không có vật cản nào thay đổi trong vùng ảnh hưởng của nó.
+    Khi sửa/xóa một EMP chỉ lớp đó được tính lại; khi sửa một vật cản chỉ các lớp
+    có vùng ảnh hưởng chạm tới vật cản bị tính lại. Kết quả cuối là max của các lớp.
+    """
+    def __init__(self, use_parallel=True):
+        self.use_parallel = use_parallel
+        self._view_key = None
+        self._grid = None
+        self._obstacle_rects = {}   # uuid -> (fingerprint, hình chữ nhật XY)
+        self._layers = {}           # uuid -> {'fingerprint', 'rect', 'footprint'}
+        # uuid của các EMP được tính lại ở lần gọi compute() gần nhất
+        self.last_recomputed = []
+
+    def clear(self):
+        """Xóa toàn bộ các lớp đã lưu."""
+        self._view_key = None
+        self._grid = None
+        self._obstacle_rects = {}
+        self._layers = {}
+
+    def invalidate_emp(self, emp_uuid):
+        """Buộc tính lại lớp của một EMP ở lần gọi compute() tiếp theo."""
+        self._layers.pop(emp_uuid, None)
+
+    def has_layers(self, bounds, user_altitude, grid_size=(200, 200)):
+        """True nếu đang giữ các lớp của đúng khung nhìn này, tức compute() có thể dùng lại kết quả cũ."""
+        return bool(self._layers) and self._view_key == _view_key(bounds, user_altitude, grid_size)
+
+    def _obstacle_rect(self, obs):
+        box = calculations._obstacle_boxes([obs], self._grid)[0]
+        return (box[0, 0], box[0, 1], box[1, 0], box[1, 1])
+
+    def _layer_rect(self, emp, window):
+        """Hình chữ nhật XY bao EMP và vùng ảnh hưởng: mọi tia của lớp đều nằm trong đó."""
+        emp_x, emp_y = self._grid.lonlat_to_xy(emp.lon, emp.lat)
+        j_min, j_max, i_min, i_max = window
+        xs = self._grid.xs[i_min:i_max]
+        ys = self._grid.ys[j_min:j_max]
+        return (min(emp_x, xs.min()), min(emp_y, ys.min()), max(emp_x, xs.max()), max(emp_y, ys.max()))
+
+    def compute(self, emps, obstacles, user_altitude, bounds, grid_size=(200, 200), stats=None, progress=None):
+        """
+        Tính lưới kết quả, chỉ tính lại các lớp EMP bị ảnh hưởng bởi thay đổi kể từ lần trước.
+        - stats: FieldStats tùy chọn để đo thời gian từng pha và đếm số lớp dùng lại/tính lại
+        - progress: callback tùy chọn progress(done, total) theo số lớp cần tính lại; nếu nó ném
+          calculations.CalculationCanceled thì các lớp đã tính xong vẫn được giữ cho lần sau
+        """
+        view_key = _view_key(bounds, user_altitude, grid_size)
+        if view_key != self._view_key:
+            self.clear()
+            self._view_key = view_key
+            self._grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+
+        # 1. So sánh vật cản với lần trước, lấy vùng XY của các vật cản thêm/sửa/xóa
+        with profiling.phase(stats, 'diff'):
+            dirty_rects = []
+            new_obstacle_rects = {}
+            for obs in obstacles:
+                fingerprint = _obstacle_fingerprint(obs)
+                previous = self._obstacle_rects.get(obs.uuid)
+                if previous is not None and previous[0] == fingerprint:
+                    new_obstacle_rects[obs.uuid] = previous
+                    continue
+                rect = self._obstacle_rect(obs)
+                new_obstacle_rects[obs.uuid] = (fingerprint, rect)
+                dirty_rects.append(rect)
+                if previous is not None:
+                    dirty_rects.append(previous[1])
+            for obs_uuid, (_, rect) in self._obstacle_rects.items():
+                if obs_uuid not in new_obstacle_rects:
+                    dirty_rects.append(rect)
+            self._obstacle_rects = new_obstacle_rects
+
+            # 2. Bỏ lớp của EMP đã xóa, đánh dấu lớp cần tính lại
+            current = {emp.uuid: emp for emp in emps}
+            for emp_uuid in list(self._layers):
+                layer = self._layers[emp_uuid]
+                emp = current.get(emp_uuid)
+                if (emp is None or layer['fingerprint'] != _emp_fingerprint(emp)
+                        or (layer['rect'] is not None and any(_rects_overlap(layer['rect'], r) for r in dirty_rects))):
+                    del self._layers[emp_uuid]
+            stale = [emp for emp in emps if emp.uuid not in self._layers]
+
+        # 3. Tính lại các lớp cần thiết
+        if stale:
+            self._compute_layers(stale, emps, obstacles, user_altitude, bounds, grid_size, stats, progress)
+        self.last_recomputed = [emp.uuid for emp in stale]
+        if stats is not None:
+            stats.count('layers_recomputed', len(stale))
+            stats.count('layers_reused', len(emps) - len(stale))
+
+        # 4. Gộp các lớp bằng phép max
+        with profiling.phase(stats, 'merge'):
+            result_grid = np.zeros((self._grid.height, self._grid.width))
+            for layer in self._layers.values():
+                if layer['footprint'] is None:
+                    continue
+                (j_min, j_max, i_min, i_max), block = layer['footprint']
+                window = result_grid[j_min:j_max, i_min:i_max]
+                np.maximum(window, block, out=window)
+        return result_grid
+
+    def _compute_layers(self, stale, emps, obstacles, user_altitude, bounds, grid_size, stats=None, progress=None):
+        if self.use_parallel and parallel_engine.DEFAULT_WORKERS > 1 and len(stale) >= PARALLEL_MIN_LAYERS:
+            # Các tiến trình con không gửi bộ đếm về, chỉ đo được thời gian tổng
+            with profiling.phase(stats, 'parallel'):
+                footprints = parallel_engine.calculate_emp_footprints_parallel(
+                    stale, obstacles, user_altitude, bounds, grid_size, progress=progress)
+            for emp, footprint in zip(stale, footprints):
+                self._store_layer(emp, footprint)
+            return
+
+        with profiling.phase(stats, 'index'):
+            index = calculations._build_obstacle_index(obstacles, self._grid, emps, user_altitude)
+        for done, emp in enumerate(stale):
+            self._store_layer(emp, calculations._emp_field_block(emp, self._grid, index, user_altitude, stats=stats))
+            if progress is not None:
+                progress(done + 1, len(stale))
+
+    def _store_layer(self, emp, footprint):
+        self._layers[emp.uuid] = {
+            'fingerprint': _emp_fingerprint(emp),
+            'rect': self._layer_rect(emp, footprint[0]) if footprint is not None else None,
+            'footprint': footprint,
+        }
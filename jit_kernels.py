@@ -0,0 +1,168 @@
+# emp_planning_system/jit_kernels.py
+
+import numpy as np
+
+# Import dạng module để tránh vòng lặp import với calculations.py
+import calculations
+import grid_geometry
+
+# Các kernel bên dưới là hàm Python thuần; chúng chỉ được biên dịch bằng numba (nếu có)
+# ở lần dùng đầu tiên, nên việc import module này không làm chậm lúc khởi động main.py.
+# Bản biên dịch được lưu trên đĩa (cache=True) để các lần chạy sau không phải biên dịch lại.
+# prange được thay bằng numba.prange khi biên dịch.
+prange = range
+
+# None: chưa thử nạp; False: không có numba; True: đã biên dịch
+_jit_state = None
+
+
+def _segment_hits_boxes(px, py, pz, qx, qy, qz, boxes, box_ids, n_ids):
+    """Thuật toán Slab như check_line_box_intersection, dừng ngay ở hộp đầu tiên cắt đoạn P-Q."""
+    dx = qx - px
+    dy = qy - py
+    dz = qz - pz
+    # Tránh lỗi chia cho 0
+    if dx == 0:
+        dx = 1e-9
+    if dy == 0:
+        dy = 1e-9
+    if dz == 0:
+        dz = 1e-9
+    for k in range(n_ids):
+        b = box_ids[k]
+        t_near = (boxes[b, 0, 0] - px) / dx
+        t_far = (boxes[b, 1, 0] - px) / dx
+        t0 = min(t_near, t_far)
+        t1 = max(t_near, t_far)
+        t_near = (boxes[b, 0, 1] - py) / dy
+        t_far = (boxes[b, 1, 1] - py) / dy
+        t0 = max(t0, min(t_near, t_far))
+        t1 = min(t1, max(t_near, t_far))
+        t_near = (boxes[b, 0, 2] - pz) / dz
+        t_far = (boxes[b, 1, 2] - pz) / dz
+        t0 = max(t0, min(t_near, t_far))
+        t1 = min(t1, max(t_near, t_far))
+        if t0 < t1 and t0 < 1 and t1 > 0:
+            return True
+    return False
+
+
+def _segments_boxes_kernel(p1, points, boxes, out):
+    """Kiểm tra song song theo điểm thu: out[n] = đoạn p1 -> points[n] có cắt hộp nào không."""
+    box_ids = np.arange(boxes.shape[0])
+    for n in prange(points.shape[0]):
+        out[n] = _segment_hits_boxes(p1[0], p1[1], p1[2], points[n, 0], points[n, 1], points[n, 2],
+                                     boxes, box_ids, boxes.shape[0])
+
+
+def _emp_field_kernel(xs, ys, emp_x, emp_y, emp_z, power, z, boxes, out):
+    """
+    Cộng dồn (lấy max) trường của một EMP vào out (h, w) = phần lưới kết quả trong vùng ảnh hưởng.
+    Song song theo hàng lưới. Chỉ kiểm tra che khuất khi giá trị mới lớn hơn giá trị đang có,
+    và mỗi hàng chỉ xét các hộp có khoảng y chồng lên đoạn [y_EMP, y_hàng].
+    """
+    h, w = out.shape
+    dz = emp_z - z
+    n_boxes = boxes.shape[0]
+    for r in prange(h):
+        y = ys[r]
+        y_lo = min(emp_y, y)
+        y_hi = max(emp_y, y)
+        box_ids = np.empty(n_boxes, np.int64)
+        n_ids = 0
+        for b in range(n_boxes):
+            if boxes[b, 0, 1] <= y_hi and boxes[b, 1, 1] >= y_lo:
+                box_ids[n_ids] = b
+                n_ids += 1
+
+        for c in range(w):
+            dx = emp_x - xs[c]
+            dy = emp_y - y
+            distance_sq = dx * dx + dy * dy + dz * dz
+            if distance_sq < 1e-6:
+                field = np.inf  # Cường độ vô hạn tại tâm
+            else:
+                field = np.sqrt(30 * power / distance_sq)
+            if field <= out[r, c]:
+                continue
+            if n_ids > 0 and _segment_hits_boxes(emp_x, emp_y, emp_z, xs[c], y, z, boxes, box_ids, n_ids):
+                continue
+            out[r, c] = field
+
+
+def _load_jit():
+    """Biên dịch (hoặc nạp từ cache trên đĩa) các kernel bằng numba. Trả về False nếu không có numba."""
+    global _jit_state, prange
+    if _jit_state is not None:
+        return _jit_state
+    try:
+        import numba
+    except ImportError:
+        print("Thông báo: Chưa cài numba, backend 'jit' sẽ dùng backend 'vectorized' (NumPy).")
+        _jit_state = False
+        return _jit_state
+
+    # Hàm được gọi từ kernel khác được biên dịch trước, và thay thế tên trong module
+    # để numba tìm thấy bản đã biên dịch khi biên dịch kernel gọi nó.
+    module = globals()
+    module['_segment_hits_boxes'] = numba.njit(cache=True, nogil=True)(_segment_hits_boxes)
+    prange = numba.prange
+    for name in ('_segments_boxes_kernel', '_emp_field_kernel'):
+        module[name] = numba.njit(cache=True, nogil=True, parallel=True)(module[name])
+    _jit_state = True
+    return _jit_state
+
+
+def is_available():
+    """True nếu có numba và các kernel JIT dùng được."""
+    return _load_jit()
+
+
+def check_segments_boxes_intersection(p1, points, boxes):
+    """
+    Như calculations.check_segments_boxes_intersection nhưng dùng kernel JIT song song
+    khi có numba; nếu không thì gọi thẳng bản NumPy.
+    """
+    if not _load_jit():
+        return calculations.check_segments_boxes_intersection(p1, points, boxes)
+    p1 = np.asarray(p1, dtype=float)
+    points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+    boxes = np.ascontiguousarray(boxes, dtype=float).reshape(-1, 2, 3)
+    occluded = np.zeros(len(points), dtype=bool)
+    if len(points) and len(boxes):
+        _segments_boxes_kernel(p1, points, boxes, occluded)
+    return occluded
+
+
+def calculate_emp_field_jit(emps, obstacles, user_altitude, bounds, grid_size=(200, 200)):
+    """
+    Backend "jit": vòng lặp ô lưới biên dịch bằng numba, song song theo hàng và nhả GIL.
+    Dùng cùng lưới, vùng ảnh hưởng và chỉ mục vật cản với backend "vectorized" nên kết quả
+    trùng khớp; khi không có numba thì tự động dùng backend "vectorized".
+    """
+    if not _load_jit():
+        return calculations._calculate_emp_field_vectorized(emps, obstacles, user_altitude, bounds, grid_size)
+
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    index = calculations._build_obstacle_index(obstacles, grid, emps, user_altitude)
+    result_grid = np.zeros((grid.height, grid.width))
+
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        j_min, j_max, i_min, i_max = calculations._emp_footprint_window(emp, grid)
+        if j_min >= j_max or i_min >= i_max:
+            continue
+        emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+        sub_xs = grid.xs[i_min:i_max]
+        sub_ys = grid.ys[j_min:j_max]
+        candidates = index.query_rect(
+            min(emp_x, sub_xs.min()), min(emp_y, sub_ys.min()),
+            max(emp_x, sub_xs.max()), max(emp_y, sub_ys.max()),
+            z_lo=min(emp.height, user_altitude), z_hi=max(emp.height, user_altitude)
+        )
+        boxes = np.ascontiguousarray(index.boxes[candidates])
+        _emp_field_kernel(sub_xs, sub_ys, float(emp_x), float(emp_y), float(emp.height), float(emp.power),
+                          float(user_altitude), boxes, result_grid[j_min:j_max, i_min:i_max])
+
+    return result_grid
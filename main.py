@@ -2,12 +2,16 @@ import sys
 import os
 from PyQt5.QtWidgets import QApplication
 from main_window import MainWindow
+from map_view import register_overlay_scheme
 
 # Hàm chính để chạy ứng dụng
 def main():
     """
     Hàm khởi tạo và chạy ứng dụng PyQt.
     """
+    # Scheme ảnh lớp phủ (empoverlay:) phải được đăng ký trước khi tạo QApplication
+    register_overlay_scheme()
+
     # Mỗi ứng dụng PyQt cần một đối tượng QApplication.
     # sys.argv là các tham số dòng lệnh truyền vào (nếu có).
     app = QApplication(sys.argv)
@@ -1,16 +1,57 @@
 import uuid
 import numpy as np
 import os
-from PIL import Image
+import json
+import logging
+from logging.handlers import RotatingFileHandler
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QGroupBox, QFormLayout, QLineEdit,
-                             QLabel, QSplitter, QDoubleSpinBox, QMessageBox, QListWidget, QProgressDialog, QFileDialog)
-from PyQt5.QtCore import Qt, QTimer
-from calculations import calculate_emp_field # Import hàm tính toán
+                             QLabel, QSplitter, QDoubleSpinBox, QMessageBox, QListWidget, QProgressBar, QFileDialog,
+                             QSlider, QCheckBox)
+from PyQt5.QtCore import Qt
+from calculation_worker import CalculationRunner # Chạy tính toán trong luồng nền, hủy được
+from incremental import IncrementalFieldEngine # Bộ tính toán giữ lại kết quả từng EMP
+from result_cache import FieldResultCache, scene_key
+from calculations import calculate_emp_field_volume, plan_field_tiles, iter_emp_field_tiles, CLASS_LEVELS
+from progressive import iter_progressive_fields, PREVIEW_SIZES # Bản xem trước thô -> mịn
+from adaptive_grid import calculate_emp_field_adaptive # Lưới mịn thích nghi quanh các ngưỡng
+from profiling import FieldStats # Đo thời gian từng pha và các bộ đếm của lần tính toán
 
 from map_view import MapView
 from data_models import EMP, Obstacle
 from report_generator import generate_report
+from heatmap_renderer import HeatmapRenderer, DEFAULT_LEVELS # Tô màu lưới kết quả bằng LUT, có đường đồng mức
+from contours import field_contours # Đường bao các ngưỡng dạng GeoJSON
+
+# Các độ cao (mét) dùng khi tính khối nhiều độ cao cho đánh giá an toàn
+VOLUME_ALTITUDES = [0, 2, 5, 10, 20, 50]
+# Kích thước lưới tính toán thường và lưới mịn khi bật chế độ thích nghi
+FIELD_GRID_SIZE = (400, 400)
+ADAPTIVE_GRID_SIZE = (1600, 1600)
+# Cạnh lớn nhất (pixel) của ảnh lớp phủ cuối cùng: lưới nhỏ hơn được phóng to (nội suy) tới cỡ này
+OVERLAY_IMAGE_SIZE = 1200
+# Nhật ký hiệu năng: mỗi lần tính toán ghi một dòng JSON, file tự xoay vòng khi đầy
+PERF_LOG_PATH = os.path.join(os.path.expanduser("~"), ".emp_planning", "perf.log")
+PERF_LOG_MAX_BYTES = 1024 * 1024
+PERF_LOG_BACKUPS = 3
+
+
+def _create_perf_logger():
+    """Logger ghi bản ghi hiệu năng đầy đủ ra PERF_LOG_PATH (chỉ gắn handler một lần)."""
+    logger = logging.getLogger("emp_planning.perf")
+    if not logger.handlers:
+        try:
+            os.makedirs(os.path.dirname(PERF_LOG_PATH), exist_ok=True)
+            handler = RotatingFileHandler(PERF_LOG_PATH, maxBytes=PERF_LOG_MAX_BYTES,
+                                          backupCount=PERF_LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        except OSError as e:
+            print(f"Cảnh báo: Không mở được nhật ký hiệu năng {PERF_LOG_PATH}: {e}")
+            handler = logging.NullHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
 
 class MainWindow(QMainWindow):
     """
@@ -28,6 +69,39 @@ class MainWindow(QMainWindow):
         # Danh sách lưu trữ các đối tượng
         self.emp_sources = []
         self.obstacles = []
+        # Giữ lớp kết quả của từng EMP để lần tính sau chỉ tính lại phần bị thay đổi
+        self.field_engine = IncrementalFieldEngine()
+        # Khung nhìn (bounds, độ cao, grid_size) vừa được tính theo từng ô; lần sau cùng khung nhìn dùng field_engine
+        self.streamed_view = None
+        # Vùng bản đồ của yêu cầu tính toán hiện tại (để đặt các ô được vẽ dần)
+        self.streaming_bounds = None
+        # Bộ chạy tính toán nền: mỗi lúc một yêu cầu, yêu cầu mới thay thế yêu cầu cũ
+        self.calc_runner = CalculationRunner(self)
+        self.calc_runner.progressChanged.connect(lambda percent: self.progress_bar.setValue(percent))
+        self.calc_runner.tileReady.connect(self._on_tile_ready)
+        self.calc_runner.partialResult.connect(self._on_preview_ready)
+        self.calc_runner.succeeded.connect(self._on_calculation_succeeded)
+        self.calc_runner.failed.connect(self._on_calculation_failed)
+        self.calc_runner.canceled.connect(self._on_calculation_canceled)
+        # Cache kết quả theo nội dung cảnh (bộ nhớ + đĩa)
+        self.result_cache = FieldResultCache()
+        # Bộ vẽ ảnh lớp phủ (dùng chung cho ảnh cuối, bản xem trước và các ô vẽ dần)
+        self.heatmap_renderer = HeatmapRenderer()
+        # Nhật ký hiệu năng của các lần tính toán
+        self.perf_logger = _create_perf_logger()
+        # Loại tính toán đang chờ thông tin biên bản đồ: "SINGLE" hoặc "VOLUME"
+        self.calculation_mode = "SINGLE"
+        # Đang chờ JS gửi biên bản đồ cho một yêu cầu tính toán (nút Hủy đặt lại để bỏ qua câu trả lời)
+        self.bounds_request_pending = False
+        # Khối kết quả (n_alt, H, W) của lần tính nhiều độ cao gần nhất và vùng bản đồ tương ứng
+        self.field_volume = None
+        # Lưới kết quả và đường bao (GeoJSON) đang hiển thị, dùng cho báo cáo PDF
+        self.overlay_grid = None
+        self.overlay_bounds = None
+        self.overlay_contours = None
+        # Ngưỡng cảnh báo, nguy hiểm (V/m) đang dùng; người dùng đổi được bằng thanh trượt trên bản đồ
+        self.field_levels = CLASS_LEVELS
+        self.volume_bounds = None
         
         # Tạo widget trung tâm chính
         main_widget = QWidget()
@@ -54,9 +128,20 @@ class MainWindow(QMainWindow):
         # Thêm splitter vào layout chính
         main_layout.addWidget(splitter)
         
+        # Thanh tiến trình và nút Hủy trên thanh trạng thái, chỉ hiện khi đang tính
+        self.progress_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.cancel_button = QPushButton("Hủy")
+        self.cancel_button.clicked.connect(self._cancel_calculation)
+        for widget in (self.progress_label, self.progress_bar, self.cancel_button):
+            self.statusBar().addPermanentWidget(widget)
+        self._hide_progress()
+
         # Kết nối tín hiệu từ bản đồ tới hàm xử lý
         self.map_view.bridge.mapClicked.connect(self._on_map_clicked)
         self.map_view.bridge.mapBoundsReceived.connect(self._on_map_bounds_received)
+        self.map_view.bridge.thresholdsChanged.connect(self._on_thresholds_changed)
      
     def _create_control_panel(self):
         """Hàm tạo panel điều khiển bên trái."""
@@ -72,6 +157,19 @@ class MainWindow(QMainWindow):
         self.altitude_input.setValue(0.0)
         self.altitude_input.setSuffix(" m")
         general_layout.addRow("Độ cao xét ảnh hưởng:", self.altitude_input)
+        # Thanh trượt chọn lát cắt trong khối nhiều độ cao đã tính
+        self.volume_slider = QSlider(Qt.Horizontal)
+        self.volume_slider.setRange(0, len(VOLUME_ALTITUDES) - 1)
+        self.volume_slider.setEnabled(False)
+        self.volume_label = QLabel("Chưa tính khối")
+        general_layout.addRow("Lát cắt độ cao (khối):", self.volume_slider)
+        general_layout.addRow("", self.volume_label)
+        # Lưới mịn, chỉ tính chính xác gần các ranh giới ngưỡng
+        self.adaptive_checkbox = QCheckBox("Lưới thích nghi (độ phân giải cao)")
+        general_layout.addRow("", self.adaptive_checkbox)
+        # Lớp phủ theo tile z/x/y: kéo/zoom chỉ tính các tile mới hiện ra
+        self.tile_overlay_checkbox = QCheckBox("Lớp phủ dạng tile (tự tính khi kéo/zoom)")
+        general_layout.addRow("", self.tile_overlay_checkbox)
         general_group.setLayout(general_layout)
 
         # 2. Nhóm hành động
@@ -81,6 +179,7 @@ class MainWindow(QMainWindow):
         self.add_obstacle_btn = QPushButton("Thêm vật cản")
         
         self.calc_btn = QPushButton("Tính toán và Hiển thị Vùng ảnh hưởng")
+        self.calc_volume_btn = QPushButton("Tính khối nhiều độ cao")
         self.export_pdf_btn = QPushButton("Xuất Báo cáo PDF")
 
         self.status_label = QLabel("Trạng thái: Sẵn sàng.")
@@ -92,6 +191,7 @@ class MainWindow(QMainWindow):
         actions_layout.addWidget(self.status_label)
         actions_group.setLayout(actions_layout)
         actions_layout.addWidget(self.calc_btn)
+        actions_layout.addWidget(self.calc_volume_btn)
         # 3. Nhóm chi tiết (để nhập thông số EMP/Vật cản)
         self.details_group = QGroupBox("Chi tiết đối tượng")
         self.details_layout = QFormLayout()
@@ -118,6 +218,8 @@ class MainWindow(QMainWindow):
         self.add_emp_btn.clicked.connect(self._handle_add_emp_mode)
         self.add_obstacle_btn.clicked.connect(self._handle_add_obstacle_mode)
         self.calc_btn.clicked.connect(self._trigger_calculation)
+        self.calc_volume_btn.clicked.connect(self._trigger_volume_calculation)
+        self.volume_slider.valueChanged.connect(self._on_volume_slider_changed)
         self.export_pdf_btn.clicked.connect(self._export_pdf)
         return panel
 
@@ -234,90 +336,266 @@ class MainWindow(QMainWindow):
 
     def _trigger_calculation(self):
         """Bắt đầu quá trình tính toán bằng cách yêu cầu JS gửi thông tin biên."""
+        if self.tile_overlay_checkbox.isChecked():
+            self._show_field_tiles()
+            return
+        self.calculation_mode = "SINGLE"
+        self._request_map_bounds()
+
+    def _show_field_tiles(self):
+        """
+        Hiện trường dạng lớp tile thay cho ảnh phủ khung nhìn: không tính gì ngay,
+        bản đồ yêu cầu từng tile đang nhìn thấy và FieldTileService tính (hoặc lấy từ cache) tile đó.
+        """
+        if not self.emp_sources:
+            QMessageBox.information(self, "Thông báo", "Chưa có nguồn EMP nào để tính toán.")
+            return
+        self.calc_runner.cancel()
+        # Tile dùng cùng ngưỡng với lưới trên bản đồ và báo cáo (ngưỡng là một phần của băm cảnh)
+        scene = self.map_view.field_tiles.set_scene(self.emp_sources, self.obstacles, self.altitude_input.value(),
+                                                    levels=DEFAULT_LEVELS[:1] + tuple(self.field_levels))
+        self.map_view.run_js("clearOverlayTiles(); clearOverlayImage(); clearFieldGrid(); clearContours();")
+        self.map_view.show_field_tiles(scene)
+        self.statusBar().showMessage("Lớp phủ dạng tile: các tile được tính khi bản đồ hiển thị chúng.", 3000)
+
+    def _trigger_volume_calculation(self):
+        """Tính trường cho mọi độ cao trong VOLUME_ALTITUDES trong một lượt."""
+        self.calculation_mode = "VOLUME"
+        self._request_map_bounds()
+
+    def _request_map_bounds(self):
+        """Hiển thị tiến trình và yêu cầu JS gửi thông tin biên bản đồ."""
         if not self.emp_sources:
             QMessageBox.information(self, "Thông báo", "Chưa có nguồn EMP nào để tính toán.")
             return
 
-        # Hiển thị thanh tiến trình
-        self.progress_dialog = QProgressDialog("Đang yêu cầu thông tin bản đồ...", "Hủy", 0, 0, self)
-        self.progress_dialog.setWindowModality(Qt.WindowModal)
-        self.progress_dialog.show()
+        # Hiển thị thanh tiến trình (không chặn giao diện, bản đồ vẫn kéo/zoom được)
+        self._show_progress("Đang yêu cầu thông tin bản đồ...")
+        self.bounds_request_pending = True
 
         # Yêu cầu Javascript cung cấp thông tin biên của bản đồ
         self.map_view.run_js("getMapBounds();")
 
     def _on_map_bounds_received(self, s, w, n, e):
-        """Nhận được thông tin biên, bắt đầu tính toán thực sự."""
-        self.progress_dialog.setLabelText("Đang tính toán, vui lòng chờ...")
-
+        """Nhận được thông tin biên, bắt đầu tính toán thực sự trong luồng nền."""
+        if not self.bounds_request_pending:
+            return  # Yêu cầu đã bị hủy trong lúc chờ JS trả lời
+        self.bounds_request_pending = False
         bounds = {'lat_min': s, 'lon_min': w, 'lat_max': n, 'lon_max': e}
         user_altitude = self.altitude_input.value()
-        
-        # Chạy tính toán trong một QTimer để không làm treo giao diện
-        # Đây là một kỹ thuật đơn giản để xử lý tác vụ nền
-        QTimer.singleShot(100, lambda: self._perform_calculation(bounds, user_altitude))
+        # Luồng nền làm việc trên bản sao danh sách để giao diện vẫn thêm/sửa đối tượng được trong lúc tính
+        emps, obstacles = list(self.emp_sources), list(self.obstacles)
 
-    def _perform_calculation(self, bounds, user_altitude):
-        """Thực hiện tính toán và hiển thị kết quả."""
+        if self.calculation_mode == "VOLUME":
+            job = lambda task: self._run_volume_job(task, emps, obstacles, bounds)
+        else:
+            adaptive = self.adaptive_checkbox.isChecked()
+            job = lambda task: self._run_field_job(task, emps, obstacles, user_altitude, bounds, adaptive)
+            self.streaming_bounds = bounds
+
+        # Yêu cầu mới thay thế yêu cầu đang chạy (nếu có); xóa các ô đang vẽ dở của yêu cầu cũ và lớp tile trường
+        self.map_view.run_js("clearOverlayTiles(); clearFieldTileLayer();")
+        self._show_progress("Đang tính toán...", busy=False)
+        self.calc_runner.submit(job)
+
+    def _run_field_job(self, task, emps, obstacles, user_altitude, bounds, adaptive):
+        """Chạy trong luồng nền: tính lưới kết quả (dùng cache nếu có). Không được chạm vào widget."""
+        grid_size = ADAPTIVE_GRID_SIZE if adaptive else FIELD_GRID_SIZE
+        stats = FieldStats("adaptive" if adaptive else "incremental")
+        with stats.phase('total'):
+            # Dùng lại kết quả đã tính nếu cảnh không đổi, nếu không thì gọi hàm tính toán
+            with stats.phase('cache'):
+                cache_key = scene_key(emps, obstacles, user_altitude, bounds, grid_size,
+                                      extra='adaptive' if adaptive else None)
+                grid_data = self.result_cache.get(cache_key)
+            if grid_data is not None:
+                stats.count('cache_hits')
+            else:
+                reusable = (not adaptive and (self.field_engine.has_layers(bounds, user_altitude, grid_size)
+                                              or self.streamed_view == (bounds, user_altitude, grid_size)))
+                if not reusable:
+                    # Tính từ đầu: hiện ngay bản xem trước thô rồi mịn dần trong lúc lưới đầy đủ được tính
+                    with stats.phase('preview'):
+                        for _, preview in iter_progressive_fields(emps, obstacles, user_altitude, bounds, PREVIEW_SIZES):
+                            task.check_canceled()
+                            task.emit_partial({'grid': preview, 'bounds': bounds})
+                if adaptive:
+                    with stats.phase('adaptive'):
+                        grid_data = calculate_emp_field_adaptive(
+                            emps, obstacles, user_altitude, bounds, grid_size=grid_size, progress=task.report
+                        ).to_grid()
+                elif reusable:
+                    # Cùng khung nhìn với lần trước: bộ tính toán lớp chỉ tính lại phần bị thay đổi
+                    grid_data = self.field_engine.compute(
+                        emps, obstacles, user_altitude, bounds, grid_size=grid_size, stats=stats, progress=task.report
+                    )
+                else:
+                    # Khung nhìn mới: không có gì để dùng lại, tính và gửi dần từng ô để vẽ
+                    stats.backend = "stream"
+                    grid_data = self._stream_field(task, emps, obstacles, user_altitude, bounds, grid_size, stats)
+                    self.streamed_view = (bounds, user_altitude, grid_size)
+                with stats.phase('cache'):
+                    self.result_cache.put(cache_key, grid_data)
+        return {'kind': 'field', 'grid': grid_data, 'bounds': bounds, 'stats': stats,
+                'altitude': user_altitude, 'grid_size': grid_size, 'n_emps': len(emps), 'n_obstacles': len(obstacles)}
+
+    def _stream_field(self, task, emps, obstacles, user_altitude, bounds, grid_size, stats=None):
+        """
+        Chạy trong luồng nền: tính lưới theo từng ô, ô gần tâm khung nhìn và gần EMP trước,
+        gửi mỗi ô về giao diện để vẽ ngay khi xong. Dừng giữa hai ô nếu yêu cầu bị hủy.
+        """
+        tiles = plan_field_tiles(emps, bounds, grid_size)
+        grid_data = np.zeros(grid_size)
+        for k, (window, data) in enumerate(iter_emp_field_tiles(
+                emps, obstacles, user_altitude, bounds, grid_size, tiles=tiles, stats=stats)):
+            j_min, j_max, i_min, i_max = window
+            grid_data[j_min:j_max, i_min:i_max] = data
+            task.emit_tile(window, data)
+            task.report(k + 1, len(tiles))
+        return grid_data
+
+    def _run_volume_job(self, task, emps, obstacles, bounds):
+        """Chạy trong luồng nền: tính khối (n_alt, H, W) cho mọi độ cao trong VOLUME_ALTITUDES."""
+        volume = calculate_emp_field_volume(
+            emps, obstacles, VOLUME_ALTITUDES, bounds, grid_size=FIELD_GRID_SIZE, progress=task.report
+        )
+        return {'kind': 'volume', 'volume': volume, 'bounds': bounds}
+
+    def _on_calculation_succeeded(self, result):
+        """Nhận kết quả từ luồng nền và hiển thị."""
+        self._hide_progress()
         try:
-            # Gọi hàm tính toán
-            grid_data = calculate_emp_field(
-                self.emp_sources, self.obstacles, user_altitude, bounds, grid_size=(400, 400)
-            )
-
-            # Tạo ảnh heatmap từ dữ liệu grid
-            self._create_heatmap_image(grid_data, bounds)
-            
-            # Yêu cầu JS hiển thị ảnh
-            base_path = os.path.dirname(os.path.abspath(__file__))
-            # image_path_relative = 'web/temp_overlay.png'
-            # image_path_absolute = os.path.join(base_path, image_path_relative)
-            image_path_for_js = "temp_overlay.png"
-            # Cần đảm bảo đường dẫn dùng trong JS là tương đối
-            self.map_view.run_js(
-                f"updateOverlayImage('{image_path_for_js}', {bounds['lat_min']}, {bounds['lon_min']}, {bounds['lat_max']}, {bounds['lon_max']});"
-            )
-
+            if result['kind'] == 'volume':
+                self._show_volume(result['volume'], result['bounds'])
+                return
+            stats = result['stats']
+            with stats.phase('total'), stats.phase('render'):
+                self._show_grid(result['grid'], result['bounds'])
+            self._log_performance(stats, result['altitude'], result['grid_size'],
+                                  result['n_emps'], result['n_obstacles'])
         except Exception as e:
             QMessageBox.critical(self, "Lỗi Tính toán", f"Đã có lỗi xảy ra: {e}")
-        finally:
-            self.progress_dialog.close()
-
-    def _create_heatmap_image(self, grid_data, bounds):
-        """Tạo file ảnh PNG từ dữ liệu numpy."""
-        # Chuẩn hóa dữ liệu về khoảng 0-255 để tô màu
-        # Dùng thang đo log để hiển thị rõ hơn các vùng chênh lệch lớn
-        with np.errstate(divide='ignore'):
-            grid_log = np.log10(grid_data + 1e-9) # Thêm số nhỏ để tránh log(0)
-        
-        # Ngưỡng màu dựa trên thang log
-        # E=10 -> log10(10)=1. E=50 -> log10(50)~1.7
-        log_warn = 1.0
-        log_danger = 1.7
-        
-        # Tạo mảng màu RGBA 4 chiều
-        height, width = grid_data.shape
-        rgba_data = np.zeros((height, width, 4), dtype=np.uint8)
-        
-        # Tô màu dựa trên ngưỡng
-        safe_mask = (grid_log > 0) & (grid_log <= log_warn)
-        warn_mask = (grid_log > log_warn) & (grid_log <= log_danger)
-        danger_mask = (grid_log > log_danger)
-        
-        # Màu xanh (lá cây) cho vùng cảnh báo nhẹ (trong ngưỡng an toàn nhưng có tín hiệu)
-        rgba_data[safe_mask] = [0, 255, 0, 100] # RGBA
-        # Màu cam cho vùng cảnh báo
-        rgba_data[warn_mask] = [255, 165, 0, 120]
-        # Màu đỏ cho vùng nguy hiểm
-        rgba_data[danger_mask] = [255, 0, 0, 150]
-        
-        # Chuyển đổi mảng numpy thành ảnh PIL và lưu
-        # Cần lật ngược ảnh theo chiều dọc vì hệ tọa độ ảnh và numpy khác nhau
-        img = Image.fromarray(np.flipud(rgba_data), 'RGBA')
-        
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        save_path = os.path.join(base_path, 'web', 'temp_overlay.png')
-        img.save(save_path, 'PNG')
+
+    def _on_calculation_failed(self, message):
+        self._hide_progress()
+        self.map_view.run_js("clearOverlayTiles();")
+        QMessageBox.critical(self, "Lỗi Tính toán", f"Đã có lỗi xảy ra: {message}")
+
+    def _on_calculation_canceled(self):
+        self._hide_progress()
+        self.map_view.run_js("clearOverlayTiles();")
+        self.statusBar().showMessage("Đã hủy tính toán.", 3000)
+
+    def _cancel_calculation(self):
+        """Nút Hủy: dừng yêu cầu đang chạy (hoặc bỏ qua yêu cầu đang chờ thông tin biên bản đồ)."""
+        self.bounds_request_pending = False
+        if self.calc_runner.is_running():
+            self.calc_runner.cancel()
+        else:
+            self._hide_progress()
+
+    def _show_progress(self, text, busy=True):
+        self.progress_label.setText(text)
+        self.progress_bar.setRange(0, 0 if busy else 100)
+        self.progress_bar.setValue(0)
+        self.progress_label.setVisible(True)
+        self.progress_bar.setVisible(True)
+        self.cancel_button.setVisible(True)
+
+    def _hide_progress(self):
+        self.progress_label.setVisible(False)
+        self.progress_bar.setVisible(False)
+        self.cancel_button.setVisible(False)
+
+    def _log_performance(self, stats, user_altitude, grid_size, n_emps, n_obstacles):
+        """Hiện tóm tắt một dòng trên thanh trạng thái và ghi bản ghi đầy đủ vào nhật ký hiệu năng."""
+        self.statusBar().showMessage(stats.summary())
+        record = stats.to_dict()
+        record.update(altitude=user_altitude, grid_size=list(grid_size),
+                      n_emps=n_emps, n_obstacles=n_obstacles)
+        self.perf_logger.info(json.dumps(record, ensure_ascii=False))
+
+    def _on_preview_ready(self, result):
+        """Hiện bản xem trước (lưới thô) thay cho lớp phủ hiện tại, giữ các ô đang vẽ dần."""
+        data = self.heatmap_renderer.encode(result['grid'])
+        self.map_view.show_overlay_image(data, 'image/png', result['bounds'], keep_tiles=True, name='preview')
+        self.map_view.run_js("clearContours();")  # Đường bao của kết quả trước không còn đúng
+
+    def _on_tile_ready(self, window, data):
+        """Vẽ ô vừa tính xong của yêu cầu hiện tại."""
+        self._paint_tile(window, data, self.streaming_bounds, FIELD_GRID_SIZE)
+
+    def _paint_tile(self, window, data, bounds, grid_size):
+        """Vẽ một ô của lưới kết quả lên bản đồ (ảnh PNG nhúng dạng data URL)."""
+        j_min, j_max, i_min, i_max = window
+        if not data.any():
+            return
+        url = self._heatmap_data_url(data)
+
+        # Cùng cách đặt ảnh như lớp phủ đầy đủ: mỗi ô lưới chiếm 1/height vĩ độ và 1/width kinh độ của vùng
+        d_lat = (bounds['lat_max'] - bounds['lat_min']) / grid_size[0]
+        d_lon = (bounds['lon_max'] - bounds['lon_min']) / grid_size[1]
+        self.map_view.run_js(
+            f"addOverlayTile('{url}', {bounds['lat_min'] + j_min * d_lat}, {bounds['lon_min'] + i_min * d_lon}, "
+            f"{bounds['lat_min'] + j_max * d_lat}, {bounds['lon_min'] + i_max * d_lon});"
+        )
+
+    def _show_volume(self, volume, bounds):
+        """Hiển thị lát gần độ cao đang chọn của khối vừa tính."""
+        self.field_volume = volume
+        self.volume_bounds = bounds
+        self.volume_slider.setEnabled(True)
+
+        current = self.altitude_input.value()
+        nearest = min(range(len(VOLUME_ALTITUDES)), key=lambda k: abs(VOLUME_ALTITUDES[k] - current))
+        if self.volume_slider.value() == nearest:
+            self._on_volume_slider_changed(nearest)
+        else:
+            self.volume_slider.setValue(nearest) # Tự gọi _on_volume_slider_changed
+
+    def closeEvent(self, event):
+        """Dừng các luồng tính toán nền trước khi đóng cửa sổ."""
+        self.calc_runner.wait_all()
+        super().closeEvent(event)
+
+    def _on_volume_slider_changed(self, k):
+        """Hiển thị ngay lát cắt thứ k của khối đã tính, không cần tính lại."""
+        if self.field_volume is None:
+            return
+        self.volume_label.setText(f"Độ cao {VOLUME_ALTITUDES[k]} m")
+        self._show_grid(self.field_volume[k], self.volume_bounds)
+
+    def _show_grid(self, grid_data, bounds):
+        """
+        Gửi lưới kết quả sang bản đồ để trang tự tô màu (đổi ngưỡng bằng thanh trượt không cần tính lại)
+        và gửi đường bao các ngưỡng dạng vector.
+        """
+        self.overlay_grid = grid_data
+        self.overlay_bounds = bounds
+        self.overlay_contours = field_contours(grid_data, bounds, levels=self.field_levels)
+        self.map_view.show_field_grid(grid_data, bounds, levels=DEFAULT_LEVELS[:1] + tuple(self.field_levels))
+        self.map_view.show_contours(self.overlay_contours)
+
+    def _on_thresholds_changed(self, warning, danger):
+        """Người dùng thả thanh trượt ngưỡng: trang đã tô lại màu, chỉ cần tính lại đường bao."""
+        self.field_levels = (warning, danger)
+        # Bản xem trước, các ô vẽ dần và ảnh trong báo cáo dùng cùng ngưỡng với bản đồ
+        self.heatmap_renderer = HeatmapRenderer(levels=DEFAULT_LEVELS[:1] + self.field_levels,
+                                                iso_levels=self.field_levels)
+        if self.overlay_grid is None:
+            return
+        self.overlay_contours = field_contours(self.overlay_grid, self.overlay_bounds, levels=self.field_levels)
+        self.map_view.show_contours(self.overlay_contours)
+
+    def _heatmap_data_url(self, grid_data):
+        """Ảnh heatmap PNG của lưới dưới dạng data URL (không phóng to: dùng cho các ô vẽ dần)."""
+        return self.heatmap_renderer.data_url(grid_data)
+
+    def _create_heatmap_image(self, grid_data, iso_lines=False):
+        """Ảnh PNG (bytes) của lưới kết quả, phóng to tới OVERLAY_IMAGE_SIZE."""
+        scale = max(1, OVERLAY_IMAGE_SIZE // max(grid_data.shape))
+        return self.heatmap_renderer.encode(grid_data, scale=scale, iso_lines=iso_lines)
+
     def _export_pdf(self):
         """Mở hộp thoại lưu file và tạo báo cáo PDF."""
         if not self.emp_sources:
@@ -334,14 +612,13 @@ class MainWindow(QMainWindow):
             return
 
         # Chuẩn bị dữ liệu cho báo cáo
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        image_path = os.path.join(base_path, 'web', 'temp_overlay.png')
-
         report_data = {
             "emps": self.emp_sources,
             "obstacles": self.obstacles,
             "altitude": self.altitude_input.value(),
-            "image_path": image_path
+            # Ảnh trong báo cáo vẽ kèm đường đồng mức vì không có lớp vector như trên bản đồ
+            "image_data": self._create_heatmap_image(self.overlay_grid, iso_lines=True) if self.overlay_grid is not None else None,
+            "contours": self.overlay_contours
         }
 
         # Gọi hàm tạo báo cáo
@@ -386,13 +663,18 @@ self.map_view.run_js(...): Đây chính là lệnh gọi JavaScript từ Python.
 1.Nút "Tính toán": Thêm một nút mới vào giao diện để người dùng chủ động ra lệnh tính toán.
 2.Luồng bất đồng bộ: Việc tính toán có thể mất vài giây. Nếu làm trực tiếp, giao diện sẽ bị "treo". Luồng xử lý mới sẽ là:
 _trigger_calculation: Bấm nút -> Python yêu cầu JS cung cấp biên bản đồ (getMapBounds).
-_on_map_bounds_received: JS gửi biên về -> Python nhận được và gọi _perform_calculation thông qua một QTimer.singleShot. Việc này giúp giao diện có thời gian "thở" và cập nhật thanh tiến trình.
-_perform_calculation: Thực hiện việc tính toán nặng, tạo ảnh, rồi yêu cầu JS hiển thị ảnh đó.
+_on_map_bounds_received: JS gửi biên về -> Python nhận được và giao việc tính toán cho CalculationRunner (calculation_worker.py), chạy trong luồng nền nên giao diện và bản đồ không bị treo; nút Hủy dừng việc tính giữa hai ô/EMP.
+_run_field_job: Thực hiện việc tính toán nặng trong luồng nền; _on_calculation_succeeded tạo ảnh rồi yêu cầu JS hiển thị ảnh đó.
 3._create_heatmap_image:
 Hàm này nhận mảng kết quả từ calculate_emp_field.
-Nó dùng numpy để lọc ra các vùng nguy hiểm, cảnh báo, an toàn dựa trên ngưỡng.
-Nó tạo ra một mảng 4 chiều (R, G, B, Alpha - độ trong suốt). Các vùng không có tín hiệu sẽ có Alpha=0 (hoàn toàn trong suốt).
-Cuối cùng, nó dùng thư viện Pillow (Image.fromarray) để chuyển mảng numpy này thành file ảnh temp_overlay.png và lưu vào thư mục web/.
+Nó giao cho HeatmapRenderer (heatmap_renderer.py): xếp từng ô vào dải an toàn / cảnh báo / nguy hiểm theo ngưỡng,
+tra màu RGBA trong bảng LUT dựng sẵn (vùng không có tín hiệu có Alpha=0, hoàn toàn trong suốt)
+rồi dùng Pillow mã hóa thẳng thành ảnh PNG trong bộ nhớ. MapView lưu ảnh vào OverlayStore và trang web
+tải nó qua scheme empoverlay: (không ghi file web/temp_overlay.png).
+Đường bao 10 và 50 V/m được tách bằng marching squares (contours.py) và gửi sang trang dạng GeoJSON,
+vẽ bằng canvas của Leaflet; báo cáo PDF dùng lại chúng để tính diện tích từng vùng.
+Khi bật "Lớp phủ dạng tile", không có ảnh phủ khung nhìn: bản đồ dùng một L.tileLayer với URL empoverlay:tiles/...
+và FieldTileService (field_tiles.py) tính, vẽ, cache từng tile Web-Mercator theo băm cảnh.
 """
 
 """
@@ -401,7 +683,7 @@ Kết nối _export_pdf: Nút mới được kết nối với hàm _export_pdf.
 Hàm _export_pdf:
 Kiểm tra xem đã có dữ liệu để báo cáo chưa.
 Sử dụng QFileDialog.getSaveFileName để mở một cửa sổ "Lưu file" chuẩn của hệ điều hành. Điều này cho phép người dùng chọn vị trí và tên file PDF.
-Nếu người dùng chọn một file (không bấm Hủy), hàm sẽ thu thập tất cả dữ liệu cần thiết (danh sách EMP, vật cản, độ cao, đường dẫn ảnh heatmap) vào một dictionary report_data.
+Nếu người dùng chọn một file (không bấm Hủy), hàm sẽ thu thập tất cả dữ liệu cần thiết (danh sách EMP, vật cản, độ cao, ảnh heatmap dạng bytes) vào một dictionary report_data.
 Nó gọi hàm generate_report từ module report_generator và truyền tên file cùng dữ liệu vào.
 Cuối cùng, nó hiển thị một thông báo thành công hoặc thất bại cho người dùng.
 
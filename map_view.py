@@ -1,7 +1,108 @@
 import os
-from PyQt5.QtCore import QObject,QUrl, pyqtSlot, pyqtSignal
+import json
+import base64
+import itertools
+import traceback
+import numpy as np
+from PyQt5.QtCore import QObject,QUrl, QBuffer, QIODevice, QRunnable, QThreadPool, pyqtSlot, pyqtSignal
 from PyQt5.QtWebEngineWidgets import QWebEngineView
+from PyQt5.QtWebEngineCore import QWebEngineUrlScheme, QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
 from PyQt5.QtWebChannel import QWebChannel
+
+import field_tiles
+import heatmap_renderer
+import overlay_store
+
+
+def register_overlay_scheme():
+    """
+    Đăng ký scheme ảnh lớp phủ (overlay_store.OVERLAY_SCHEME) với Qt WebEngine.
+    Phải gọi trước khi tạo QApplication.
+    """
+    scheme = QWebEngineUrlScheme(overlay_store.OVERLAY_SCHEME.encode('ascii'))
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+    # Trang bản đồ được mở từ file:// nên scheme phải cho phép trang cục bộ truy cập
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalAccessAllowed
+                    | QWebEngineUrlScheme.CorsEnabled)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class _TileRunnable(QRunnable):
+    """Tính một tile trường trong QThreadPool rồi báo kết quả về handler (luồng giao diện)."""
+    def __init__(self, handler, job_id, args):
+        super().__init__()
+        self.handler = handler
+        self.job_id = job_id
+        self.args = args
+
+    def run(self):
+        try:
+            data = self.handler.tiles.tile(*self.args)
+        except Exception:
+            traceback.print_exc()
+            data = None
+        self.handler.tileFinished.emit(self.job_id, data)
+
+
+class OverlaySchemeHandler(QWebEngineUrlSchemeHandler):
+    """
+    Trả lời các yêu cầu empoverlay: của trang web (không qua đĩa):
+    - empoverlay:<key>: ảnh lớp phủ trong OverlayStore
+    - empoverlay:tiles/<băm cảnh>/<z>/<x>/<y>.png: tile trường của FieldTileService, tính trong
+      QThreadPool để giao diện không bị treo; yêu cầu bị trang hủy (tile ra khỏi khung nhìn) thì bỏ qua kết quả
+    """
+    tileFinished = pyqtSignal(int, object)   # (id yêu cầu, bytes PNG hoặc None)
+
+    def __init__(self, store, tiles, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.tiles = tiles
+        self.pool = QThreadPool(self)
+        self._pending = {}
+        self._job_ids = itertools.count()
+        self.tileFinished.connect(self._on_tile_finished)
+
+    def requestStarted(self, job):
+        path = job.requestUrl().path()
+        if path.startswith('tiles/'):
+            self._start_tile(job, path)
+            return
+        item = self.store.get(path)
+        if item is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        self._reply(job, *item)
+
+    def _start_tile(self, job, path):
+        try:
+            _, scene, z, x, y = path.split('/')
+            args = (scene, int(z), int(x), int(y.split('.')[0]))
+        except ValueError:
+            job.fail(QWebEngineUrlRequestJob.UrlInvalid)
+            return
+        job_id = next(self._job_ids)
+        self._pending[job_id] = job
+        job.destroyed.connect(lambda *_: self._pending.pop(job_id, None))
+        self.pool.start(_TileRunnable(self, job_id, args))
+
+    def _on_tile_finished(self, job_id, data):
+        job = self._pending.pop(job_id, None)
+        if job is None:
+            return
+        if data is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+        else:
+            self._reply(job, data, 'image/png')
+
+    @staticmethod
+    def _reply(job, data, mime_type):
+        # Buffer thuộc về job nên tồn tại cho tới khi trang đọc xong
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime_type.encode('ascii'), buffer)
+
+
 # Bridge(Object): 1 đối tượng Python có  thể giao tiếp qua QWebChannel, kế thừa từ QObject
 class Bridge(QObject):
     """
@@ -13,6 +114,8 @@ class Bridge(QObject):
     # Signal này mang theo 2 tham số là float (lat, lon)
     mapClicked = pyqtSignal(float, float)
     mapBoundsReceived = pyqtSignal(float, float, float, float)
+    # Ngưỡng cảnh báo, nguy hiểm (V/m) người dùng vừa chọn bằng thanh trượt trên bản đồ
+    thresholdsChanged = pyqtSignal(float, float)
     # Dùng decorator @pyqtSlot để hàm này có thể được gọi từ Javascript
     # Kết quả (nếu có) sẽ được trả về JS. Ở đây kiểu trả về là void.
     @pyqtSlot(float, float)
@@ -30,6 +133,11 @@ class Bridge(QObject):
     def onMapBoundsReceived(self, s, w, n, e):
         # Khi nhận được thông tin từ JS, phát tín hiệu cho MainWindow
         self.mapBoundsReceived.emit(s, w, n, e)
+
+    @pyqtSlot(float, float)
+    def onThresholdsChanged(self, warning, danger):
+        # Gọi khi người dùng thả thanh trượt ngưỡng (trong lúc kéo trang tự tô lại, không gọi Python)
+        self.thresholdsChanged.emit(warning, danger)
     
 class MapView(QWebEngineView):
     """
@@ -49,6 +157,19 @@ class MapView(QWebEngineView):
         # Gán kênh này cho trang web của chúng ta
         self.page().setWebChannel(self.channel)
         # --- KẾT THÚC PHẦN THÊM MỚI ---
+
+        # Ảnh lớp phủ được giữ trong bộ nhớ và phục vụ qua scheme riêng thay vì ghi ra file
+        self.overlays = overlay_store.default_store
+        profile = self.page().profile()
+        scheme = overlay_store.OVERLAY_SCHEME.encode('ascii')
+        handler = profile.urlSchemeHandler(scheme)
+        if handler is None:
+            # Profile dùng chung giữa các cửa sổ: chỉ cài handler một lần
+            handler = OverlaySchemeHandler(self.overlays, field_tiles.FieldTileService(), profile)
+            profile.installUrlSchemeHandler(scheme, handler)
+        self.overlay_handler = handler
+        # Dịch vụ tile trường (lớp phủ theo tile z/x/y, tính khi bản đồ yêu cầu)
+        self.field_tiles = handler.tiles
         self.load_map()
 
     def load_map(self):
@@ -71,6 +192,43 @@ class MapView(QWebEngineView):
         # có thể tải các tài nguyên cục bộ khác (js, css, tiles).
         self.load(QUrl.fromLocalFile(map_html_path))
 
+    def show_overlay_image(self, data, mime_type, bounds, keep_tiles=False, name='overlay'):
+        """
+        Lưu ảnh lớp phủ (bytes) vào kho và yêu cầu JS phủ ảnh lên vùng bounds.
+        Trả về khóa của ảnh trong kho.
+        """
+        key = self.overlays.put(data, mime_type, name)
+        self.run_js(
+            f"updateOverlayImage('{self.overlays.url(key)}', {bounds['lat_min']}, {bounds['lon_min']}, "
+            f"{bounds['lat_max']}, {bounds['lon_max']}, {'true' if keep_tiles else 'false'});"
+        )
+        return key
+
+    def show_field_grid(self, grid_data, bounds, levels=heatmap_renderer.DEFAULT_LEVELS,
+                        colors=heatmap_renderer.DEFAULT_COLORS):
+        """
+        Gửi lưới kết quả thô (lượng tử uint8, xem heatmap_renderer.quantize_field) sang trang một lần;
+        trang tự tô màu trên canvas theo levels/colors nên đổi ngưỡng bằng thanh trượt không cần gọi lại Python.
+        Dữ liệu đi kèm lệnh JS dạng base64: trang mở từ file:// nên đọc điểm ảnh từ URL khác nguồn sẽ bị chặn.
+        """
+        quantized = np.ascontiguousarray(np.flipud(heatmap_renderer.quantize_field(grid_data)))  # Hàng 0 là phía bắc
+        height, width = quantized.shape
+        data = base64.b64encode(quantized.tobytes()).decode('ascii')
+        self.run_js(
+            f"setFieldGrid('{data}', {width}, {height}, {heatmap_renderer.QUANT_LOG_MIN}, "
+            f"{heatmap_renderer.QUANT_LOG_MAX}, {json.dumps([float(level) for level in levels])}, "
+            f"{json.dumps([list(color) for color in colors])}, {bounds['lat_min']}, {bounds['lon_min']}, "
+            f"{bounds['lat_max']}, {bounds['lon_max']});"
+        )
+
+    def show_field_tiles(self, scene):
+        """Hiện lớp tile trường của cảnh có băm scene (xem FieldTileService.set_scene) thay cho ảnh lớp phủ."""
+        self.run_js(f"setFieldTileLayer('{overlay_store.OVERLAY_SCHEME}:tiles/{scene}/{{z}}/{{x}}/{{y}}.png');")
+
+    def show_contours(self, geojson):
+        """Vẽ đường bao các vùng ảnh hưởng (GeoJSON FeatureCollection, xem contours.field_contours)."""
+        self.run_js(f"updateContours({json.dumps(geojson)});")
+
     def run_js(self, script):
         """Thực thi một đoạn mã JavaScript trên trang web."""
         self.page().runJavaScript(script)
\ No newline at end of file
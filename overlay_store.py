@@ -0,0 +1,82 @@
+# emp_planning_system/overlay_store.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Scheme dùng để trang bản đồ tải ảnh lớp phủ từ bộ nhớ: empoverlay:<key>
+OVERLAY_SCHEME = "empoverlay"
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024   # bytes
+DEFAULT_MAX_ENTRIES = 256
+
+
+class OverlayStore:
+    """
+    Kho ảnh lớp phủ trong bộ nhớ, phục vụ cho trang web qua scheme OVERLAY_SCHEME
+    (xem map_view.OverlaySchemeHandler) thay cho file web/temp_overlay.png.
+    - Khóa có phiên bản: "<tên>-<số thứ tự>-<băm nội dung>.<đuôi>", mỗi ảnh mới có khóa mới
+      nên trình duyệt không cần mẹo chống cache và hai cửa sổ / hai luồng không ghi đè ảnh của nhau.
+    - Dọn theo LRU khi vượt memory_budget (bytes) hoặc max_entries ảnh; ảnh mới nhất luôn được giữ.
+    An toàn khi dùng từ nhiều luồng.
+    """
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, max_entries=DEFAULT_MAX_ENTRIES):
+        self.memory_budget = memory_budget
+        self.max_entries = max_entries
+        self._items = OrderedDict()   # key -> (data, mime_type)
+        self._bytes = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def put(self, data, mime_type='image/png', name='overlay'):
+        """Lưu ảnh (bytes) và trả về khóa của nó."""
+        extension = mime_type.split('/')[-1]
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        with self._lock:
+            self._version += 1
+            key = f"{name}-{self._version}-{digest}.{extension}"
+            self._items[key] = (bytes(data), mime_type)
+            self._bytes += len(data)
+            self._evict()
+        return key
+
+    def get(self, key):
+        """Trả về (data, mime_type) của ảnh, hoặc None nếu không có (chưa lưu hoặc đã bị dọn)."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def remove(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._bytes -= len(item[0])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def url(self, key):
+        """Đường dẫn để trang web tải ảnh có khóa key."""
+        return f"{OVERLAY_SCHEME}:{key}"
+
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _evict(self):
+        """Xóa ảnh ít được dùng nhất cho tới khi nằm trong giới hạn (gọi khi đã giữ khóa)."""
+        while len(self._items) > 1 and (self._bytes > self.memory_budget or len(self._items) > self.max_entries):
+            _, (data, _) = self._items.popitem(last=False)
+            self._bytes -= len(data)
+
+
+# Kho dùng chung cho mọi cửa sổ bản đồ trong tiến trình (scheme handler được cài một lần cho profile)
+default_store = OverlayStore()
@@ -0,0 +1,217 @@
+# emp_planning_system/parallel_engine.py
+
+import os
+import atexit
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import calculations
+import grid_geometry
+import spatial_index
+
+# Cấu hình mặc định của chế độ song song
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_EMPS_PER_TASK = 4   # Số EMP trong một tác vụ
+DEFAULT_BAND_ROWS = 64      # Số hàng lưới trong một dải (tile theo hàng)
+
+_config = {
+    'workers': DEFAULT_WORKERS,
+    'emps_per_task': DEFAULT_EMPS_PER_TASK,
+    'band_rows': DEFAULT_BAND_ROWS,
+}
+
+# Process pool dùng lại giữa các lần tính toán
+_pool = None
+_pool_workers = None
+
+
+def configure(workers=None, emps_per_task=None, band_rows=None):
+    """Thay đổi cấu hình mặc định: số tiến trình, số EMP mỗi tác vụ, số hàng mỗi dải."""
+    if workers is not None:
+        _config['workers'] = max(1, int(workers))
+    if emps_per_task is not None:
+        _config['emps_per_task'] = max(1, int(emps_per_task))
+    if band_rows is not None:
+        _config['band_rows'] = max(1, int(band_rows))
+
+
+def _get_pool(workers):
+    """Trả về process pool dùng chung, chỉ tạo lại khi số tiến trình thay đổi."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        # Dùng "spawn" để tiến trình con không kế thừa trạng thái luồng của Qt
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    """Đóng process pool (được gọi tự động khi thoát chương trình)."""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+    _pool_workers = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _share_array(array):
+    """Sao chép mảng vào một vùng shared memory mới, trả về (shm, mô tả để tiến trình con gắn vào)."""
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+# --- Phía tiến trình con ---
+
+# Cảnh (lưới + chỉ mục vật cản) đang được gắn trong tiến trình con, chỉ giữ cảnh gần nhất
+_worker_scene = {'key': None, 'grid': None, 'index': None, 'shms': []}
+
+
+def _attach_array(desc):
+    name, shape, dtype = desc
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _attach_scene(scene):
+    """Gắn vào shared memory của cảnh và dựng chỉ mục vật cản, một lần cho mỗi cảnh."""
+    if _worker_scene['key'] == scene['key']:
+        return _worker_scene['grid'], _worker_scene['index']
+
+    for shm in _worker_scene['shms']:
+        shm.close()
+    shm_xs, xs = _attach_array(scene['xs'])
+    shm_ys, ys = _attach_array(scene['ys'])
+    shm_boxes, boxes = _attach_array(scene['boxes'])
+
+    grid = grid_geometry.GridGeometry(**scene['grid'], xs=xs, ys=ys)
+    index = spatial_index.ObstacleGridIndex(boxes, min_top=scene['min_top'])
+    _worker_scene.update(key=scene['key'], grid=grid, index=index, shms=[shm_xs, shm_ys, shm_boxes])
+    return grid, index
+
+
+def _compute_task(scene, emps, band):
+    """
+    Tác vụ của tiến trình con: tính phần vùng ảnh hưởng của một nhóm EMP nằm trong một dải hàng.
+    emps là danh sách (số thứ tự, EMP); trả về danh sách (số thứ tự, window, block).
+    """
+    grid, index = _attach_scene(scene)
+    clip = (band[0], band[1], 0, grid.width)
+    pieces = []
+    for k, emp in emps:
+        footprint = calculations._emp_field_block(emp, grid, index, scene['user_altitude'], clip=clip)
+        if footprint is not None:
+            pieces.append((k, footprint[0], footprint[1]))
+    return pieces
+
+
+# --- Phía tiến trình chính ---
+
+def _iter_parallel_pieces(emps, obstacles, user_altitude, grid, workers, emps_per_task, band_rows, progress=None):
+    """
+    Chia việc cho process pool và lần lượt trả về các mảnh (số thứ tự EMP, window, block).
+    Tọa độ lưới và hình hộp vật cản được chia sẻ qua shared memory thay vì pickle theo từng tác vụ.
+    - progress: callback tùy chọn progress(done, total), gọi sau mỗi tác vụ; nếu nó ném lỗi
+      (ví dụ calculations.CalculationCanceled) thì các tác vụ chưa chạy bị hủy
+    """
+    workers = workers or _config['workers']
+    emps_per_task = emps_per_task or _config['emps_per_task']
+    band_rows = band_rows or _config['band_rows']
+
+    active = [(k, emp) for k, emp in enumerate(emps) if emp.power > 0]
+    if not active:
+        return
+
+    # Dải hàng mà mỗi nhóm EMP cần tính
+    tasks = []
+    for start in range(0, len(active), emps_per_task):
+        group = active[start:start + emps_per_task]
+        row_min, row_max = grid.height, 0
+        for _, emp in group:
+            j_min, j_max, i_min, i_max = calculations._emp_footprint_window(emp, grid)
+            if j_min < j_max and i_min < i_max:
+                row_min, row_max = min(row_min, j_min), max(row_max, j_max)
+        for band_start in range(row_min - row_min % band_rows, row_max, band_rows):
+            tasks.append((group, (band_start, min(band_start + band_rows, grid.height))))
+    if not tasks:
+        return
+
+    boxes = calculations._obstacle_boxes(obstacles, grid)
+    shms = []
+    try:
+        shm_xs, xs_desc = _share_array(grid.xs)
+        shms.append(shm_xs)
+        shm_ys, ys_desc = _share_array(grid.ys)
+        shms.append(shm_ys)
+        shm_boxes, boxes_desc = _share_array(boxes)
+        shms.append(shm_boxes)
+
+        scene = {
+            'key': shm_boxes.name,
+            'grid': {f.name: getattr(grid, f.name) for f in dataclasses.fields(grid) if f.name not in ('xs', 'ys')},
+            'xs': xs_desc,
+            'ys': ys_desc,
+            'boxes': boxes_desc,
+            'min_top': calculations._index_min_top(emps, user_altitude),
+            'user_altitude': user_altitude,
+        }
+        pool = _get_pool(workers)
+        futures = [pool.submit(_compute_task, scene, group, band) for group, band in tasks]
+        try:
+            for done, future in enumerate(futures):
+                yield from future.result()
+                if progress is not None:
+                    progress(done + 1, len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+def calculate_emp_field_parallel(emps, obstacles, user_altitude, bounds, grid_size=(200, 200),
+                                 workers=None, emps_per_task=None, band_rows=None):
+    """
+    Backend "parallel": chia danh sách EMP thành nhóm và lưới kết quả thành các dải hàng,
+    giao từng cặp (nhóm, dải) cho process pool rồi gộp các lưới con bằng phép max.
+    Mỗi ô được tính bằng đúng hàm của backend "vectorized" nên kết quả trùng khớp hoàn toàn.
+    """
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    result_grid = np.zeros((grid.height, grid.width))
+    for _, (j_min, j_max, i_min, i_max), block in _iter_parallel_pieces(
+            emps, obstacles, user_altitude, grid, workers, emps_per_task, band_rows):
+        window = result_grid[j_min:j_max, i_min:i_max]
+        np.maximum(window, block, out=window)
+    return result_grid
+
+
+def calculate_emp_footprints_parallel(emps, obstacles, user_altitude, bounds, grid_size=(200, 200),
+                                      workers=None, emps_per_task=None, band_rows=None, progress=None):
+    """
+    Tính song song vùng ảnh hưởng riêng của từng EMP.
+    Trả về danh sách cùng thứ tự với emps, mỗi phần tử là (window, block) hoặc None.
+    - progress: callback tùy chọn progress(done, total), xem _iter_parallel_pieces
+    """
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    footprints = [None] * len(emps)
+    for k, (j_min, j_max, i_min, i_max), block in _iter_parallel_pieces(
+            emps, obstacles, user_altitude, grid, workers, emps_per_task, band_rows, progress):
+        if footprints[k] is None:
+            # Các dải hàng chỉ cắt theo hàng nên cột của mọi mảnh trùng với vùng ảnh hưởng đầy đủ
+            full = calculations._emp_footprint_window(emps[k], grid)
+            footprints[k] = (full, np.zeros((full[1] - full[0], full[3] - full[2])))
+        (row0, _, col0, _), full_block = footprints[k]
+        full_block[j_min - row0:j_max - row0, i_min - col0:i_max - col0] = block
+    return footprints
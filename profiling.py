@@ -0,0 +1,59 @@
+# emp_planning_system/profiling.py
+
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class FieldStats:
+    """
+    Số liệu đo của một lần tính toán (chỉ thu thập khi được yêu cầu).
+    - phases: thời gian (giây) theo từng pha: setup, index, projection, culling, occlusion, field, merge, ...
+    - totals: các bộ đếm tổng: cells, rays, box_tests, early_outs, occluded, ...
+    - per_emp: uuid EMP -> bộ đếm riêng của EMP đó (kèm 'name'; tên do người dùng đặt nên có thể trùng)
+    """
+    def __init__(self, backend=""):
+        self.backend = backend
+        self.phases = {}
+        self.totals = {}
+        self.per_emp = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Cộng thời gian chạy của khối lệnh vào pha name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, key, n=1, emp=None):
+        """Cộng n vào bộ đếm key (tổng và, nếu có emp, của riêng EMP đó)."""
+        n = int(n)
+        self.totals[key] = self.totals.get(key, 0) + n
+        if emp is not None:
+            counters = self.per_emp.setdefault(emp.uuid, {'name': emp.name})
+            counters[key] = counters.get(key, 0) + n
+
+    @property
+    def total_time(self):
+        return self.phases.get('total', sum(self.phases.values()))
+
+    def summary(self):
+        """Tóm tắt một dòng để hiển thị trên thanh trạng thái."""
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in
+                           sorted(self.phases.items(), key=lambda item: -item[1]) if name != 'total')
+        t = self.totals
+        phases = f" ({phases})" if phases else ""
+        return (f"{self.backend}: {self.total_time * 1000:.0f} ms{phases} | "
+                f"{t.get('cells', 0)} ô, {t.get('rays', 0)} tia, {t.get('box_tests', 0)} phép thử hộp, "
+                f"{t.get('early_outs', 0)} dừng sớm, {t.get('occluded', 0)} ô bị che")
+
+    def to_dict(self):
+        """Bản ghi đầy đủ (để ghi log dạng JSON)."""
+        return {'backend': self.backend, 'phases': dict(self.phases),
+                'totals': dict(self.totals), 'per_emp': {k: dict(v) for k, v in self.per_emp.items()}}
+
+
+def phase(stats, name):
+    """stats.phase(name) nếu đang đo, nếu không thì một context rỗng."""
+    return stats.phase(name) if stats is not None else nullcontext()
@@ -0,0 +1,98 @@
+# emp_planning_system/progressive.py
+
+import numpy as np
+
+import calculations
+import grid_geometry
+import spatial_index
+
+# Các mức độ phân giải (height, width) của bản xem trước, từ thô đến mịn
+PREVIEW_SIZES = ((50, 50), (200, 200))
+
+# Trạng thái che khuất của một nút lưới theo từng EMP
+_UNKNOWN, _VISIBLE, _OCCLUDED = -1, 0, 1
+
+
+def _inherited_status(prev_status, prev_shape, window, shape):
+    """
+    Trạng thái che khuất của các nút trong window (lưới mới, kích thước shape) suy ra từ lưới trước:
+    một nút nhận trạng thái của lưới trước nếu mọi nút lưới trước bao quanh nó (tối đa 4 nút)
+    đều đã biết và cùng trạng thái; còn lại là _UNKNOWN.
+    """
+    j_min, j_max, i_min, i_max = window
+    prev_h, prev_w = prev_shape
+
+    def parents(indices, n, prev_n):
+        u = indices * ((prev_n - 1) / (n - 1)) if n > 1 else np.zeros(indices.shape)
+        lo = np.clip(np.floor(u).astype(int), 0, prev_n - 1)
+        hi = np.clip(np.ceil(u).astype(int), 0, prev_n - 1)
+        return lo, hi
+
+    j_lo, j_hi = parents(np.arange(j_min, j_max), shape[0], prev_h)
+    i_lo, i_hi = parents(np.arange(i_min, i_max), shape[1], prev_w)
+    corners = [prev_status[np.ix_(jj, ii)] for jj in (j_lo, j_hi) for ii in (i_lo, i_hi)]
+    status = corners[0].copy()
+    for corner in corners[1:]:
+        status[corner != status] = _UNKNOWN
+    return status
+
+
+def iter_progressive_fields(emps, obstacles, user_altitude, bounds, sizes=PREVIEW_SIZES, exact_final=False):
+    """
+    Tính lưới kết quả lần lượt ở các độ phân giải sizes (từ thô đến mịn) và trả về dần
+    (generator) từng cặp (grid_size, grid_data) để giao diện hiện bản xem trước ngay.
+    Từ mức thứ hai, một ô dùng lại kết quả che khuất của mức trước nếu các nút mức trước
+    bao quanh nó cùng bị che hoặc cùng không bị che (đối với từng EMP); chỉ các ô còn lại
+    mới phải kiểm tra tia, nên mỗi mức mịn rẻ hơn tính lại từ đầu. Cách dùng lại này là gần đúng
+    (vật cản nhỏ hơn một ô mức trước có thể bị bỏ sót); exact_final=True thì mức cuối được tính
+    đầy đủ, trùng với backend "vectorized".
+    """
+    prev_shape = None
+    prev_status = {}
+    for level, grid_size in enumerate(sizes):
+        grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+        shape = (grid.height, grid.width)
+        index = calculations._build_obstacle_index(obstacles, grid, emps, user_altitude)
+        reuse = prev_shape is not None and not (exact_final and level == len(sizes) - 1)
+        result_grid = np.zeros(shape)
+        status = {}
+
+        for k, emp in enumerate(emps):
+            if emp.power <= 0:
+                continue
+            j_min, j_max, i_min, i_max = calculations._emp_footprint_window(emp, grid)
+            if j_min >= j_max or i_min >= i_max:
+                continue
+            emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+            sub_xs = grid.xs[i_min:i_max]
+            sub_ys = grid.ys[j_min:j_max]
+            gx, gy = np.meshgrid(sub_xs, sub_ys)
+            dx = emp_x - gx
+            dy = emp_y - gy
+            block = calculations._emp_field_values(emp, dx * dx + dy * dy, user_altitude)
+
+            if reuse and k in prev_status:
+                emp_status = _inherited_status(prev_status[k], prev_shape, (j_min, j_max, i_min, i_max), shape)
+            else:
+                emp_status = np.full(block.shape, _UNKNOWN, dtype=np.int8)
+            need = emp_status == _UNKNOWN
+            emp_status[need] = _VISIBLE
+            if need.any():
+                px, py = gx[need], gy[need]
+                candidates = index.query_rect(
+                    min(emp_x, px.min()), min(emp_y, py.min()), max(emp_x, px.max()), max(emp_y, py.max()),
+                    z_lo=min(emp.height, user_altitude), z_hi=max(emp.height, user_altitude)
+                )
+                if candidates.size:
+                    sectors = spatial_index.RaySectors([emp_x, emp_y, emp.height], px, py, index.boxes[candidates])
+                    emp_status[need] = np.where(sectors.occluded(user_altitude), _OCCLUDED, _VISIBLE)
+            block[emp_status == _OCCLUDED] = 0
+
+            window = result_grid[j_min:j_max, i_min:i_max]
+            np.maximum(window, block, out=window)
+            full_status = np.full(shape, _UNKNOWN, dtype=np.int8)
+            full_status[j_min:j_max, i_min:i_max] = emp_status
+            status[k] = full_status
+
+        prev_shape, prev_status = shape, status
+        yield grid_size, result_grid
@@ -1,5 +1,6 @@
 # emp_planning_system/report_generator.py
 
+import io
 import os
 from datetime import datetime
 
@@ -11,6 +12,8 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 
+import contours
+
 # Hàm trợ giúp để đăng ký font tiếng Việt
 def _register_vietnamese_font():
     """Đăng ký cả font thường và đậm của DejaVuSans."""
@@ -36,7 +39,9 @@ def _register_vietnamese_font():
 def generate_report(filename, report_data):
     """
     Tạo file báo cáo PDF từ dữ liệu được cung cấp.
-    report_data là một dict chứa: emps, obstacles, image_path, altitude
+    report_data là một dict chứa: emps, obstacles, altitude, ảnh vùng ảnh hưởng:
+    image_data (bytes PNG, ưu tiên) hoặc image_path (đường dẫn file ảnh),
+    và (tùy chọn) contours: đường bao GeoJSON từ contours.field_contours để tính diện tích từng vùng
     """
     try:
         # Đăng ký font và tạo các style
@@ -108,10 +113,12 @@ def generate_report(filename, report_data):
         # 5. Hình ảnh minh họa
         story.append(Paragraph("Minh họa vùng ảnh hưởng", styles['Heading1_vi']))
         
+        image_data = report_data.get('image_data')
         image_path = report_data.get('image_path')
-        if image_path and os.path.exists(image_path):
+        image_source = io.BytesIO(image_data) if image_data else image_path
+        if image_data or (image_path and os.path.exists(image_path)):
             # Lấy kích thước ảnh và điều chỉnh để vừa với trang
-            img = Image(image_path)
+            img = Image(image_source)
             page_width, _ = letter
             img_width, img_height = img.imageWidth, img.imageHeight
             scale = (page_width - 1.5 * inch) / img_width
@@ -120,6 +127,28 @@ def generate_report(filename, report_data):
             story.append(img)
         else:
             story.append(Paragraph("<i>Không có hình ảnh vùng ảnh hưởng.</i>", styles['Normal_vi']))
+
+        # Diện tích các vùng, tính từ cùng đường bao đã vẽ trên bản đồ
+        field_contours = report_data.get('contours')
+        if field_contours:
+            story.append(Spacer(1, 0.2 * inch))
+            zone_table_data = [['Vùng', 'Cường độ (V/m)', 'Diện tích (m²)']]
+            for lower, upper, area in contours.zone_areas(field_contours):
+                name = "Nguy hiểm" if upper is None else "Cảnh báo"
+                levels = f"≥ {lower}" if upper is None else f"{lower} – {upper}"
+                zone_table_data.append([name, levels, f"{area:,.0f}"])
+            zone_table = Table(zone_table_data)
+            zone_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'DejaVuSans-Bold'),
+                ('FONTNAME', (0, 1), (-1, -1), vietnamese_font),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            story.append(zone_table)
             
         # 6. Kiến nghị (phần tĩnh)
         story.append(Spacer(1, 0.4 * inch))
@@ -0,0 +1,154 @@
+# emp_planning_system/result_cache.py
+
+import os
+import json
+import hashlib
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+# Thư mục mặc định của tầng cache trên đĩa
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".emp_planning", "field_cache")
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024   # bytes
+DEFAULT_DISK_BUDGET = 1024 * 1024 * 1024    # bytes
+
+
+def scene_key(emps, obstacles, user_altitude, bounds, grid_size, extra=None):
+    """
+    Khóa nội dung (SHA-256) của một lần tính toán: băm EMP, vật cản, độ cao xét,
+    vùng bản đồ và kích thước lưới. Không phụ thuộc thứ tự các đối tượng hay uuid của chúng.
+    - extra: thông tin bổ sung (ví dụ tên backend) nếu kết quả phụ thuộc vào nó
+    """
+    payload = {
+        'emps': sorted([emp.lat, emp.lon, emp.power, emp.height] for emp in emps),
+        'obstacles': sorted([obs.lat, obs.lon, obs.length, obs.width, obs.height] for obs in obstacles),
+        'altitude': float(user_altitude),
+        'bounds': sorted(bounds.items()),
+        'grid_size': list(grid_size),
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class FieldResultCache:
+    """
+    Cache kết quả lưới tính toán gồm hai tầng:
+    - bộ nhớ: LRU giới hạn theo tổng số byte
+    - đĩa: các file .npz nén, khi vượt dung lượng thì xóa file ít được dùng nhất
+    Đếm số lần trúng/trượt của từng tầng.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 disk_budget=DEFAULT_DISK_BUDGET):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Cảnh báo: Không tạo được thư mục cache {self.cache_dir}: {e}")
+                self.cache_dir = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Trả về lưới kết quả (chỉ đọc) ứng với khóa, hoặc None nếu chưa có."""
+        grid = self._memory.get(key)
+        if grid is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return grid
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with np.load(path) as data:
+                    grid = data['grid']
+                os.utime(path)  # Cập nhật thời điểm dùng gần nhất cho việc dọn đĩa
+            except FileNotFoundError:
+                grid = None
+            except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile) as e:
+                # File hỏng (ví dụ ghi dở): xóa đi để lần sau tính lại thay vì lỗi mãi ở cảnh này
+                print(f"Cảnh báo: Bỏ file cache hỏng {path}: {e}")
+                grid = None
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if grid is not None:
+                self.disk_hits += 1
+                self._remember(key, grid)
+                return self._memory[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, grid):
+        """Lưu lưới kết quả vào cả hai tầng cache."""
+        self._remember(key, grid)
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, grid=grid)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            print(f"Cảnh báo: Không ghi được cache ra đĩa: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, key, grid):
+        grid = np.array(grid, copy=True)
+        grid.setflags(write=False)
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.nbytes
+        self._memory[key] = grid
+        self._memory_bytes += grid.nbytes
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                path = os.path.join(self.cache_dir, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_budget:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Xóa toàn bộ cache (cả bộ nhớ lẫn đĩa)."""
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """Số lần trúng/trượt và dung lượng bộ nhớ đang dùng."""
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+        }
@@ -0,0 +1,117 @@
+# emp_planning_system/shadow_occlusion.py
+
+import numpy as np
+
+# Import dạng module để tránh vòng lặp import với calculations.py
+import calculations
+import grid_geometry
+
+# Số phần tử tối đa của mảng trung gian (số hộp x số hàng) trong một lượt
+MAX_PAIR_ELEMENTS = 1 << 21
+
+
+def _slab_interval(start, end, lo, hi):
+    """
+    Khoảng tham số t (trên đoạn start -> end, có thể là mảng) mà tọa độ nằm trong [lo, hi].
+    Dùng cùng quy ước với phép thử slab: hướng bằng 0 được thay bằng 1e-9.
+    """
+    direction = np.asarray(end - start, dtype=float)
+    direction = np.where(direction == 0, 1e-9, direction)
+    t_a = (lo - start) / direction
+    t_b = (hi - start) / direction
+    return np.minimum(t_a, t_b), np.maximum(t_a, t_b)
+
+
+def shadow_mask(emp_pos, xs, ys, boxes, z):
+    """
+    Mặt nạ bóng che (len(ys), len(xs)) của một EMP tại độ cao z.
+    Bóng của mỗi hộp là đa giác lồi bao hình chiếu của hộp và ảnh chiếu của nó theo hướng
+    ra xa EMP; đa giác được tô theo từng hàng (scanline) rồi gộp bằng mảng hiệu,
+    nên chi phí là O(số hộp x số hàng + số ô) thay vì O(số hộp x số ô).
+    - emp_pos: [x, y, z] của EMP
+    - xs, ys: tọa độ cột/hàng của lưới (tăng dần)
+    - boxes: mảng (M, 2, 3) các hộp AABB
+    """
+    ex, ey, ez = (float(v) for v in emp_pos)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 2, 3)
+    n_rows, n_cols = len(ys), len(xs)
+    diff = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+    if len(boxes) == 0 or n_rows == 0 or n_cols == 0:
+        return np.zeros((n_rows, n_cols), dtype=bool)
+
+    # Khoảng t theo phương đứng chỉ phụ thuộc vào hộp, không phụ thuộc điểm thu
+    tz0, tz1 = _slab_interval(ez, float(z), boxes[:, 0, 2], boxes[:, 1, 2])
+
+    chunk = max(1, MAX_PAIR_ELEMENTS // n_rows)
+    for start in range(0, len(boxes), chunk):
+        b = boxes[start:start + chunk]
+        # Khoảng t mà đoạn EMP -> (x, ys[r], z) nằm trong hộp theo phương y và z,
+        # giống nhau cho mọi điểm trên cùng một hàng: shape (m, n_rows)
+        ty0, ty1 = _slab_interval(ey, ys[None, :], b[:, 0, 1, None], b[:, 1, 1, None])
+        t_a = np.maximum(np.maximum(ty0, tz0[start:start + chunk, None]), 0.0)
+        t_b = np.minimum(np.minimum(ty1, tz1[start:start + chunk, None]), 1.0)
+        hit = t_a < t_b
+        if not hit.any():
+            continue
+        box_k, row_k = np.nonzero(hit)
+        t_a, t_b = t_a[hit], t_b[hit]
+
+        # Điểm thu có x = ex + (x_hộp - ex) * s với s = 1/t, t trong (t_a, t_b)
+        a = b[box_k, 0, 0] - ex
+        c = b[box_k, 1, 0] - ex
+        s_min = 1.0 / t_b
+        with np.errstate(divide='ignore'):
+            s_max = np.where(t_a > 0, 1.0 / np.maximum(t_a, 1e-300), np.inf)
+        x_lo = ex + np.where(a < 0, a * s_max, a * s_min)
+        x_hi = ex + np.where(c > 0, c * s_max, c * s_min)
+
+        col_start = np.searchsorted(xs, x_lo, side='right')
+        col_end = np.searchsorted(xs, x_hi, side='left')
+        valid = col_start < col_end
+        np.add.at(diff, (row_k[valid], col_start[valid]), 1)
+        np.add.at(diff, (row_k[valid], col_end[valid]), -1)
+
+    return np.cumsum(diff[:, :n_cols], axis=1) > 0
+
+
+def validate_shadow_occlusion(emps, obstacles, user_altitude, bounds, grid_size=(200, 200)):
+    """
+    Chế độ kiểm tra: so sánh từng ô mặt nạ bóng che với phép thử slab
+    (check_segments_boxes_intersection) trên vùng ảnh hưởng của mỗi EMP.
+    Trả về dict gồm tổng số ô đã so sánh, số ô lệch và danh sách chi tiết theo từng EMP.
+    """
+    grid = grid_geometry.get_grid_geometry(bounds, grid_size)
+    index = calculations._build_obstacle_index(obstacles, grid, emps, user_altitude)
+    report = {'cells': 0, 'mismatches': 0, 'emps': []}
+
+    for emp in emps:
+        if emp.power <= 0:
+            continue
+        j_min, j_max, i_min, i_max = calculations._emp_footprint_window(emp, grid)
+        if j_min >= j_max or i_min >= i_max:
+            continue
+        emp_x, emp_y = grid.lonlat_to_xy(emp.lon, emp.lat)
+        emp_pos = np.array([emp_x, emp_y, emp.height])
+        sub_xs = grid.xs[i_min:i_max]
+        sub_ys = grid.ys[j_min:j_max]
+        candidates = index.query_rect(
+            min(emp_x, sub_xs.min()), min(emp_y, sub_ys.min()),
+            max(emp_x, sub_xs.max()), max(emp_y, sub_ys.max()),
+            z_lo=min(emp.height, user_altitude), z_hi=max(emp.height, user_altitude)
+        )
+        boxes = index.boxes[candidates]
+
+        shadow = shadow_mask(emp_pos, sub_xs, sub_ys, boxes, user_altitude)
+        gx, gy = np.meshgrid(sub_xs, sub_ys)
+        points = np.column_stack([gx.ravel(), gy.ravel(), np.full(gx.size, float(user_altitude))])
+        slab = calculations.check_segments_boxes_intersection(emp_pos, points, boxes).reshape(shadow.shape)
+
+        mismatches = int(np.count_nonzero(shadow != slab))
+        report['cells'] += shadow.size
+        report['mismatches'] += mismatches
+        report['emps'].append({'name': emp.name, 'cells': shadow.size, 'mismatches': mismatches,
+                               'shadow_only': int(np.count_nonzero(shadow & ~slab)),
+                               'slab_only': int(np.count_nonzero(slab & ~shadow))})
+    return report
@@ -0,0 +1,136 @@
+# emp_planning_system/sparse_field.py
+
+import numpy as np
+
+# Cạnh (số ô) của một khối lưu trữ
+DEFAULT_BLOCK_SIZE = 64
+
+
+class SparseField:
+    """
+    Lưới kết quả dạng thưa theo khối: lưới (height, width) được chia thành các khối vuông
+    block_size x block_size, chỉ những khối có giá trị khác 0 mới được cấp phát.
+    Khi vùng bản đồ rất rộng mà mỗi EMP chỉ ảnh hưởng vài trăm mét, bộ nhớ tỉ lệ với
+    tổng diện tích vùng ảnh hưởng chứ không với diện tích cả lưới.
+    - blocks: (khối hàng, khối cột) -> mảng (block_size, block_size)
+    """
+    def __init__(self, shape, block_size=DEFAULT_BLOCK_SIZE, dtype=float):
+        self.shape = tuple(int(n) for n in shape)
+        self.block_size = int(block_size)
+        self.dtype = np.dtype(dtype)
+        self.blocks = {}
+
+    @classmethod
+    def from_dense(cls, grid_data, block_size=DEFAULT_BLOCK_SIZE):
+        """Chuyển lưới dày sang dạng thưa (bỏ các khối toàn 0)."""
+        grid_data = np.asarray(grid_data)
+        field = cls(grid_data.shape, block_size, grid_data.dtype)
+        field.merge_block(0, 0, grid_data)
+        return field
+
+    @property
+    def nbytes(self):
+        """Bộ nhớ của các khối đã cấp phát (byte)."""
+        return sum(tile.nbytes for tile in self.blocks.values())
+
+    @property
+    def dense_nbytes(self):
+        """Bộ nhớ mà lưới dày tương ứng sẽ cần (byte)."""
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def _tiles_in(self, j_min, j_max, i_min, i_max):
+        """Các khối (bj, bi) giao với vùng [j_min, j_max) x [i_min, i_max)."""
+        bs = self.block_size
+        for bj in range(j_min // bs, (j_max - 1) // bs + 1):
+            for bi in range(i_min // bs, (i_max - 1) // bs + 1):
+                yield bj, bi
+
+    def merge_block(self, j_min, i_min, block):
+        """Gộp (lấy max) một khối dày đặt tại góc (j_min, i_min) vào lưới; phần ngoài lưới bị bỏ qua."""
+        block = np.asarray(block)
+        j_max = min(j_min + block.shape[0], self.shape[0])
+        i_max = min(i_min + block.shape[1], self.shape[1])
+        if j_min >= j_max or i_min >= i_max:
+            return
+        bs = self.block_size
+        for bj, bi in self._tiles_in(j_min, j_max, i_min, i_max):
+            r0, r1 = max(j_min, bj * bs), min(j_max, (bj + 1) * bs)
+            c0, c1 = max(i_min, bi * bs), min(i_max, (bi + 1) * bs)
+            part = block[r0 - j_min:r1 - j_min, c0 - i_min:c1 - i_min]
+            tile = self.blocks.get((bj, bi))
+            if tile is None:
+                if not part.any():
+                    continue
+                tile = self.blocks[(bj, bi)] = np.zeros((bs, bs), dtype=self.dtype)
+            sub = tile[r0 - bj * bs:r1 - bj * bs, c0 - bi * bs:c1 - bi * bs]
+            np.maximum(sub, part, out=sub)
+
+    def merge(self, other):
+        """Gộp (lấy max) một SparseField khác cùng kích thước và cùng block_size vào lưới này."""
+        if other.shape != self.shape or other.block_size != self.block_size:
+            raise ValueError("Chỉ gộp được hai SparseField cùng kích thước lưới và cùng kích thước khối.")
+        for key, other_tile in other.blocks.items():
+            tile = self.blocks.get(key)
+            if tile is None:
+                self.blocks[key] = other_tile.astype(self.dtype, copy=True)
+            else:
+                np.maximum(tile, other_tile, out=tile)
+        return self
+
+    def lookup(self, jj, ii):
+        """Giá trị tại các nút lưới (jj[n], ii[n]); nút nằm trong khối chưa cấp phát có giá trị 0."""
+        jj = np.asarray(jj, dtype=int)
+        ii = np.asarray(ii, dtype=int)
+        jj, ii = np.broadcast_arrays(jj, ii)
+        values = np.zeros(jj.shape, dtype=self.dtype)
+        if not self.blocks or jj.size == 0:
+            return values
+        bs = self.block_size
+        n_block_cols = -(-self.shape[1] // bs)
+        keys = (jj // bs) * n_block_cols + ii // bs
+        # Chỉ duyệt các khối có điểm cần tra
+        for key in np.unique(keys):
+            bj, bi = divmod(int(key), n_block_cols)
+            tile = self.blocks.get((bj, bi))
+            if tile is not None:
+                mask = keys == key
+                values[mask] = tile[jj[mask] - bj * bs, ii[mask] - bi * bs]
+        return values
+
+    def value(self, j, i):
+        """Giá trị tại nút lưới (j, i)."""
+        tile = self.blocks.get((j // self.block_size, i // self.block_size))
+        if tile is None:
+            return self.dtype.type(0)
+        return tile[j % self.block_size, i % self.block_size]
+
+    def to_dense(self, window=None, step=1):
+        """
+        Dựng lưới dày (để vẽ) cho cả lưới hoặc một phần của nó.
+        - window: (j_min, j_max, i_min, i_max) tùy chọn
+        - step: chỉ lấy mỗi step hàng/cột (giảm độ phân giải khi vẽ vùng rất rộng)
+        """
+        j_min, j_max, i_min, i_max = window if window is not None else (0, self.shape[0], 0, self.shape[1])
+        j_min, j_max = max(j_min, 0), min(j_max, self.shape[0])
+        i_min, i_max = max(i_min, 0), min(i_max, self.shape[1])
+        rows = np.arange(j_min, j_max, step)
+        cols = np.arange(i_min, i_max, step)
+        dense = np.zeros((rows.size, cols.size), dtype=self.dtype)
+        if rows.size == 0 or cols.size == 0:
+            return dense
+
+        bs = self.block_size
+        for bj, bi in self._tiles_in(j_min, j_max, i_min, i_max):
+            tile = self.blocks.get((bj, bi))
+            if tile is None:
+                continue
+            # Các hàng/cột của dense rơi vào khối này
+            r0, r1 = np.searchsorted(rows, [bj * bs, (bj + 1) * bs])
+            c0, c1 = np.searchsorted(cols, [bi * bs, (bi + 1) * bs])
+            if r0 < r1 and c0 < c1:
+                dense[r0:r1, c0:c1] = tile[np.ix_(rows[r0:r1] - bj * bs, cols[c0:c1] - bi * bs)]
+        return dense
+
+    def max(self):
+        """Giá trị lớn nhất của lưới."""
+        return max((tile.max() for tile in self.blocks.values()), default=self.dtype.type(0))
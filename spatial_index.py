@@ -0,0 +1,198 @@
+# emp_planning_system/spatial_index.py
+
+import math
+import numpy as np
+
+# Import dạng module để tránh vòng lặp import với calculations.py
+import calculations
+
+# Giới hạn số ô (bucket) của lưới chỉ mục để bảng chỉ số không quá lớn
+MAX_BUCKETS = 1 << 20
+# Số cung góc chia quanh mỗi EMP khi phân nhóm tia
+N_SECTORS = 256
+# Biên an toàn (radian) khi gán hộp vào cung góc, bù sai số làm tròn của arctan2
+_ANGLE_EPS = 1e-7
+# Dung sai (mét) khi xét EMP có nằm trong hình chiếu của hộp hay không
+_CONTAIN_EPS = 1e-6
+
+
+class ObstacleGridIndex:
+    """
+    Chỉ mục lưới đều (uniform grid) trên hình chiếu 2D của các hộp vật cản.
+    Được dựng một lần cho mỗi lần tính toán, sau đó mỗi EMP chỉ lấy ra
+    các hộp nằm trong vùng ảnh hưởng của nó.
+    - boxes: mảng (M, 2, 3) các hộp AABB
+    - min_top: bỏ qua ngay từ đầu các hộp có đỉnh không cao hơn giá trị này
+      (chúng không thể che bất kỳ tia nào)
+    - bucket_size: kích thước ô chỉ mục (mét), None để tự chọn
+    """
+    def __init__(self, boxes, min_top=None, bucket_size=None):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 2, 3)
+        ids = np.arange(len(boxes))
+        if min_top is not None:
+            keep = boxes[:, 1, 2] > min_top
+            boxes, ids = boxes[keep], ids[keep]
+
+        # boxes: các hộp còn lại sau khi lọc; ids: chỉ số tương ứng trong mảng gốc
+        self.boxes = boxes
+        self.ids = ids
+        if len(boxes) == 0:
+            self._buckets = None
+            return
+
+        self.origin = boxes[:, 0, :2].min(axis=0)
+        extent = np.maximum(boxes[:, 1, :2].max(axis=0) - self.origin, 1e-6)
+
+        if bucket_size is None:
+            # Khoảng vài hộp mỗi ô, nhưng ô không nhỏ hơn kích thước hộp điển hình
+            footprint = np.median(np.max(boxes[:, 1, :2] - boxes[:, 0, :2], axis=1))
+            bucket_size = max(math.sqrt(extent[0] * extent[1] / len(boxes)), footprint, 1e-3)
+        while (extent[0] / bucket_size + 1) * (extent[1] / bucket_size + 1) > MAX_BUCKETS:
+            bucket_size *= 2
+        self.bucket_size = bucket_size
+        self.n_x = int(extent[0] // bucket_size) + 1
+        self.n_y = int(extent[1] // bucket_size) + 1
+
+        # Gán mỗi hộp vào mọi ô chỉ mục mà hình chiếu của nó chạm tới
+        cx0, cy0 = self._cell_coords(boxes[:, 0, 0], boxes[:, 0, 1])
+        cx1, cy1 = self._cell_coords(boxes[:, 1, 0], boxes[:, 1, 1])
+        span_x = cx1 - cx0 + 1
+        counts = span_x * (cy1 - cy0 + 1)
+        box_of_pair = np.repeat(np.arange(len(boxes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cx0[box_of_pair] + local % span_x[box_of_pair]
+        cell_y = cy0[box_of_pair] + local // span_x[box_of_pair]
+        bucket = cell_y * self.n_x + cell_x
+
+        order = np.argsort(bucket, kind='stable')
+        self._buckets = box_of_pair[order]
+        self._bucket_start = np.searchsorted(bucket[order], np.arange(self.n_x * self.n_y + 1))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cell_coords(self, x, y):
+        cx = np.clip(np.floor((np.asarray(x) - self.origin[0]) / self.bucket_size), 0, self.n_x - 1).astype(int)
+        cy = np.clip(np.floor((np.asarray(y) - self.origin[1]) / self.bucket_size), 0, self.n_y - 1).astype(int)
+        return cx, cy
+
+    def query_rect(self, x_min, y_min, x_max, y_max, z_lo=None, z_hi=None):
+        """
+        Trả về chỉ số (trong self.boxes) của các hộp có hình chiếu giao với
+        hình chữ nhật [x_min, x_max] x [y_min, y_max].
+        Nếu có z_lo/z_hi thì chỉ giữ các hộp có đỉnh cao hơn z_lo và đáy thấp hơn z_hi:
+        một đoạn thẳng nằm hoàn toàn trên đỉnh hoặc dưới đáy hộp không thể cắt hộp.
+        """
+        if self._buckets is None:
+            return np.empty(0, dtype=int)
+        if (x_max < self.origin[0] or y_max < self.origin[1]
+                or x_min > self.origin[0] + self.n_x * self.bucket_size
+                or y_min > self.origin[1] + self.n_y * self.bucket_size):
+            return np.empty(0, dtype=int)
+
+        cx0, cy0 = self._cell_coords(x_min, y_min)
+        cx1, cy1 = self._cell_coords(x_max, y_max)
+        parts = []
+        for cy in range(int(cy0), int(cy1) + 1):
+            start = self._bucket_start[cy * self.n_x + cx0]
+            end = self._bucket_start[cy * self.n_x + cx1 + 1]
+            parts.append(self._buckets[start:end])
+        candidates = np.unique(np.concatenate(parts))
+
+        b = self.boxes[candidates]
+        keep = ((b[:, 0, 0] <= x_max) & (b[:, 1, 0] >= x_min)
+                & (b[:, 0, 1] <= y_max) & (b[:, 1, 1] >= y_min))
+        if z_lo is not None:
+            keep &= b[:, 1, 2] > z_lo
+        if z_hi is not None:
+            keep &= b[:, 0, 2] < z_hi
+        return candidates[keep]
+
+
+class RaySectors:
+    """
+    Phân nhóm các tia xuất phát từ một EMP theo cung góc trong mặt phẳng XY.
+    Mỗi hộp chỉ được gán vào các cung mà hình chiếu của nó che phủ, nên một tia
+    chỉ phải kiểm tra với các hộp nằm trên hướng đi của nó.
+    Phần phân nhóm không phụ thuộc độ cao điểm thu và có thể dùng lại cho nhiều độ cao.
+    - emp_pos: [x, y, z] của EMP
+    - px, py: tọa độ XY (N,) của các điểm thu
+    - boxes: mảng (M, 2, 3) các hộp ứng viên
+    """
+    def __init__(self, emp_pos, px, py, boxes, n_sectors=N_SECTORS):
+        self.emp_pos = np.asarray(emp_pos, dtype=float)
+        self.px = np.asarray(px, dtype=float).ravel()
+        self.py = np.asarray(py, dtype=float).ravel()
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 2, 3)
+        self.n_sectors = n_sectors
+        ex, ey = self.emp_pos[0], self.emp_pos[1]
+
+        # Cung góc của từng điểm thu
+        point_sector = self._sector_of(np.arctan2(self.py - ey, self.px - ex))
+        self._point_order = np.argsort(point_sector, kind='stable')
+        self._point_start = np.searchsorted(point_sector[self._point_order], np.arange(n_sectors + 1))
+
+        if len(self.boxes) == 0:
+            self._box_order = np.empty(0, dtype=int)
+            self._box_start = np.zeros(n_sectors + 1, dtype=int)
+            return
+
+        # Khoảng góc mà mỗi hộp che, tính từ 4 góc của hình chiếu
+        lo, hi = self.boxes[:, 0, :2], self.boxes[:, 1, :2]
+        corner_x = np.stack([lo[:, 0], hi[:, 0], lo[:, 0], hi[:, 0]], axis=1) - ex
+        corner_y = np.stack([lo[:, 1], lo[:, 1], hi[:, 1], hi[:, 1]], axis=1) - ey
+        center_angle = np.arctan2(corner_y.mean(axis=1), corner_x.mean(axis=1))
+        rel = np.arctan2(corner_y, corner_x) - center_angle[:, None]
+        rel = (rel + np.pi) % (2 * np.pi) - np.pi
+        first = self._sector_of(center_angle + rel.min(axis=1) - _ANGLE_EPS, wrap=False)
+        last = self._sector_of(center_angle + rel.max(axis=1) + _ANGLE_EPS, wrap=False)
+
+        # Hộp chứa EMP (theo hình chiếu) có thể che mọi hướng
+        contains_emp = ((lo[:, 0] - _CONTAIN_EPS <= ex) & (ex <= hi[:, 0] + _CONTAIN_EPS)
+                        & (lo[:, 1] - _CONTAIN_EPS <= ey) & (ey <= hi[:, 1] + _CONTAIN_EPS))
+        counts = np.where(contains_emp, n_sectors, np.minimum(last - first + 1, n_sectors))
+        first = np.where(contains_emp, 0, first)
+
+        box_of_pair = np.repeat(np.arange(len(self.boxes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sector = (first[box_of_pair] + local) % n_sectors
+        order = np.argsort(sector, kind='stable')
+        self._box_order = box_of_pair[order]
+        self._box_start = np.searchsorted(sector[order], np.arange(n_sectors + 1))
+
+    def _sector_of(self, angle, wrap=True):
+        sector = np.floor((angle + np.pi) / (2 * np.pi) * self.n_sectors).astype(int)
+        if wrap:
+            return np.clip(sector, 0, self.n_sectors - 1)
+        return sector
+
+    def occluded(self, z, stats=None, emp=None):
+        """
+        Trả về mảng bool (N,) cho biết tia từ EMP tới từng điểm thu ở độ cao z có bị che không.
+        - stats, emp: FieldStats tùy chọn để đếm số tia, phép thử hộp và số tia dừng sớm
+        """
+        n_points = len(self.px)
+        occluded = np.zeros(n_points, dtype=bool)
+        if n_points == 0 or len(self.boxes) == 0:
+            return occluded
+
+        # Loại các hộp thấp hơn cả EMP và điểm thu (hoặc nằm hẳn phía trên cả hai)
+        ez = self.emp_pos[2]
+        usable = (self.boxes[:, 1, 2] > min(ez, z)) & (self.boxes[:, 0, 2] < max(ez, z))
+        if not usable.any():
+            return occluded
+
+        for s in range(self.n_sectors):
+            point_idx = self._point_order[self._point_start[s]:self._point_start[s + 1]]
+            if point_idx.size == 0:
+                continue
+            box_idx = self._box_order[self._box_start[s]:self._box_start[s + 1]]
+            box_idx = box_idx[usable[box_idx]]
+            if box_idx.size == 0:
+                continue
+            points = np.column_stack([self.px[point_idx], self.py[point_idx], np.full(point_idx.size, float(z))])
+            if stats is not None:
+                stats.count('rays', point_idx.size, emp)
+            occluded[point_idx] = calculations.check_segments_boxes_intersection(
+                self.emp_pos, points, self.boxes[box_idx], stats=stats, emp=emp)
+        return occluded